@@ -1,18 +1,44 @@
-import os, io
+import io
+import os
 import streamlit as st
 from dotenv import load_dotenv
-from PIL import Image
 
-from providers.openai_provider import generate_image_openai, edit_image_openai
-from providers.replicate_provider import generate_image, get_available_models, edit_image_replicate
-from services.upscale import upscale_lanczos, upscale_replicate, get_upscale_models
-from utils.ppi import ppi_from_image_bytes, min_effective_ppi_in_pdf
+from providers.clients import warm_up
+from providers.replicate_provider import get_available_models
+from services.upscale import get_upscale_models
+from services.cache import cache_key, get_result_cache
+from services.jobs import get_job_queue, FINISHED, SUCCEEDED, FAILED, CANCELLED
+from services.pdf_render import PAGE_DPI, THUMB_DPI, browse_keys, document_id, get_render_cache
+from services.preflight import DEFAULT_TARGETS, write_report
+from services.scheduler import get_scheduler
+from services.variants import MAX_VARIANTS
+from utils.image_probe import probe_image
+from utils.metrics import recent_traces, start_metrics_server
+from utils.ppi import ppi_from_image_bytes
 
 load_dotenv()
 
 st.set_page_config(page_title="PoC IA Preimpresión", page_icon="🖨️", layout="wide")
 st.title("🖨️ PoC IA para Preimpresión (B2C)")
 
+@st.cache_resource
+def _warm_provider_clients():
+    # Once per server process: build the shared provider clients in the
+    # background after the first render, so the first generation does not
+    # pay for importing the Replicate SDK and no page load waits for it.
+    if os.getenv("PROVIDER_WARMUP", "1") == "0":
+        return None
+    return warm_up(["http", "replicate"] if os.getenv("REPLICATE_API_TOKEN") else ["http"], delay=1.0)
+
+_warm_provider_clients()
+
+@st.cache_resource
+def _metrics_server():
+    # /metrics (Prometheus) and /traces on METRICS_HOST:METRICS_PORT, once per process
+    return start_metrics_server()
+
+_metrics_server()
+
 # Debug: Check if environment variables are loaded
 if st.sidebar.button("🔍 Check API Keys Status"):
     openai_key = os.getenv("OPENAI_API_KEY")
@@ -34,6 +60,292 @@ with st.sidebar:
     up_mode = st.selectbox("Método", ["Lanczos (local)", "Replicate AI"], index=0)
     st.markdown("---")
     st.info("Configura tus claves en variables de entorno: OPENAI_API_KEY, REPLICATE_API_TOKEN")
+    st.markdown("---")
+    refresh_cache = st.checkbox("Ignorar caché (forzar nueva llamada)", value=False)
+    with st.expander("📦 Caché de resultados"):
+        st.json(get_result_cache().snapshot())
+
+    with st.expander("🖼️ Caché de renders PDF"):
+        st.json(get_render_cache().snapshot())
+    with st.expander("⚙️ Cola de trabajos"):
+        st.json(get_job_queue().metrics())
+    with st.expander("🚦 Límites de proveedores"):
+        st.json(get_scheduler().snapshot())
+    profile_jobs = st.checkbox("Perfilar trabajos (cProfile + tracemalloc)", value=False,
+                               help="Los trabajos enviados se perfilan; el resultado aparece en las trazas")
+    with st.expander("⏱️ Trazas recientes"):
+        for trace in recent_traces(10):
+            st.json({k: v for k, v in trace.items() if k not in ("profile", "top_allocations")}, expanded=False)
+            if "profile" in trace:
+                st.code(trace["profile"] + "\n".join(trace["top_allocations"]), language=None)
+
+# Job kinds that do not go through the result cache, so take no "refresh" flag
+UNCACHED_KINDS = ("pdf_ppi", "preflight_batch", "generate_variants", "sharpness", "sharpness_pdf_page")
+# Job kinds whose result should differ on every submission
+NEW_EACH_TIME = ("generate_variants",)
+
+def _job_key(kind, params):
+    # identical submissions (reruns, double clicks) attach to the job in flight
+    blob = next((v for v in params.values() if isinstance(v, bytes)), None)
+    return cache_key("job", kind, {k: v for k, v in params.items() if not isinstance(v, bytes)}, blob)
+
+def submit_jobs(slot, specs):
+    """Queue ``(label, kind, params)`` jobs and remember their ids under ``slot``."""
+    q = get_job_queue()
+    entries = []
+    for label, kind, params in specs:
+        params = {**params, "refresh": refresh_cache} if kind not in UNCACHED_KINDS else params
+        if profile_jobs:
+            params = {**params, "profile": True}
+        # a new variant batch on every click: dedupe would hand back the previous batch, or its expired store keys
+        dedupe = not refresh_cache and kind not in NEW_EACH_TIME
+        entries.append((label, q.submit(kind, params, dedupe_key=_job_key(kind, params) if dedupe else None)))
+    st.session_state[slot] = entries
+
+@st.fragment(run_every=1.0)
+def _poll_jobs(slot, n_pending, partial=None):
+    q = get_job_queue()
+    running = [(label, q.get(job_id)) for label, job_id in st.session_state.get(slot, [])]
+    running = [(label, job) for label, job in running if job and job.status not in FINISHED]
+    if len(running) != n_pending:
+        st.rerun()  # something finished: render it outside the fragment
+    for label, job in running:
+        st.progress(job.progress, text=f"{label}: {job.message or job.status}…")
+        data = q.partial(job.id) if partial is not None else None
+        if data is not None:
+            partial(data, label)
+    if st.button("Cancelar", key=f"cancel_{slot}"):
+        for _, job in running:
+            q.cancel(job.id)
+        st.rerun()
+
+def show_jobs(slot, render, partial=None):
+    """
+    Render finished jobs under ``slot`` with ``render(result, label, job_id)`` and poll the rest,
+    showing what running jobs reported so far with ``partial(data, label)`` if given.
+    """
+    entries = st.session_state.get(slot) or []
+    if not entries:
+        return
+    q = get_job_queue()
+    jobs = [(label, q.get(job_id)) for label, job_id in entries]
+    cols = st.columns(len(jobs)) if len(jobs) > 1 else [st.container()]
+    for col, (label, job) in zip(cols, jobs):
+        with col:
+            if job is None:
+                st.warning(f"{label}: trabajo no encontrado o caducado; vuelve a lanzarlo")
+            elif job.status == SUCCEEDED:
+                render(q.result(job.id), label, job.id)
+            elif job.status == FAILED:
+                st.error(f"{label}: {job.error}")
+            elif job.status == CANCELLED:
+                st.info(f"{label}: cancelado")
+    pending = [job for _, job in jobs if job and job.status not in FINISHED]
+    if pending:
+        _poll_jobs(slot, len(pending), partial)
+
+def _image_result(file_name, sharpness=False):
+    def render(img_bytes, label, job_id):
+        st.image(img_bytes, caption=label, use_column_width=True)
+        st.download_button("Descargar PNG", data=img_bytes, file_name=file_name, mime="image/png", key=f"dl_{job_id}")
+        if sharpness:
+            slot = f"job_sharpness_{job_id}"
+            if slot not in st.session_state:
+                submit_jobs(slot, [_sharpness_spec(img_bytes, 300.0)])
+            _sharpness_panel(slot)
+        _export_panel(img_bytes, file_name.rsplit(".", 1)[0], job_id)
+    return render
+
+def _export_panel(img_bytes, stem, job_id):
+    """CMYK conversion of a result to a print-ready TIFF, JPEG or PDF."""
+    from services.print_export import CMYK_ICC_PROFILE, EXPORT_FORMATS
+
+    slot = f"job_export_{job_id}"
+    with st.expander("🖨️ Exportar para imprenta (CMYK)", expanded=bool(st.session_state.get(slot))):
+        c1, c2 = st.columns(2)
+        fmt = c1.selectbox("Formato", list(EXPORT_FORMATS), key=f"exp_fmt_{job_id}")
+        dpi = c2.number_input("Resolución (ppp)", min_value=72, max_value=2400, value=300, step=50, key=f"exp_dpi_{job_id}")
+        if CMYK_ICC_PROFILE:
+            st.caption(f"Perfil de salida: {os.path.basename(CMYK_ICC_PROFILE)}")
+        else:
+            st.caption("⚠️ CMYK_ICC_PROFILE no configurado: conversión CMYK sin perfil ICC (no calibrada)")
+        if st.button("Convertir a CMYK", key=f"exp_btn_{job_id}"):
+            submit_jobs(slot, [(f"CMYK {fmt}", "export_print", {"image_bytes": img_bytes, "format": fmt, "dpi": float(dpi)})])
+
+        def render(data, label, export_id):
+            out_fmt = label.split()[-1]
+            ext = {"TIFF": "tif", "JPEG": "jpg", "PDF": "pdf"}[out_fmt]
+            st.download_button(f"Descargar {out_fmt} CMYK ({len(data) / 2**20:.1f} MB)", data=data,
+                               file_name=f"{stem}_cmyk.{ext}", mime=EXPORT_FORMATS[out_fmt], key=f"dl_{export_id}")
+        show_jobs(slot, render)
+
+def _sharpness_spec(img_bytes, ppi, min_ppi=300.0):
+    return ("Nitidez", "sharpness", {"image_bytes": img_bytes, "ppi": float(ppi), "min_ppi": min_ppi})
+
+def _sharpness_panel(slot, min_ppi=300.0):
+    """Effective resolution and detail heatmap measured by the ``sharpness`` job under ``slot``."""
+
+    def render(data, label, job_id):
+        summary = data["summary"]
+        with st.expander(f"🔬 Resolución efectiva: {summary['effective_ppi']:.0f} ppp "
+                         f"(nominal {summary['nominal_ppi']:.0f}, detalle ÷{summary['effective_scale']})"):
+            st.image(data["heatmap"], caption=f"Verde: detalle suficiente para {min_ppi:.0f} ppp · rojo: la mitad o menos",
+                     use_column_width=True)
+            st.json(summary)
+    show_jobs(slot, render)
+
+# Thumbnails per row in the variant grid
+VARIANT_COLUMNS = 4
+
+def _variant_specs(prompt, size, models, count):
+    """Jobs generating ``count`` variants per model (OpenAI if ``models`` is [None]), batched per provider call."""
+    from providers.openai_provider import OPENAI_MAX_N
+    from providers.replicate_provider import max_outputs
+    from services.variants import plan_batches
+
+    specs = []
+    for model in models:
+        index = 0
+        for n in plan_batches(count, OPENAI_MAX_N if model is None else max_outputs(model)):
+            params = {"provider": "openai" if model is None else "replicate", "prompt": prompt, "count": n,
+                      "index": index, "size": size}
+            if model is not None:
+                params["model_name"] = model
+            specs.append((model or "OpenAI", "generate_variants", params))
+            index += n
+    return specs
+
+def _pick_variant(key):
+    st.session_state["variant_pick"] = key
+    st.session_state.pop("job_variant_upscale", None)
+
+def _variant_grid(slot):
+    """Thumbnails of the variants received so far; the picked one at full resolution below."""
+    entries = st.session_state.get(slot) or []
+    if not entries:
+        return
+    q = get_job_queue()
+    jobs = [(label, q.get(job_id)) for label, job_id in entries]
+    variants = []
+    for label, job in jobs:
+        if job is None:
+            st.warning(f"{label}: trabajo no encontrado o caducado; vuelve a lanzarlo")
+        elif job.status == SUCCEEDED:
+            variants += [(label, v) for v in q.result(job.id)]
+        elif job.status == FAILED:
+            st.error(f"{label}: {job.error}")
+        elif job.status == CANCELLED:
+            st.info(f"{label}: cancelado")
+    pick = st.session_state.get("variant_pick")
+    for start in range(0, len(variants), VARIANT_COLUMNS):
+        for i, (col, (label, v)) in enumerate(zip(st.columns(VARIANT_COLUMNS), variants[start:start + VARIANT_COLUMNS]),
+                                              start):
+            col.image(v["thumb"], caption=f"{label} · {v['width']}×{v['height']}", use_column_width=True)
+            col.button("✅ Elegida" if v["key"] == pick else "Elegir", key=f"variant_pick_{i}",
+                       on_click=_pick_variant, args=(v["key"],), use_container_width=True)
+    pending = [job for _, job in jobs if job and job.status not in FINISHED]
+    if pending:
+        _poll_jobs(slot, len(pending))
+    if pick:
+        _picked_variant(pick)
+
+def _picked_variant(key):
+    # full resolution is read back from disk only for the variant the user picked
+    from services.variants import get_variant_store
+
+    data = get_variant_store().get(key)
+    if data is None:
+        st.warning("La variante elegida ya no está disponible; genera de nuevo.")
+        return
+    st.markdown("**Variante elegida**")
+    _image_result("variant.png")(data, "Variante elegida", f"variant_{key[:16]}")
+    c1, c2 = st.columns(2)
+    factor = c1.selectbox("Ampliar", [2, 4], key="variant_scale", format_func=lambda x: f"×{x}")
+    if c2.button(f"Upscale ({up_mode})", key="variant_upscale"):
+        if up_mode == "Replicate AI":
+            model = get_upscale_models()[0]
+            spec = (f"Upscale {model}", "upscale_replicate", {"image_bytes": data, "model_name": model, "scale": factor})
+        else:
+            spec = ("Upscale Lanczos", "upscale_lanczos", {"image_bytes": data, "scale": float(factor)})
+        submit_jobs("job_variant_upscale", [spec])
+    show_jobs("job_variant_upscale", _image_result("variant_upscaled.png"))
+
+# Thumbnails per strip in the PDF viewer
+PDF_THUMBS = 8
+
+def _pdf_document_id(file):
+    # hashed once per upload, not on every rerun
+    ids = st.session_state.setdefault("pdf_doc_ids", {})
+    if file.file_id not in ids:
+        ids[file.file_id] = document_id(file.getvalue())
+    return ids[file.file_id]
+
+def _pdf_goto(page):
+    st.session_state["pdf_view_page"] = page
+
+def _page_sharpness_result(min_ppi):
+    def render(data, label, job_id):
+        left, right = st.columns([3, 2])
+        left.image(data["heatmap"], use_column_width=True,
+                   caption=f"{label} · verde: detalle suficiente para {min_ppi:.0f} ppp · rojo: la mitad o menos")
+        right.dataframe([{k: v for k, v in img.items() if k != "bbox"} for img in data["images"]], hide_index=True,
+                        column_config={"ppi": "PPI", "effective_ppi": "PPI efectivo", "detail_scale": "Detalle ÷"})
+    return render
+
+@st.fragment
+def _pdf_viewer(file, doc, data):
+    """Thumbnails, page preview and zoomed low-PPI placements of an analysed PDF."""
+    cache = get_render_cache()
+    c1, c2, c3 = st.columns(3)
+    min_ppi = c1.number_input("PPI mínimo", min_value=50.0, max_value=1200.0, value=300.0, step=25.0, key="pdf_view_min_ppi")
+    zoom_dpi = c2.select_slider("Zoom de imágenes (ppp)", [150, 300, 600], value=300, key="pdf_view_zoom")
+    flagged_only = c3.toggle("Solo páginas con avisos", value=False, key="pdf_view_flagged")
+    low = {r["page"] - 1: [img for img in r["images"] if img["min_ppi"] < min_ppi] for r in data}
+    order = sorted(p for p in low if low[p]) if flagged_only else sorted(low)
+    if not order:
+        st.success(f"Ninguna imagen por debajo de {min_ppi:.0f} ppp")
+        return
+    if st.session_state.get("pdf_view_page") not in order:
+        st.session_state["pdf_view_page"] = order[0]
+    pos = order.index(st.session_state["pdf_view_page"])
+
+    nav = st.columns([1, 6, 1])
+    nav[0].button("◀", key="pdf_prev", disabled=pos == 0, on_click=_pdf_goto, args=(order[pos - 1],))
+    page = nav[1].selectbox("Página", order, key="pdf_view_page", label_visibility="collapsed",
+                            format_func=lambda p: f"Página {p + 1}" + (f" · ⚠️ {len(low[p])}" if low[p] else ""))
+    nav[2].button("▶", key="pdf_next", disabled=pos == len(order) - 1, on_click=_pdf_goto,
+                  args=(order[min(pos + 1, len(order) - 1)],))
+    pos = order.index(page)
+
+    start = pos // PDF_THUMBS * PDF_THUMBS
+    for col, p in zip(st.columns(PDF_THUMBS), order[start:start + PDF_THUMBS]):
+        col.image(cache.render(doc, p, dpi=THUMB_DPI, load=file.getvalue), use_column_width=True)
+        col.button(f"{'▶ ' if p == page else ''}{p + 1}{' ⚠️' if low[p] else ''}", key=f"pdf_thumb_{p}",
+                   on_click=_pdf_goto, args=(p,), use_container_width=True)
+
+    left, right = st.columns([3, 2])
+    left.image(cache.render(doc, page, dpi=PAGE_DPI, load=file.getvalue), caption=f"Página {page + 1}", use_column_width=True)
+    with right:
+        if not low[page]:
+            st.success(f"Todas las imágenes de la página superan {min_ppi:.0f} ppp")
+        for img in low[page]:
+            px = f"{img['pixels'][0]}×{img['pixels'][1]} px en " if img.get("pixels") else ""
+            st.image(cache.render(doc, page, clip=img["bbox"], dpi=zoom_dpi, load=file.getvalue), use_column_width=True,
+                     caption=f"⚠️ {img['min_ppi']:.0f} ppp · {px}{img['display_in'][0]}×{img['display_in'][1]} in "
+                             f"· vista a {zoom_dpi} ppp")
+
+    if st.toggle("🔬 Resolución efectiva de la página", key="pdf_view_sharpness",
+                 help="Mide el detalle real de cada imagen: una imagen ampliada cumple el PPI sin tener más detalle"):
+        if st.session_state.get("job_pdf_sharpness_for") != (doc, page, min_ppi):
+            st.session_state["job_pdf_sharpness_for"] = (doc, page, min_ppi)
+            submit_jobs("job_pdf_sharpness", [(f"Página {page + 1}", "sharpness_pdf_page",
+                                               {"pdf_bytes": file.getvalue(), "page": page, "min_ppi": min_ppi})])
+        show_jobs("job_pdf_sharpness", _page_sharpness_result(min_ppi))
+
+    # render the next views while the operator looks at this one
+    nxt = order[start + PDF_THUMBS:start + 2 * PDF_THUMBS]
+    cache.prefetch(browse_keys(doc, order, page, {p: [i["bbox"] for i in imgs] for p, imgs in low.items()},
+                               clip_dpi=zoom_dpi, thumbs=nxt))
 
 tabs = st.tabs(["1) Generar", "2) Upscale / Resize", "3) Chequeo PPI"])
 
@@ -46,23 +358,30 @@ with tabs[0]:
         
         # Only show model selection when Replicate is selected
         model_choice = None
+        compare_models = []
         if prov == "Replicate":
             model_choice = st.selectbox("Select Model", get_available_models())
+            compare_models = st.multiselect("Comparar en paralelo con", [m for m in get_available_models() if m != model_choice])
         
+        n_variants = st.number_input("Variantes", min_value=1, max_value=MAX_VARIANTS, value=1,
+                                     help="Con más de una se muestran miniaturas a medida que llegan; "
+                                          "elige una para descargarla o ampliarla")
+
         if st.button("Generar", type="primary"):
-            try:
-                if prov == "OpenAI Images":
-                    img_bytes = generate_image_openai(prompt, size=size)
-                    
-                else:
-                    w,h = [int(x) for x in size.split("x")]
-                    # Use the selected model if available, otherwise default to SDXL
-                    selected_model = model_choice if model_choice else "SDXL"
-                    img_bytes = generate_image(prompt, model_name=selected_model, width=w, height=h)
-                st.image(img_bytes, caption="Resultado", use_column_width=True)
-                st.download_button("Descargar PNG", data=img_bytes, file_name="generated.png", mime="image/png")
-            except Exception as e:
-                st.error(f"Error generando imagen: {e}")
+            st.session_state.pop("job_variants" if n_variants == 1 else "job_generate", None)
+            if n_variants > 1:
+                _pick_variant(None)
+                submit_jobs("job_variants", _variant_specs(prompt, size, [None] if prov == "OpenAI Images" else
+                                                           [model_choice] + compare_models, int(n_variants)))
+            elif prov == "OpenAI Images":
+                submit_jobs("job_generate", [("Resultado", "generate_openai", {"prompt": prompt, "size": size})])
+            else:
+                w,h = [int(x) for x in size.split("x")]
+                # Several models run as parallel jobs; each result appears as soon as it finishes
+                submit_jobs("job_generate", [(m, "generate_replicate", {"prompt": prompt, "model_name": m, "width": w, "height": h})
+                                             for m in [model_choice] + compare_models])
+        show_jobs("job_generate", _image_result("generated.png"))
+        _variant_grid("job_variants")
     else:
         upl = st.file_uploader("Sube una imagen (PNG/JPG)", type=["png","jpg","jpeg"])
         prompt_edit = st.text_input("Prompt de edición", value="Mejora colores y contraste")
@@ -77,21 +396,14 @@ with tabs[0]:
         if st.button("Editar con IA"):
             if upl is None:
                 st.warning("Sube una imagen primero.")
+            elif prov == "OpenAI Images":
+                submit_jobs("job_edit", [("Editado", "edit_openai", {"image_bytes": upl.getvalue(), "prompt": prompt_edit, "size": size2})])
             else:
-                try:
-                    if prov == "OpenAI Images":
-                        img_bytes = edit_image_openai(upl.read(), prompt_edit, size=size2)
-                        st.image(img_bytes, caption="Editado", use_column_width=True)
-                        st.download_button("Descargar PNG", data=img_bytes, file_name="edited.png", mime="image/png")
-                    else:
-                        # Use Replicate for image editing
-                        w,h = [int(x) for x in size2.split("x")]
-                        selected_edit_model = edit_model_choice if edit_model_choice else "SDXL"
-                        img_bytes = edit_image_replicate(upl.read(), prompt_edit, model_name=selected_edit_model, width=w, height=h)
-                        st.image(img_bytes, caption="Editado", use_column_width=True)
-                        st.download_button("Descargar PNG", data=img_bytes, file_name="edited.png", mime="image/png")
-                except Exception as e:
-                    st.error(f"Error en edición: {e}")
+                # Use Replicate for image editing
+                w,h = [int(x) for x in size2.split("x")]
+                submit_jobs("job_edit", [("Editado", "edit_replicate", {"image_bytes": upl.getvalue(), "prompt": prompt_edit,
+                                                                        "model_name": edit_model_choice, "width": w, "height": h})])
+        show_jobs("job_edit", _image_result("edited.png"))
 
 with tabs[1]:
     st.subheader("Upscaling y cambio de tamaño")
@@ -104,11 +416,26 @@ with tabs[1]:
         
         # Show model selection for Replicate AI upscaling
         upscale_model = None
+        upscale_tiled_mode = False
         if up_mode == "Replicate AI":
             upscale_model = st.selectbox("Modelo de Upscaling", get_upscale_models())
+            upscale_tiled_mode = st.checkbox("Procesar por teselas (imágenes grandes)", value=False,
+                                             help="Divide la imagen en teselas solapadas que se procesan en paralelo y se funden sin costuras")
             
     with colB:
         st.info("Si conoces el tamaño físico final, calcula píxeles: mm / 25,4 × ppp")
+        if up_img is not None:
+            try:
+                info = probe_image(up_img)  # header only: no decode of the upload
+            except Exception as e:
+                st.warning(f"No se pudo leer la cabecera: {e}")
+            else:
+                out_w, out_h = (int(target_w), int(target_h)) if target_w > 0 and target_h > 0 else \
+                    (round(info.width * scale), round(info.height * scale))
+                dpi = f" · {info.dpi[0]:.0f} ppp" if info.dpi else ""
+                st.caption(f"Original: {info.width}×{info.height} px · {info.mode}{dpi}"
+                           f"{' · ICC' if info.has_icc else ''}")
+                st.caption(f"Resultado: {out_w}×{out_h} px → {out_w / 300 * 25.4:.0f}×{out_h / 300 * 25.4:.0f} mm a 300 ppp")
         if up_mode == "Replicate AI":
             st.info("🤖 Los modelos de IA pueden mejorar detalles y texturas durante el upscaling")
         
@@ -116,28 +443,19 @@ with tabs[1]:
         if up_img is None:
             st.warning("Sube una imagen primero.")
         else:
-            raw = up_img.read()
-            try:
-                if target_w>0 and target_h>0:
-                    im = Image.open(io.BytesIO(raw)).convert("RGB")
-                    im2 = im.resize((int(target_w), int(target_h)), Image.LANCZOS)
-                    out = io.BytesIO(); im2.save(out, format="PNG")
-                    result = out.getvalue()
-                else:
-                    if up_mode == "Lanczos (local)":
-                        result = upscale_lanczos(raw, scale=scale)
-                    else:  # Replicate AI
-                        selected_upscale_model = upscale_model if upscale_model else "Real-ESRGAN"
-                        result = upscale_replicate(raw, model_name=selected_upscale_model, scale=int(scale))
-                        
-                st.image(result, use_column_width=True)
-                st.download_button("Descargar PNG", data=result, file_name="upscaled.png", mime="image/png")
-            except Exception as e:
-                st.error(f"Error en upscaling: {e}")
+            raw = up_img.getvalue()
+            if target_w>0 and target_h>0:
+                submit_jobs("job_upscale", [("Resultado", "resize_lanczos", {"image_bytes": raw, "width": int(target_w), "height": int(target_h)})])
+            elif up_mode == "Lanczos (local)":
+                submit_jobs("job_upscale", [("Resultado", "upscale_lanczos", {"image_bytes": raw, "scale": scale})])
+            else:  # Replicate AI
+                submit_jobs("job_upscale", [("Resultado", "upscale_replicate", {"image_bytes": raw, "model_name": upscale_model,
+                                                                              "scale": int(scale), "tiled": upscale_tiled_mode})])
+    show_jobs("job_upscale", _image_result("upscaled.png", sharpness=True))
 
 with tabs[2]:
-    st.subheader("Chequeo PPI (imagen o PDF)")
-    mode_ppi = st.radio("Tipo de archivo", ["Imagen", "PDF"], horizontal=True)
+    st.subheader("Chequeo PPI (imagen, PDF o lote)")
+    mode_ppi = st.radio("Tipo de archivo", ["Imagen", "PDF", "Lote (ZIP)"], horizontal=True)
     if mode_ppi == "Imagen":
         file = st.file_uploader("Sube imagen", type=["png","jpg","jpeg"], key="ppi_img")
         c1, c2 = st.columns(2)
@@ -145,20 +463,66 @@ with tabs[2]:
             tw = st.number_input("Ancho objetivo (mm)", min_value=1.0, value=210.0, step=1.0)
         with c2:
             th = st.number_input("Alto objetivo (mm)", min_value=1.0, value=297.0, step=1.0)
+        measure = st.checkbox("Medir nitidez (resolución efectiva)", value=False, key="ppi_sharpness",
+                              help="Detecta imágenes ampliadas que cumplen el PPI pero no tienen detalle real")
         if st.button("Calcular PPI requerido", key="btn_ppi_img"):
             if file is None:
                 st.warning("Sube una imagen.")
             else:
-                info = ppi_from_image_bytes(file.read(), (tw, th))
-                st.json(info)
-    else:
+                info = ppi_from_image_bytes(file, (tw, th))
+                st.session_state["ppi_img_info"] = info
+                st.session_state.pop("job_ppi_sharpness", None)
+                if measure:
+                    submit_jobs("job_ppi_sharpness", [_sharpness_spec(file.getvalue(), min(info["required_ppi"]))])
+        if file is not None and st.session_state.get("ppi_img_info"):
+            st.json(st.session_state["ppi_img_info"])
+            _sharpness_panel("job_ppi_sharpness")
+    elif mode_ppi == "PDF":
         file = st.file_uploader("Sube PDF", type=["pdf"], key="ppi_pdf")
         if st.button("Analizar PDF", key="btn_ppi_pdf"):
             if file is None:
                 st.warning("Sube un PDF.")
             else:
-                data = min_effective_ppi_in_pdf(file.read())
-                st.write("Resultados por página:")
+                st.session_state["job_pdf_doc"] = _pdf_document_id(file)
+                submit_jobs("job_pdf", [("PDF", "pdf_ppi", {"pdf_bytes": file.getvalue()})])
+
+        def _pdf_result(data, label, job_id):
+            if file is not None and _pdf_document_id(file) == st.session_state.get("job_pdf_doc"):
+                _pdf_viewer(file, st.session_state["job_pdf_doc"], data)
+            else:
+                st.info("Sube de nuevo el PDF analizado para ver sus páginas.")
+            with st.expander("Resultados por página (JSON)"):
                 st.json(data)
 
-st.caption("© PoC IA Preimpresión — Streamlit + Python. Amplía a Firefly/Bedrock, añade preflight y CMYK en tu pipeline.")
\ No newline at end of file
+        def _pdf_partial(pages, label):
+            st.dataframe(pages, hide_index=True, use_container_width=True,
+                         column_config={"page": "Página", "min_ppi": "PPI mínimo", "images": "Imágenes"})
+        show_jobs("job_pdf", _pdf_result, _pdf_partial)
+    else:
+        file = st.file_uploader("Sube un ZIP con imágenes y PDFs", type=["zip"], key="ppi_zip")
+        st.markdown("Tamaños de impresión (mm) y PPI mínimo por tamaño:")
+        targets = st.data_editor([t._asdict() for t in DEFAULT_TARGETS], num_rows="dynamic", key="ppi_targets",
+                                 column_config={"name": "Nombre", "width_mm": "Ancho (mm)",
+                                                "height_mm": "Alto (mm)", "min_ppi": "PPI mínimo"})
+        if st.button("Analizar lote", key="btn_ppi_zip"):
+            targets = [(str(t["name"]), float(t["width_mm"]), float(t["height_mm"]), float(t["min_ppi"]))
+                       for t in targets if t.get("width_mm") and t.get("height_mm") and t.get("min_ppi")]
+            if file is None:
+                st.warning("Sube un ZIP.")
+            elif not targets:
+                st.warning("Define al menos un tamaño de impresión.")
+            else:
+                submit_jobs("job_preflight", [("Lote", "preflight_batch", {"zip_bytes": file.getvalue(), "targets": targets})])
+
+        def _preflight_result(rows, label, job_id):
+            flagged = [r for r in rows if r["status"] != "ok"]
+            st.write(f"{len({r['file'] for r in rows})} archivos · {len(flagged)} avisos")
+            st.dataframe(flagged or rows, use_container_width=True)
+            for fmt in ("csv", "jsonl"):
+                buf = io.StringIO()
+                write_report(iter(rows), buf, fmt)
+                st.download_button(f"Descargar {fmt.upper()}", data=buf.getvalue(), file_name=f"preflight.{fmt}",
+                                   key=f"dl_{fmt}_{job_id}")
+        show_jobs("job_preflight", _preflight_result)
+
+st.caption("© PoC IA Preimpresión — Streamlit + Python. Amplía a Firefly/Bedrock en tu pipeline.")
\ No newline at end of file
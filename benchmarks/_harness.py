@@ -0,0 +1,149 @@
+"""Shared helpers for the offline benchmark scripts in this folder."""
+import io
+import resource
+import time
+from typing import Callable, Dict, Any, Tuple
+
+from PIL import Image
+
+
+def timed(fn: Callable, *args, repeat: int = 3, **kwargs) -> Dict[str, Any]:
+    """Run ``fn`` ``repeat`` times and return best/mean wall time in seconds."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args, **kwargs)
+        times.append(time.perf_counter() - t0)
+    return {"best_s": round(min(times), 4), "mean_s": round(sum(times) / len(times), 4)}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    # VmHWM is reset on exec; ru_maxrss is not, so a subprocess would report
+    # its parent's peak if the parent was bigger.
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def synthetic_image(size: Tuple[int, int], mode: str = "RGB", seed: int = 0) -> Image.Image:
+    """Deterministic image with both smooth gradients and fine detail."""
+    import numpy as np
+
+    w, h = size
+    grad = Image.linear_gradient("L").resize((w, h))
+    rng = np.random.default_rng(seed)
+    noise = Image.fromarray(rng.normal(128, 64, (h, w)).clip(0, 255).astype(np.uint8), "L")
+    base = Image.merge("RGB", (grad, noise, grad.transpose(Image.FLIP_LEFT_RIGHT)))
+    if seed:
+        base = base.rotate(seed % 360)
+    return base.convert(mode)
+
+
+def synthetic_png(size: Tuple[int, int], seed: int = 0) -> bytes:
+    out = io.BytesIO()
+    synthetic_image(size, seed=seed).save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+def synthetic_pdf(pages: int, images_per_page: int = 3, distinct_images: int = 8) -> bytes:
+    """Multi-page PDF reusing a small pool of images at varying placements."""
+    import fitz
+
+    pool = [synthetic_png((600 + 40 * i, 400 + 30 * i), seed=i + 1) for i in range(distinct_images)]
+    doc = fitz.open()
+    xrefs = [0] * distinct_images
+    for pno in range(pages):
+        page = doc.new_page(width=595, height=842)
+        for k in range(images_per_page):
+            idx = (pno + k) % distinct_images
+            x0, y0 = 40 + 60 * k, 40 + 220 * k
+            rect = fitz.Rect(x0, y0, x0 + 150 + 40 * ((pno + k) % 4), y0 + 180)
+            if xrefs[idx]:
+                page.insert_image(rect, xref=xrefs[idx])
+            else:
+                xrefs[idx] = page.insert_image(rect, stream=pool[idx])
+    data = doc.tobytes(garbage=0)
+    doc.close()
+    return data
+
+
+def _s15(v: float) -> bytes:
+    import struct
+
+    return struct.pack(">i", int(round(v * 65536)))
+
+
+def synthetic_cmyk_profile(grid: int = 17) -> bytes:
+    """
+    Minimal ICC v2 printer profile (CMYK <-> Lab, mft2 LUTs) for benchmarks.
+
+    Separation is sRGB -> CMY with 70% grey component replacement: no real
+    press behaves like it, but LittleCMS builds and applies transforms to it
+    with the same cost as for a vendor profile.
+    """
+    import struct
+    import numpy as np
+
+    d50 = np.array([0.9642, 1.0, 0.8249])
+    m = np.array([[0.4360747, 0.3850649, 0.1430804], [0.2225045, 0.7168786, 0.0606169],
+                  [0.0139322, 0.0971045, 0.7141733]])  # linear sRGB -> XYZ (D50)
+
+    def rgb_to_lab(rgb):
+        lin = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+        t = (lin @ m.T) / d50
+        f = np.where(t > (6 / 29) ** 3, np.cbrt(t), t / (3 * (6 / 29) ** 2) + 4 / 29)
+        return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], -1)
+
+    def lab_to_rgb(lab):
+        fy = (lab[..., 0] + 16) / 116
+        f = np.stack([fy + lab[..., 1] / 500, fy, fy - lab[..., 2] / 200], -1)
+        t = np.where(f > 6 / 29, f ** 3, 3 * (6 / 29) ** 2 * (f - 4 / 29)) * d50
+        lin = np.clip(t @ np.linalg.inv(m).T, 0, 1)
+        return np.where(lin <= 0.0031308, lin * 12.92, 1.055 * lin ** (1 / 2.4) - 0.055)
+
+    def lab16(lab):  # legacy 16-bit Lab of mft2
+        return np.stack([lab[..., 0] * 652.8, (lab[..., 1] + 128) * 256, (lab[..., 2] + 128) * 256], -1)
+
+    def mft2(n_in, n_out, clut):
+        body = b"mft2" + bytes(4) + struct.pack(">BBBB", n_in, n_out, grid, 0)
+        body += b"".join(_s15(v) for v in (1, 0, 0, 0, 1, 0, 0, 0, 1)) + struct.pack(">HH", 2, 2)
+        ramp = struct.pack(">HH", 0, 65535)
+        return body + ramp * n_in + np.clip(clut, 0, 65535).round().astype(">u2").tobytes() + ramp * n_out
+
+    g = np.linspace(0, 1, grid)
+    # B2A0: Lab grid -> CMYK
+    lab = np.stack(np.meshgrid(g * 100, g * 255 - 128, g * 255 - 128, indexing="ij"), -1)
+    cmy = 1 - lab_to_rgb(lab)
+    k = cmy.min(-1, keepdims=True) * 0.7
+    cmyk = np.concatenate([(cmy - k) / np.maximum(1 - k, 1e-6), k], -1)
+    b2a = mft2(3, 4, cmyk.reshape(-1, 4) * 65535)
+    # A2B0: CMYK grid -> Lab
+    c = np.stack(np.meshgrid(g, g, g, g, indexing="ij"), -1)
+    rgb = (1 - c[..., :3]) * (1 - c[..., 3:])
+    a2b = mft2(4, 3, lab16(rgb_to_lab(rgb)).reshape(-1, 3))
+
+    desc_text = b"Synthetic CMYK (benchmarks)\0"
+    tags = [
+        (b"desc", b"desc" + bytes(4) + struct.pack(">I", len(desc_text)) + desc_text + bytes(4 + 4 + 2 + 1 + 67)),
+        (b"wtpt", b"XYZ " + bytes(4) + b"".join(_s15(v) for v in d50)),
+        (b"cprt", b"text" + bytes(4) + b"No copyright\0"),
+        (b"A2B0", a2b),
+        (b"B2A0", b2a),
+    ]
+    offset = 128 + 4 + 12 * len(tags)
+    table, data = struct.pack(">I", len(tags)), b""
+    for sig, body in tags:
+        body += bytes(-len(body) % 4)
+        table += sig + struct.pack(">II", offset + len(data), len(body))
+        data += body
+    size = offset + len(data)
+    header = (struct.pack(">I", size) + bytes(4) + struct.pack(">I", 0x02100000) + b"prtrCMYKLab "
+              + bytes(12) + b"acsp" + bytes(4 + 4 + 4 + 4 + 8 + 4) + b"".join(_s15(v) for v in d50))
+    header += bytes(128 - len(header))
+    return header + table + data
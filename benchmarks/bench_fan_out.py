@@ -0,0 +1,70 @@
+"""
+Fan-out latency and connection reuse of services/fan_out.py, offline.
+
+Runs one prompt against OpenAI plus ``--seeds`` seeds of two Replicate models
+on the local mock API, three ways:
+
+- sequential: one leg after another, as a single request did before;
+- fan_out: all legs at once through the asyncio interface;
+- capped: the same fan-out with ``--cap`` Replicate calls in flight.
+
+Usage: python -m benchmarks.bench_fan_out [--latency 0.3] [--seeds 4] [--cap 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.mock_server import mock_provider_server
+
+
+def _sequential(targets, scheduler):
+    from services.fan_out import generate
+
+    for t in targets:
+        generate(t, "benchmark prompt", 256, 256, scheduler=scheduler)
+
+
+def _concurrent(targets, scheduler):
+    from services.fan_out import fan_out
+
+    async def go():
+        async for _t, res in fan_out("benchmark prompt", targets, 256, 256, scheduler=scheduler):
+            if isinstance(res, Exception):
+                raise res
+    asyncio.run(go())
+
+
+def _run(label, mode, mock, targets, scheduler):
+    before = mock.connections
+    t0 = time.perf_counter()
+    mode(targets, scheduler)
+    return {"case": label, "targets": len(targets), "wall_s": round(time.perf_counter() - t0, 3),
+            "connections": mock.connections - before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--seeds", type=int, default=4, help="Seeds per Replicate model")
+    parser.add_argument("--cap", type=int, default=2, help="Replicate calls in flight in the capped case")
+    args = parser.parse_args()
+
+    with mock_provider_server(latency=args.latency) as mock:
+        os.environ["OPENAI_BASE_URL"] = os.environ["REPLICATE_BASE_URL"] = f"{mock.url}/v1"
+        os.environ["OPENAI_API_KEY"] = os.environ["REPLICATE_API_TOKEN"] = "mock"
+        from services.fan_out import Target  # providers read their URL and key on import
+        from services.scheduler import ProviderScheduler
+
+        targets = [Target("openai")] + [Target("replicate", m, seed) for m in ("Imagen 4", "Flux Kontext Pro")
+                                        for seed in range(args.seeds)]
+        uncapped = {"openai": len(targets), "replicate": len(targets)}
+        for label, mode, concurrency in (("sequential", _sequential, uncapped), ("fan_out", _concurrent, uncapped),
+                                         ("capped", _concurrent, {**uncapped, "replicate": args.cap})):
+            scheduler = ProviderScheduler(limits={}, concurrency=concurrency)
+            print(json.dumps({"latency_s": args.latency, **_run(label, mode, mock, targets, scheduler)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Header probe vs the Pillow paths for size/DPI checks, per format.
+
+Usage: python -m benchmarks.bench_image_probe [--megapixels 36] [--repeat 3]
+"""
+import argparse
+import io
+import json
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+from benchmarks._harness import timed, synthetic_image
+from utils.image_probe import probe_image
+
+_FORMATS = [("TIFF", ".tif", {}), ("PNG", ".png", {"compress_level": 1}), ("JPEG", ".jpg", {"quality": 90}),
+            ("WEBP", ".webp", {"quality": 80})]
+
+
+def _pil_bytes(path):
+    # previous ppi_from_image_bytes path: whole file in memory, then a lazy open
+    with open(path, "rb") as fh:
+        data = fh.read()
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size, img.info.get("dpi")
+
+
+def _pil_open(path):
+    # lazy open straight from the file: the best Pillow can do without a decode
+    with Image.open(path) as img:
+        return img.size, img.info.get("dpi")
+
+
+def _pil_decode(path):
+    # what a full decode costs, e.g. computing sizes from a loaded image
+    with Image.open(path) as img:
+        img.load()
+        return img.size
+
+
+def _loop(fn, path, n):
+    for _ in range(n):
+        fn(path)
+
+
+def _per_call(fn, path, repeat):
+    # grow the loop until it runs long enough to time cheap calls reliably
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        _loop(fn, path, n)
+        if time.perf_counter() - t0 >= 0.2:
+            break
+        n *= 4
+    return timed(_loop, fn, path, n, repeat=repeat)["best_s"] / n
+
+
+def _traced_peak_mb(fn, path):
+    # Python-level allocations only: Pillow's raster buffers are not traced
+    tracemalloc.start()
+    fn(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(peak / 2 ** 20, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=36.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    side = int(math.sqrt(args.megapixels * 1e6))
+    src = synthetic_image((side // 4, side // 4)).resize((side, side), Image.BICUBIC)
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, ext, kw in _FORMATS:
+            path = os.path.join(tmp, "asset" + ext)
+            src.save(path, format=fmt, dpi=(300, 300), **kw)
+            row = {"format": fmt, "size_mb": round(os.path.getsize(path) / 2 ** 20, 1), "pixels": f"{side}x{side}"}
+            for label, fn in (("probe", probe_image), ("pil_open", _pil_open), ("pil_bytes", _pil_bytes),
+                              ("pil_decode", _pil_decode)):
+                if label == "pil_decode":
+                    per_call = timed(fn, path, repeat=args.repeat)["best_s"]
+                else:
+                    per_call = _per_call(fn, path, args.repeat)
+                row[f"{label}_us"] = round(per_call * 1e6, 1)
+                row[f"{label}_peak_mb"] = _traced_peak_mb(fn, path)
+            row["speedup_vs_pil_bytes"] = round(row["pil_bytes_us"] / row["probe_us"], 1)
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Peak Python-level allocation per operation, before and after ImageHandle.
+
+"before" reproduces the previous code paths (BytesIO copies, base64 data
+URIs, requests-built multipart bodies, full-frame resize + PNG encode);
+"after" runs the current ones. Each case runs in a fresh interpreter and
+reports the tracemalloc peak (bytes/str/NumPy copies) and the peak RSS
+growth, which also covers Pillow's raster buffers.
+Usage: python -m benchmarks.bench_memory [--size 4000 3000]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import requests
+from PIL import Image
+
+from benchmarks._harness import peak_rss_mb, synthetic_png
+from providers.http import MultipartStream
+from services.upscale import upscale_lanczos
+from utils.image_handle import ImageHandle
+
+CHUNK = 64 * 1024
+
+
+def _drain(stream) -> None:
+    # what an HTTP client does with a streamed body
+    buf = bytearray(CHUNK)
+    while stream.readinto(buf):
+        pass
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _measure(fn, data: bytes, metric: str) -> float:
+    # tracemalloc's own bookkeeping inflates RSS, so the two are measured apart
+    if metric == "traced_peak_mb":
+        tracemalloc.start()
+        fn(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return round(peak / 2**20, 2)
+    rss0 = _rss_mb()
+    fn(data)
+    return round(max(0.0, peak_rss_mb() - rss0), 1)
+
+
+def upscale_payload_before(data):
+    return {"image": f"data:image/png;base64,{base64.b64encode(data).decode()}", "scale": 2}
+
+
+def upscale_payload_after(data):
+    _drain(ImageHandle(data).stream())
+
+
+def openai_edit_body_before(data):
+    files = {"image": ("image.png", data, "image/png"), "prompt": (None, "p"), "size": (None, "1024x1024")}
+    return requests.Request("POST", "http://localhost/", files=files).prepare()
+
+
+def openai_edit_body_after(data):
+    image = ImageHandle(data)
+    body = MultipartStream([("image", ("image.png", image.upload_buffer(), "image/png")),
+                            ("prompt", "p"), ("size", "1024x1024")])
+    requests.Request("POST", "http://localhost/", data=body, headers={"Content-Type": body.content_type}).prepare()
+    _drain(body)
+
+
+def replicate_edit_input_before(data):
+    _drain(io.BytesIO(data))
+
+
+def replicate_edit_input_after(data):
+    _drain(ImageHandle(data).stream())
+
+
+def lanczos_before(data):
+    img = Image.open(io.BytesIO(data))
+    out = io.BytesIO()
+    img.resize((img.width * 2, img.height * 2), Image.LANCZOS).save(out, format="PNG")
+    return out.getvalue()
+
+
+def lanczos_after(data):
+    return upscale_lanczos(ImageHandle(data), 2)
+
+
+OPERATIONS = {
+    "upscale_replicate_payload": (upscale_payload_before, upscale_payload_after),
+    "edit_openai_body": (openai_edit_body_before, openai_edit_body_after),
+    "edit_replicate_input": (replicate_edit_input_before, replicate_edit_input_after),
+    "upscale_lanczos_2x": (lanczos_before, lanczos_after),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000])
+    parser.add_argument("--single", nargs=4, metavar=("OPERATION", "VARIANT", "METRIC", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # the input is read from disk so generating it does not inflate the RSS peak
+        name, variant, metric, path = args.single
+        with open(path, "rb") as fh:
+            data = fh.read()
+        fn = OPERATIONS[name][0 if variant == "before" else 1]
+        print(_measure(fn, data, metric))
+        return
+    data = synthetic_png(tuple(args.size))
+    print(json.dumps({"input_mb": round(len(data) / 2**20, 2)}))
+    with tempfile.NamedTemporaryFile(suffix=".png") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        for name in OPERATIONS:
+            row = {"operation": name}
+            for variant in ("before", "after"):
+                row[variant] = {}
+                for metric in ("traced_peak_mb", "rss_growth_mb"):
+                    proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_memory",
+                                           "--single", name, variant, metric, tmp.name],
+                                          capture_output=True, text=True, check=True)
+                    row[variant][metric] = float(proc.stdout)
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
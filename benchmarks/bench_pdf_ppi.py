@@ -0,0 +1,40 @@
+"""
+Serial vs process-pool wall time for PDF effective-PPI analysis.
+
+Usage: python -m benchmarks.bench_pdf_ppi [--pages 200 500] [--workers N]
+"""
+import argparse
+import json
+import os
+
+from benchmarks._harness import timed, synthetic_pdf
+from utils.ppi import iter_effective_ppi_in_pdf
+
+
+def _drain(pdf, workers):
+    for _ in iter_effective_ppi_in_pdf(pdf, workers=workers):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    for pages in args.pages:
+        pdf = synthetic_pdf(pages)
+        serial = timed(_drain, pdf, 1, repeat=args.repeat)
+        parallel = timed(_drain, pdf, args.workers, repeat=args.repeat)
+        print(json.dumps({
+            "pages": pages,
+            "workers": args.workers,
+            "serial": serial,
+            "parallel": parallel,
+            "speedup": round(serial["best_s"] / parallel["best_s"], 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
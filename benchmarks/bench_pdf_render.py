@@ -0,0 +1,77 @@
+"""
+Latency of browsing a long PDF in the inspection view (services/pdf_render.py).
+
+An operator steps through ``--views`` pages, spending ``--think`` seconds on
+each, then goes back over the last few. Every view needs the thumbnail strip,
+the page preview and a zoomed clip per image placement, as the app renders
+them. Compared:
+
+- uncached: every view renders again;
+- cache: LRU only, renders on demand;
+- cache+prefetch: the background thread renders the next views meanwhile.
+
+Usage: python -m benchmarks.bench_pdf_render [--pages 500] [--views 30] [--think 0.5]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks._harness import synthetic_pdf
+from services.pdf_render import PAGE_DPI, THUMB_DPI, PdfRenderCache, browse_keys, document_id
+from utils.ppi import iter_effective_ppi_in_pdf
+
+THUMBS = 8  # as PDF_THUMBS in app.py
+
+
+def _view(cache, doc, order, page, clips, clip_dpi, prefetch):
+    t0 = time.perf_counter()
+    start = order.index(page) // THUMBS * THUMBS
+    for p in order[start:start + THUMBS]:
+        cache.render(doc, p, dpi=THUMB_DPI)
+    cache.render(doc, page, dpi=PAGE_DPI)
+    for clip in clips.get(page, []):
+        cache.render(doc, page, clip=clip, dpi=clip_dpi)
+    elapsed = time.perf_counter() - t0
+    if prefetch:
+        cache.prefetch(browse_keys(doc, order, page, clips, clip_dpi=clip_dpi,
+                                   thumbs=order[start + THUMBS:start + 2 * THUMBS]))
+    return elapsed
+
+
+def _browse(pdf, clips, args, max_bytes, prefetch):
+    cache = PdfRenderCache(max_bytes=max_bytes)
+    doc = document_id(pdf)
+    cache.open(doc, lambda: pdf)
+    order = list(range(cache.page_count(doc)))
+    pages = order[:args.views] + order[args.views - 2:args.views - 2 - args.back:-1]
+    times = []
+    for page in pages:
+        times.append(_view(cache, doc, order, page, clips, args.clip_dpi, prefetch))
+        time.sleep(args.think)
+    times.sort()
+    return {"p50_ms": round(1000 * statistics.median(times), 1),
+            "p95_ms": round(1000 * times[int(0.95 * (len(times) - 1))], 1),
+            "max_ms": round(1000 * times[-1], 1), **{k: v for k, v in cache.snapshot().items()
+                                                     if k in ("hits", "misses", "prefetch_hits", "bytes")}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--views", type=int, default=30, help="Pages stepped through forwards")
+    parser.add_argument("--back", type=int, default=10, help="Pages stepped back over afterwards")
+    parser.add_argument("--think", type=float, default=0.5, help="Seconds spent on each view")
+    parser.add_argument("--clip-dpi", type=int, default=300)
+    args = parser.parse_args()
+
+    pdf = synthetic_pdf(args.pages)
+    clips = {r["page"] - 1: [p.bbox for p in r["images"]] for r in iter_effective_ppi_in_pdf(pdf, workers=1)}
+    for label, max_bytes, prefetch in (("uncached", 0, False), ("cache", 192 * 2**20, False),
+                                       ("cache+prefetch", 192 * 2**20, True)):
+        row = {"case": label, "pages": args.pages, "views": args.views + args.back, "think_s": args.think}
+        print(json.dumps({**row, **_browse(pdf, clips, args, max_bytes, prefetch)}))
+
+
+if __name__ == "__main__":
+    main()
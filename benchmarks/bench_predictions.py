@@ -0,0 +1,101 @@
+"""
+Replicate prediction lifecycle against the mock API: ``replicate.run`` vs
+create + adaptive polling + cancel, and buffered vs streamed output download.
+
+- abandon: the user cancels ``--cancel-after`` seconds into a ``--latency``
+  second prediction; how long the worker stays busy and how many prediction
+  seconds are billed.
+- latency: end-to-end time and polls of one uncancelled prediction.
+- download: traced peak memory fetching a large output file.
+
+Usage: python -m benchmarks.bench_predictions [--latency 6] [--cancel-after 1] [--output-mp 16]
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks.mock_server import mock_provider_server
+
+MODEL = "google/imagen-4"
+
+
+def _old_call(cancelled):
+    # previous provider code: blocks in the client until the prediction finishes
+    from providers.clients import get_client
+
+    get_client("replicate").run(MODEL, input={"prompt": "benchmark"})
+
+
+def _new_call(cancelled):
+    from providers.predictions import run_prediction
+
+    run_prediction(MODEL, {"prompt": "benchmark"}, cancelled=cancelled)
+
+
+def _abandon(mock, call, cancel_after):
+    flag = threading.Event()
+    billed0 = mock.billed_seconds()
+    timer = threading.Timer(cancel_after, flag.set)
+    timer.start()
+    t0 = time.perf_counter()
+    try:
+        call(flag.is_set)
+    except RuntimeError:
+        pass  # PredictionCancelled
+    busy = time.perf_counter() - t0
+    timer.cancel()
+    time.sleep(mock.latency)  # let an uncancelled prediction run out before reading the bill
+    return {"worker_busy_s": round(busy, 2), "billed_s": round(mock.billed_seconds() - billed0, 2)}
+
+
+def _latency(mock, call):
+    polls0 = mock.calls.get("poll", 0)
+    t0 = time.perf_counter()
+    call(None)
+    return {"wall_s": round(time.perf_counter() - t0, 2), "polls": mock.calls.get("poll", 0) - polls0}
+
+
+def _download(url, fn):
+    tracemalloc.start()
+    fn(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(peak / 2 ** 20, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=6.0)
+    parser.add_argument("--queue", type=float, default=1.0, help="Seconds predictions stay 'starting'")
+    parser.add_argument("--cancel-after", type=float, default=1.0)
+    parser.add_argument("--output-mp", type=float, default=16.0, help="Megapixels of the mock output PNG")
+    args = parser.parse_args()
+
+    from providers.http import get_session
+    from providers.predictions import read_output
+
+    side = int(math.sqrt(args.output_mp * 1e6))
+    with mock_provider_server(latency=args.latency, queue=args.queue, image_size=(side, side)) as mock:
+        os.environ["REPLICATE_BASE_URL"] = f"{mock.url}/v1"
+        os.environ.setdefault("REPLICATE_API_TOKEN", "mock")
+        for label, call in (("run", _old_call), ("lifecycle", _new_call)):
+            row = {"case": label, "latency_s": args.latency, "cancel_after_s": args.cancel_after}
+            row["abandon"] = _abandon(mock, call, args.cancel_after)
+            row["latency"] = _latency(mock, call)
+            print(json.dumps(row))
+
+        url = f"{mock.url}/files/output.png"
+        print(json.dumps({
+            "case": "download", "output_mb": round(len(mock.png) / 2 ** 20, 1),
+            "buffered_peak_mb": _download(url, lambda u: get_session().get(u, timeout=120).content),
+            "streamed_peak_mb": _download(url, lambda u: read_output(SimpleNamespace(output=u))),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Batch preflight throughput (files/s) over a folder and a ZIP of synthetic assets.
+
+Usage: python -m benchmarks.bench_preflight [--files 500] [--workers N]
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+from benchmarks._harness import timed, synthetic_image, synthetic_pdf
+from services.preflight import iter_preflight, list_assets
+from utils.ppi import ppi_from_image_bytes
+
+# (format, extension, size): asset mix of a typical order
+_ASSET_MIX = [("JPEG", ".jpg", (3000, 2000)), ("PNG", ".png", (1600, 1200)), ("TIFF", ".tif", (2480, 3508))]
+
+
+def _write_assets(root, n_files, pdf_every=50):
+    encoded = []
+    for fmt, ext, size in _ASSET_MIX:
+        buf = io.BytesIO()
+        synthetic_image(size, seed=len(encoded) + 1).save(buf, format=fmt, dpi=(300, 300))
+        encoded.append((ext, buf.getvalue()))
+    pdf = synthetic_pdf(8)
+    for i in range(n_files):
+        ext, data = (".pdf", pdf) if pdf_every and i % pdf_every == pdf_every - 1 else encoded[i % len(encoded)]
+        sub = os.path.join(root, f"order_{i // 100:03d}")
+        os.makedirs(sub, exist_ok=True)
+        with open(os.path.join(sub, f"asset_{i:05d}{ext}"), "wb") as fh:
+            fh.write(data)
+
+
+def _zip_folder(root, path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name in list_assets(root):
+            zf.write(os.path.join(root, name), name)
+
+
+def _full_read_baseline(root):
+    # previous path: read each file into memory and run the single-image check
+    for name in list_assets(root):
+        if not name.endswith(".pdf"):
+            with open(os.path.join(root, name), "rb") as fh:
+                ppi_from_image_bytes(fh.read(), (210, 297))
+
+
+def _drain(source, workers):
+    for _ in iter_preflight(source, workers=workers):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "assets")
+        _write_assets(root, args.files)
+        archive = os.path.join(tmp, "assets.zip")
+        _zip_folder(root, archive)
+        n = len(list_assets(root))
+
+        baseline = timed(_full_read_baseline, root, repeat=args.repeat)
+        print(json.dumps({"case": "full_read_baseline", "files": n, **baseline,
+                          "files_per_s": round(n / baseline["best_s"], 1)}))
+        for label, source in (("folder", root), ("zip", archive)):
+            for workers in sorted({1, args.workers}):
+                res = timed(_drain, source, workers, repeat=args.repeat)
+                print(json.dumps({"case": label, "files": n, "workers": workers, **res,
+                                  "files_per_s": round(n / res["best_s"], 1)}))
+
+
+if __name__ == "__main__":
+    main()
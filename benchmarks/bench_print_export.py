@@ -0,0 +1,145 @@
+"""
+CMYK print export (services/print_export.py): conversion throughput with and
+without transform caching, and the cost of a full export per format.
+
+- transform: MP/s converting one large image in strips with one cached
+  transform vs a transform built per strip, and ``ImageCms.profileToProfile``
+  on the whole frame for reference.
+- requests: per-export conversion time for a series of small results, with
+  the cached transform vs one built per export.
+- export: wall time, MP/s and peak RSS of ``export_print`` vs converting the
+  whole frame and saving it with Pillow, each in a fresh interpreter.
+
+A synthetic CMYK profile is used unless ``--profile`` points at a real one.
+
+Usage: python -m benchmarks.bench_print_export [--mp 25] [--requests 20] [--profile path.icc]
+"""
+import argparse
+import io
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import ImageCms
+
+from benchmarks._harness import peak_rss_mb, synthetic_cmyk_profile, synthetic_image
+from services import print_export as E
+
+
+def _profile(path):
+    if path:
+        with open(path, "rb") as fh:
+            return fh.read()
+    return synthetic_cmyk_profile()
+
+
+def _image(megapixels, seed=0):
+    w = int(math.sqrt(megapixels * 1e6 * 1.414))
+    return synthetic_image((w, int(w / 1.414)), seed=seed)
+
+
+def _convert(img, transform_for_strip):
+    # strip loop of iter_cmyk_strips, with the transform looked up per strip
+    w, h = img.size
+    t0 = time.perf_counter()
+    for y0 in range(0, h, E.STRIP_ROWS):
+        transform_for_strip().apply(img.crop((0, y0, w, min(h, y0 + E.STRIP_ROWS))))
+    return time.perf_counter() - t0
+
+
+def _transform_cases(profile, megapixels):
+    img = _image(megapixels)
+    mp = img.width * img.height / 1e6
+    build = lambda: ImageCms.buildTransform(ImageCms.createProfile("sRGB"), ImageCms.ImageCmsProfile(io.BytesIO(profile)),
+                                            "RGB", "CMYK", flags=ImageCms.Flags.NOCACHE)
+    t0 = time.perf_counter()
+    build()
+    build_s = time.perf_counter() - t0
+    E.cmyk_transform.cache_clear()
+    cached = _convert(img, lambda: E.cmyk_transform(profile)[0])
+    uncached = _convert(img, build)
+    t0 = time.perf_counter()
+    ImageCms.profileToProfile(img, ImageCms.createProfile("sRGB"), ImageCms.ImageCmsProfile(io.BytesIO(profile)),
+                              outputMode="CMYK")
+    full = time.perf_counter() - t0
+    return {"case": "transform", "mp": round(mp, 1), "strips": math.ceil(img.height / E.STRIP_ROWS),
+            "build_ms": round(1000 * build_s, 1), "cached_mp_s": round(mp / cached, 1),
+            "uncached_mp_s": round(mp / uncached, 1), "full_frame_mp_s": round(mp / full, 1)}
+
+
+def _request_cases(profile, n):
+    imgs = [_image(1.0, seed=i + 1) for i in range(n)]
+    E.cmyk_transform.cache_clear()
+    rows = {}
+    for label, cache in (("uncached", False), ("cached", True)):
+        t0 = time.perf_counter()
+        for img in imgs:
+            if not cache:
+                E.cmyk_transform.cache_clear()
+            transform, _icc = E.cmyk_transform(profile)
+            for _ in E.iter_cmyk_strips(img, transform, workers=1):
+                pass
+        rows[f"{label}_ms_per_export"] = round(1000 * (time.perf_counter() - t0) / n, 1)
+    return {"case": "requests", "exports": n, "mp_each": 1.0, **rows}
+
+
+def _export(fmt, megapixels, engine, profile_path):
+    profile = _profile(profile_path)
+    img = _image(megapixels)
+    mp = img.width * img.height / 1e6
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")  # reset the peak so that building the test image does not mask the export
+    except OSError:
+        pass
+    base = peak_rss_mb()
+    with tempfile.TemporaryFile() as out:
+        t0 = time.perf_counter()
+        if engine == "strips":
+            E.export_print(img, out, fmt, dpi=300, profile=profile)
+        else:
+            cmyk = ImageCms.profileToProfile(img, ImageCms.createProfile("sRGB"),
+                                             ImageCms.ImageCmsProfile(io.BytesIO(profile)), outputMode="CMYK")
+            extra = {"compression": "tiff_adobe_deflate"} if fmt == "TIFF" else {"quality": E.JPEG_QUALITY}
+            # Pillow's PDF writer stores CMYK as JPEG; E.export_print writes lossless Flate
+            cmyk.save(out, format=fmt, dpi=(300, 300), icc_profile=profile, **extra)
+        wall = time.perf_counter() - t0
+        size = out.tell()
+    return {"case": "export", "format": fmt, "engine": engine, "mp": round(mp, 1), "wall_s": round(wall, 2),
+            "mp_s": round(mp / wall, 1), "output_mb": round(size / 2**20, 1), "source_rss_mb": base,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mp", type=float, default=25.0, help="Megapixels of the large image")
+    parser.add_argument("--requests", type=int, default=20, help="Small (1 MP) exports in the requests case")
+    parser.add_argument("--formats", nargs="+", default=list(E.EXPORT_FORMATS))
+    parser.add_argument("--profile", help="CMYK ICC profile to use instead of the synthetic one")
+    parser.add_argument("--single", nargs=3, metavar=("FORMAT", "MP", "ENGINE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(_export(args.single[0], float(args.single[1]), args.single[2], args.profile)))
+        return
+    profile = _profile(args.profile)
+    print(json.dumps(_transform_cases(profile, args.mp)))
+    print(json.dumps(_request_cases(profile, args.requests)))
+    for fmt in args.formats:
+        for engine in ("full_frame", "strips"):
+            cmd = [sys.executable, "-m", "benchmarks.bench_print_export", "--single", fmt, str(args.mp), engine]
+            if args.profile:
+                cmd += ["--profile", args.profile]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(json.dumps({"case": "export", "format": fmt, "engine": engine,
+                                  "error": proc.stderr.strip().splitlines()[-1:]}))
+            else:
+                print(proc.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Load test of the provider scheduler (services/scheduler.py) against the mock
+OpenAI API, which accepts ``--rate`` requests per second and answers the rest
+with 429.
+
+``--clients`` simulated sessions each send ``--requests`` image generations,
+with a short random pause between them. Prompts come from a pool of
+``--distinct`` prompts, so identical requests overlap in flight. Compared:
+
+- direct: provider calls as before, a 429 fails the request;
+- retry: jittered-backoff retries only, no rate limit or coalescing;
+- scheduler: token bucket at the mock's rate, retries and single-flight.
+
+The priority case submits ``--batch`` BATCH calls, then ``--interactive``
+INTERACTIVE ones, and reports the interactive latency with priorities and
+with every call at the same priority.
+
+Usage: python -m benchmarks.bench_scheduler [--clients 40] [--requests 3] [--distinct 8] [--rate 5]
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from benchmarks.mock_server import mock_provider_server
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return round(1000 * values[min(len(values) - 1, int(q * len(values)))], 1) if values else None
+
+
+def _run_clients(args, call):
+    latencies, failures, lock = [], [0], threading.Lock()
+
+    def client(i):
+        rng = random.Random(i)
+        for _ in range(args.requests):
+            prompt = f"benchmark {rng.randrange(args.distinct)}"
+            t0 = time.perf_counter()
+            try:
+                call(prompt)
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+            except Exception:
+                with lock:
+                    failures[0] += 1
+            time.sleep(rng.uniform(0, args.think))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, failures[0], time.perf_counter() - t0
+
+
+def _load(mock, args, label, scheduler, coalesce):
+    from providers.openai_provider import generate_image_openai
+
+    if scheduler is None:
+        call = lambda prompt: generate_image_openai(prompt, size="256x256")
+    else:
+        scheduled = lambda prompt: scheduler.call("openai", "images/generations",
+                                                  lambda: generate_image_openai(prompt, size="256x256"))
+        call = (lambda prompt: scheduler.single_flight(prompt, lambda: scheduled(prompt))) if coalesce else scheduled
+    calls0, throttled0 = mock.calls.get("openai", 0), mock.calls.get("throttled", 0)
+    latencies, failed, wall = _run_clients(args, call)
+    time.sleep(1.0)  # let the mock's rate window drain before the next case
+    stats = scheduler.snapshot() if scheduler is not None else {}
+    return {"case": label, "requests": args.clients * args.requests, "ok": len(latencies), "failed": failed,
+            "p50_ms": _pct(latencies, 0.5), "p99_ms": _pct(latencies, 0.99), "wall_s": round(wall, 1),
+            "upstream_calls": mock.calls.get("openai", 0) - calls0,
+            "throttled_429": mock.calls.get("throttled", 0) - throttled0,
+            "coalesced": stats.get("coalesced", 0), "retries": stats.get("retries", 0)}
+
+
+def _priority(mock, args, scheduler_cls, prioritised):
+    from providers.openai_provider import generate_image_openai
+    from services.scheduler import BATCH, INTERACTIVE
+
+    scheduler = scheduler_cls(limits={"openai": (args.rate, args.rate)})
+    latencies, lock = {"batch": [], "interactive": []}, threading.Lock()
+
+    def one(kind, i, priority):
+        t0 = time.perf_counter()
+        scheduler.call("openai", "images/generations",
+                       lambda: generate_image_openai(f"{kind} {i}", size="256x256"), priority=priority)
+        with lock:
+            latencies[kind].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=one, args=("batch", i, BATCH if prioritised else INTERACTIVE))
+               for i in range(args.batch)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)  # interactive requests arrive while the batch is queued
+    extra = [threading.Thread(target=one, args=("interactive", i, INTERACTIVE)) for i in range(args.interactive)]
+    for t in extra:
+        t.start()
+    for t in threads + extra:
+        t.join()
+    time.sleep(1.0)
+    return {"case": "priority", "prioritised": prioritised, "batch": args.batch, "interactive": args.interactive,
+            "interactive_p50_ms": _pct(latencies["interactive"], 0.5),
+            "interactive_max_ms": _pct(latencies["interactive"], 1.0),
+            "batch_p50_ms": _pct(latencies["batch"], 0.5)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=3, help="Requests per client")
+    parser.add_argument("--distinct", type=int, default=8, help="Size of the prompt pool")
+    parser.add_argument("--think", type=float, default=0.5, help="Max seconds between a client's requests")
+    parser.add_argument("--rate", type=float, default=5.0, help="Requests per second the mock accepts")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--interactive", type=int, default=5)
+    args = parser.parse_args()
+
+    with mock_provider_server(latency=args.latency, rate_limit=args.rate) as mock:
+        os.environ["OPENAI_BASE_URL"] = f"{mock.url}/v1"
+        os.environ["OPENAI_API_KEY"] = "mock"
+        from services.scheduler import ProviderScheduler  # providers read their URL and key on import
+
+        for label, scheduler, coalesce in (("direct", None, False), ("retry", ProviderScheduler(limits={}), False),
+                                           ("scheduler", ProviderScheduler(limits={"openai": (args.rate, args.rate)}), True)):
+            print(json.dumps({"rate_limit": args.rate, **_load(mock, args, label, scheduler, coalesce)}))
+        for prioritised in (False, True):
+            print(json.dumps(_priority(mock, args, ProviderScheduler, prioritised)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Throughput and memory of the tile sharpness analysis (utils/sharpness.py).
+
+- naive vs numpy: the same metrics computed pixel by pixel in Python and with
+  the vectorized strips, on a small crop (results must agree).
+- large: MP/s and peak RSS over the source for large rasters, each in a
+  fresh interpreter. The source is the decoded image, or with ``--formats``
+  the bytes of a PNG or uncompressed TIFF written beforehand by another
+  interpreter, so the decode is measured too.
+
+Usage: python -m benchmarks.bench_sharpness [--naive-px 256] [--mp 25 100] [--formats decoded png tiff]
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks._harness import peak_rss_mb, synthetic_image
+from utils import sharpness as S
+
+# the synthetic sources of the large cases go past Pillow's decompression-bomb guard
+Image.MAX_IMAGE_PIXELS = None
+
+
+def _naive(img: Image.Image, tile: int):
+    """Per-pixel Python version of utils.sharpness for one image (single strip per tile row)."""
+    H = S.HALO
+    grey = np.asarray(img.convert("L"))
+    height, width = grey.shape
+    lap_rows, scale_rows = [], []
+    for y0 in range(0, height, tile):
+        y1 = min(height, y0 + tile)
+        top, bottom = max(0, y0 - H), min(height, y1 + H)
+        padded = np.pad(grey[top:bottom], ((H - (y0 - top), H - (bottom - y1)), (H, H)), mode="reflect")
+        g = padded.astype(float).tolist()
+        src = Image.fromarray(padded, "L")
+        ph, pw = padded.shape
+        backs = [np.asarray(src.resize((max(1, round(pw / k)), max(1, round(ph / k))), Image.BOX)
+                            .resize((pw, ph), Image.BICUBIC)).astype(float).tolist() for k in S.SCALES]
+        lap_row, scale_row = [], []
+        for x0 in range(0, width, tile):
+            x1 = min(width, x0 + tile)
+            s1 = s2 = 0.0
+            energy = [0.0] * len(S.SCALES)
+            for y in range(H, H + y1 - y0):
+                for x in range(H + x0, H + x1):
+                    v = g[y][x]
+                    lap = 4 * v - g[y - 1][x] - g[y + 1][x] - g[y][x - 1] - g[y][x + 1]
+                    s1 += lap
+                    s2 += lap * lap
+                    for i, back in enumerate(backs):
+                        d = v - back[y][x]
+                        energy[i] += d * d
+            n = (y1 - y0) * (x1 - x0)
+            lap_row.append(s2 / n - (s1 / n) ** 2)
+            energy = [e / n for e in energy]
+            scale_row.append(_naive_scale(energy))
+        lap_rows.append(lap_row)
+        scale_rows.append(scale_row)
+    return np.array(lap_rows), np.array(scale_rows)
+
+
+def _naive_scale(energy):
+    if energy[-1] < S.FLAT_ENERGY:
+        return float("nan")
+    ks = (1.0,) + S.SCALES
+    prev_r, best = 0.0, 0.0
+    for i, e in enumerate(energy, start=1):
+        best = max(best, e / energy[-1])
+        if best >= S.DETAIL_THRESHOLD:
+            t = (S.DETAIL_THRESHOLD - prev_r) / max(best - prev_r, 1e-9)
+            return math.exp(math.log(ks[i - 1]) + t * (math.log(ks[i]) - math.log(ks[i - 1])))
+        prev_r = best
+    return ks[-1]
+
+
+def _compare(px: int) -> dict:
+    img = synthetic_image((px * 3 // 2, px), seed=2).resize((px * 3, px * 2), Image.LANCZOS)
+    mp = img.width * img.height / 1e6
+    t0 = time.perf_counter()
+    lap_n, scale_n = _naive(img, S.TILE)
+    naive_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    report = S.analyze_image(img, workers=1)
+    numpy_s = time.perf_counter() - t0
+    return {"case": "naive_vs_numpy", "pixels": f"{img.width}x{img.height}",
+            "naive_mp_s": round(mp / naive_s, 3), "numpy_mp_s": round(mp / numpy_s, 1),
+            "speedup": round(naive_s / numpy_s), "max_scale_diff": float(np.nanmax(abs(scale_n - report.detail_scale))),
+            "max_lapvar_rel_diff": float(np.max(abs(lap_n - report.laplacian_var) / np.maximum(lap_n, 1)))}
+
+
+def _source(megapixels: float) -> Image.Image:
+    w = int(math.sqrt(megapixels * 1e6 * 1.414))
+    h = int(w / 1.414)
+    # a 2x upscale, as the analysis would see after upscale_lanczos
+    return synthetic_image((w // 2, h // 2)).resize((w, h), Image.LANCZOS)
+
+
+def _large(megapixels: float, workers: int, path: str = "") -> dict:
+    if path:
+        with open(path, "rb") as fh:
+            source = fh.read()
+        fmt, size = os.path.splitext(path)[1][1:], Image.open(path).size
+    else:
+        source = _source(megapixels)
+        fmt, size = "decoded", source.size
+    base_rss = peak_rss_mb()
+    t0 = time.perf_counter()
+    report = S.analyze_image(source, workers=workers)
+    wall = time.perf_counter() - t0
+    mp = size[0] * size[1] / 1e6
+    return {"case": "large", "input": fmt, "mp": round(mp, 1), "workers": workers, "wall_s": round(wall, 2),
+            "mp_s": round(mp / wall, 1), "effective_scale": round(report.effective_scale, 2),
+            "source_rss_mb": base_rss, "peak_rss_mb": peak_rss_mb()}
+
+
+def _subprocess(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-m", "benchmarks.bench_sharpness", *args], capture_output=True, text=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--naive-px", type=int, default=256, help="Height of the crop the naive version runs on")
+    parser.add_argument("--mp", type=float, nargs="+", default=[25, 100])
+    parser.add_argument("--workers", type=int, default=0, help="Analysis threads for the large cases (0: CPU count)")
+    parser.add_argument("--formats", nargs="+", default=["decoded"], choices=["decoded", "png", "tiff"],
+                        help="Inputs of the large cases")
+    parser.add_argument("--single", nargs=3, metavar=("MP", "WORKERS", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--write", nargs=2, metavar=("MP", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.write:
+        _source(float(args.write[0])).save(args.write[1], compress_level=1)
+        return
+    if args.single:
+        print(json.dumps(_large(float(args.single[0]), int(args.single[1]) or None, args.single[2])))
+        return
+    print(json.dumps(_compare(args.naive_px)))
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.mp:
+            for fmt in args.formats:
+                path = "" if fmt == "decoded" else os.path.join(tmp, f"source.{fmt}")
+                proc = _subprocess("--write", str(mp), path) if path else None
+                if proc is None or proc.returncode == 0:
+                    proc = _subprocess("--single", str(mp), str(args.workers), path)
+                if proc.returncode != 0:
+                    print(json.dumps({"case": "large", "input": fmt, "mp": mp,
+                                      "error": proc.stderr.strip().splitlines()[-1:]}))
+                else:
+                    print(proc.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
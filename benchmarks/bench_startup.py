@@ -0,0 +1,76 @@
+"""
+Cold-start cost of the Streamlit app: module import time, first render and
+first use of the provider clients, each in a fresh interpreter.
+
+Usage: python -m benchmarks.bench_startup [--repeat 5] [--budget-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded by a first render that makes no provider call
+HEAVY_MODULES = ["replicate", "httpx", "fitz", "numpy", "requests", "PIL"]
+
+_PROBES = {
+    # the modules app.py imports, on top of an already imported Streamlit
+    "app_imports": """
+import streamlit
+t0 = time.perf_counter()
+import providers.clients, providers.replicate_provider, services.upscale, services.cache, services.jobs
+import services.preflight, utils.image_probe, utils.ppi
+services.jobs.get_job_queue()
+elapsed = time.perf_counter() - t0
+""",
+    # a full first script run, as a new session on a cold server would see it
+    "first_render": """
+from streamlit.testing.v1 import AppTest
+t0 = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=60).run()
+elapsed = time.perf_counter() - t0
+assert not at.exception, at.exception
+""",
+    # what the first Replicate call pays on top of the request itself
+    "replicate_client": """
+from providers.clients import get_client
+t0 = time.perf_counter()
+get_client("replicate")
+elapsed = time.perf_counter() - t0
+""",
+}
+
+
+def _run(probe: str) -> dict:
+    code = ("import json, sys, time\n" + _PROBES[probe] +
+            f"\nprint(json.dumps({{'s': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))")
+    env = {**os.environ, "PYTHONPATH": ROOT, "PROVIDER_WARMUP": "0"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Exit with status 1 if the median first render exceeds this")
+    args = parser.parse_args()
+
+    failed = False
+    for probe in _PROBES:
+        runs = [_run(probe) for _ in range(args.repeat)]
+        median_ms = statistics.median(r["s"] for r in runs) * 1000
+        row = {"case": probe, "median_ms": round(median_ms, 1),
+               "best_ms": round(min(r["s"] for r in runs) * 1000, 1), "heavy_loaded": runs[-1]["loaded"]}
+        if probe == "first_render" and args.budget_ms is not None:
+            row["budget_ms"] = args.budget_ms
+            failed = median_ms > args.budget_ms
+        print(json.dumps(row))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
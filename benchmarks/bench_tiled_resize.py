@@ -0,0 +1,62 @@
+"""
+Peak RSS and wall time of full-frame vs tiled Lanczos upscaling to PNG.
+
+Each case runs in a fresh interpreter so its peak RSS is not polluted by the
+previous one. Usage: python -m benchmarks.bench_tiled_resize [--mp 50 100 200]
+"""
+import argparse
+import json
+import math
+import subprocess
+import sys
+import time
+
+from benchmarks._harness import peak_rss_mb, synthetic_image
+
+SCALE = 4
+
+
+def _case(engine: str, megapixels: float) -> dict:
+    import io
+    from PIL import Image
+    from services.tiled_resize import resize_lanczos_tiled
+
+    out_w = int(math.sqrt(megapixels * 1e6 * 1.414))  # A-series aspect ratio
+    out_h = int(out_w / 1.414)
+    src = synthetic_image((out_w // SCALE, out_h // SCALE))
+    base_rss = peak_rss_mb()
+    sink = open("/dev/null", "wb")
+    t0 = time.perf_counter()
+    if engine == "full":
+        buf = io.BytesIO()
+        src.resize((out_w, out_h), Image.LANCZOS).save(buf, format="PNG")
+        sink.write(buf.getvalue())
+    else:
+        resize_lanczos_tiled(src, (out_w, out_h), sink)
+    wall = time.perf_counter() - t0
+    return {"engine": engine, "output_mp": round(out_w * out_h / 1e6, 1), "wall_s": round(wall, 2),
+            "peak_rss_mb": peak_rss_mb(), "source_rss_mb": base_rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mp", type=float, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--engines", nargs="+", default=["full", "tiled"])
+    parser.add_argument("--single", nargs=2, metavar=("ENGINE", "MP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(_case(args.single[0], float(args.single[1]))))
+        return
+    for mp in args.mp:
+        for engine in args.engines:
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_tiled_resize", "--single", engine, str(mp)],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(json.dumps({"engine": engine, "output_mp": mp, "error": proc.stderr.strip().splitlines()[-1:]}))
+            else:
+                print(proc.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
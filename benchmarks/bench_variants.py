@@ -0,0 +1,87 @@
+"""
+Batch generation of variants (services/variants.py) against the mock API:
+what the job queue, the session and the browser hold for ``--variants``
+results, and when the first and last ones arrive.
+
+- full: one generation job per variant returning the full PNG, as rendering
+  N results with the single-image view would;
+- variants: ``generate_variants`` jobs batched with ``n`` per OpenAI call,
+  returning thumbnails while the full PNGs go to the disk store;
+- variants_replicate: one ``generate_variants`` job per variant, for
+  Replicate models without ``num_outputs``.
+
+Jobs run on ``--workers`` threads, as in the job queue. ``results_kb`` is
+what the jobs hand back (and the page shows); ``stored_kb`` went to the
+variant store on disk instead.
+
+Usage: python -m benchmarks.bench_variants [--variants 16] [--size 1024] [--latency 2]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from benchmarks.mock_server import mock_provider_server
+
+PROMPT = "benchmark"
+
+
+class _Ctx:
+    cancelled = False
+
+    def progress(self, fraction, message=""):
+        pass
+
+
+def _run(jobs, workers):
+    t0 = time.perf_counter()
+    arrivals, results = [], []
+    with ThreadPoolExecutor(workers) as pool:
+        for fut in as_completed([pool.submit(job) for job in jobs]):
+            out = fut.result()
+            results += out if isinstance(out, list) else [out]
+            arrivals.append(time.perf_counter() - t0)
+    return arrivals, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--variants", type=int, default=16)
+    parser.add_argument("--size", type=int, default=1024, help="Edge of the mock output image, in px")
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per provider call")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with mock_provider_server(latency=args.latency, image_size=(args.size, args.size)) as mock:
+        os.environ.update(OPENAI_BASE_URL=f"{mock.url}/v1", OPENAI_API_KEY="mock", REPLICATE_BASE_URL=f"{mock.url}/v1",
+                          REPLICATE_API_TOKEN="mock", PROVIDER_RATE_LIMITS="",
+                          VARIANT_STORE_DIR=tempfile.mkdtemp(), RESULT_CACHE_DIR=tempfile.mkdtemp())
+        from providers.openai_provider import OPENAI_MAX_N, generate_image_openai  # providers read the env on import
+        from services import tasks
+        from services.variants import plan_batches
+
+        ctx, size = _Ctx(), f"{args.size}x{args.size}"
+        cases = {
+            "full": [lambda: generate_image_openai(PROMPT, size=size) for _ in range(args.variants)],
+            "variants": [lambda n=n, i=i: tasks.generate_variants_task(ctx, "openai", PROMPT, n, i, size=size)
+                         for i, n in enumerate(plan_batches(args.variants, OPENAI_MAX_N))],
+            "variants_replicate": [lambda i=i: tasks.generate_variants_task(ctx, "replicate", PROMPT, 1, i, size=size,
+                                                                            model_name="Imagen 4")
+                                   for i in range(args.variants)],
+        }
+        for label, jobs in cases.items():
+            calls0 = sum(mock.calls.get(k, 0) for k in ("openai", "replicate"))
+            arrivals, results = _run(jobs, args.workers)
+            held = sum(len(r) if isinstance(r, bytes) else len(r["thumb"]) for r in results)
+            print(json.dumps({"case": label, "variants": len(results), "workers": args.workers,
+                              "upstream_calls": sum(mock.calls.get(k, 0) for k in ("openai", "replicate")) - calls0,
+                              "first_s": round(arrivals[0], 2), "all_s": round(arrivals[-1], 2),
+                              "results_kb": round(held / 1024, 1),
+                              "per_variant_kb": round(held / 1024 / len(results), 1),
+                              "stored_kb": round(sum(r["bytes"] for r in results if isinstance(r, dict)) / 1024, 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Local stand-in for the OpenAI Images and Replicate HTTP APIs.
+
+Serves deterministic PNGs after a configurable latency so provider code can be
+exercised and benchmarked offline:
+
+    with mock_provider_server(latency=0.2) as mock:
+        os.environ["OPENAI_BASE_URL"] = f"{mock.url}/v1"  # before importing the providers
+        ...
+        mock.calls, mock.connections  # upstream call and TCP connection counts
+
+Replicate predictions go "starting" for ``queue`` seconds, then "processing"
+and "succeeded" once ``latency`` has elapsed since creation, mirroring the real
+lifecycle; polls answer immediately. ``mock.billed_seconds()`` adds up the
+time predictions spent running, which cancelling cuts short.
+
+With ``rate_limit`` set, each API accepts that many creation requests per
+second and answers the rest with 429 and ``Retry-After: 1``, counted as
+``mock.calls["throttled"]``.
+"""
+import base64
+import json
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+from benchmarks._harness import synthetic_png
+
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class _MockState:
+    def __init__(self, latency: float, image_size, queue: float = 0.0, rate_limit: Optional[float] = None):
+        self.latency = latency
+        self.queue = queue
+        self.rate_limit = rate_limit
+        self.windows: Dict[str, list] = {}
+        self.png = synthetic_png(image_size)
+        self.predictions: Dict[str, Dict] = {}
+        self.calls: Dict[str, int] = {}
+        self.connections = 0
+        self.url = ""
+        self.lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def admit(self, key: str) -> bool:
+        """Fixed one-second window of ``rate_limit`` requests per API."""
+        if self.rate_limit is None:
+            return True
+        with self.lock:
+            window = math.floor(time.time())
+            start, n = self.windows.get(key, (window, 0))
+            if start != window:
+                start, n = window, 0
+            self.windows[key] = (start, n + 1)
+            return n < self.rate_limit
+
+    def billed_seconds(self) -> float:
+        """Run time of all predictions so far: from start to completion, cancellation or now."""
+        now = time.time()
+        total = 0.0
+        for p in list(self.predictions.values()):
+            started = p["created"] + self.queue
+            end = min(p.get("canceled", now), p["created"] + self.latency)
+            total += max(0.0, end - started)
+        return total
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse sockets
+    state: _MockState
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _base(self) -> str:
+        return f"http://{self.headers['Host']}"
+
+    def _send(self, status: int, body: bytes, ctype: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status: int = 200) -> None:
+        self._send(status, json.dumps(obj).encode())
+
+    def _throttled(self, key: str) -> bool:
+        if self.state.admit(key):
+            return False
+        self.state.count("throttled")
+        body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}, "detail": "throttled"}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _prediction(self, pid: str) -> Dict:
+        p = self.state.predictions[pid]
+        created = p["created"]
+        end = min(p.get("canceled", time.time()), time.time())
+        if end - created >= self.state.latency:
+            status = "succeeded"
+        elif "canceled" in p:
+            status = "canceled"
+        else:
+            status = "processing" if end - created >= self.state.queue else "starting"
+        started = created + self.state.queue if status != "starting" else None
+        finished = (created + self.state.latency if status == "succeeded" else end) if status in ("succeeded", "canceled") else None
+        return {
+            "id": pid,
+            "model": p["model"],
+            "version": p["version"],
+            "status": status,
+            "output": (f"{self._base()}/files/{pid}.png" if not p.get("outputs") else
+                       [f"{self._base()}/files/{pid}-{i}.png" for i in range(p["outputs"])]) if status == "succeeded" else None,
+            "error": None,
+            "created_at": _iso(created),
+            "started_at": _iso(started) if started else None,
+            "completed_at": _iso(finished) if finished else None,
+            "urls": {"get": f"{self._base()}/v1/predictions/{pid}",
+                     "cancel": f"{self._base()}/v1/predictions/{pid}/cancel"},
+        }
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path
+        if path == "/v1/images/generations" or path == "/v1/images/edits":
+            if self._throttled("openai"):
+                return
+            self.state.count("openai")
+            n = json.loads(body).get("n", 1) if path.endswith("generations") else 1
+            time.sleep(self.state.latency)
+            self._json({"data": [{"b64_json": base64.b64encode(self.state.png).decode()}] * n})
+        elif path == "/v1/predictions" or (path.startswith("/v1/models/") and path.endswith("/predictions")):
+            if self._throttled("replicate"):
+                return
+            self.state.count("replicate")
+            pid = uuid.uuid4().hex
+            request = json.loads(body or b"{}")
+            version = request.get("version", "")
+            model = "/".join(path.split("/")[3:5]) if path.startswith("/v1/models/") else version.split(":")[0]
+            self.state.predictions[pid] = {"created": time.time(), "model": model, "version": version,
+                                           "outputs": request.get("input", {}).get("num_outputs")}
+            if self.headers.get("Prefer", "").startswith("wait"):
+                time.sleep(self.state.latency)  # the real API holds the response until the output is ready
+            self._json(self._prediction(pid), status=201)
+        elif path == "/v1/files":
+            # uploads from the replicate client; the mock only hands back a URL
+            self.state.count("upload")
+            fid = uuid.uuid4().hex
+            self._json({"id": fid, "name": "upload", "content_type": "application/octet-stream", "size": len(body),
+                        "etag": fid, "checksums": {}, "metadata": {}, "created_at": "", "expires_at": None,
+                        "urls": {"get": f"{self._base()}/files/{fid}"}}, status=201)
+        elif path.startswith("/v1/predictions/") and path.endswith("/cancel"):
+            pid = path.split("/")[3]
+            self.state.predictions[pid].setdefault("canceled", time.time())
+            self.state.count("cancel")
+            self._json(self._prediction(pid))
+        else:
+            self._json({"detail": "not found"}, status=404)
+
+    def do_GET(self):
+        path = self.path
+        if path.startswith("/v1/predictions/"):
+            self.state.count("poll")
+            self._json(self._prediction(path.split("/")[3]))
+        elif path.startswith("/v1/models/") and "/versions/" in path:
+            # version metadata the replicate client looks up for owner/name:version refs
+            self._json({"id": path.rsplit("/", 1)[1], "created_at": "2024-01-01T00:00:00Z", "cog_version": "0.9",
+                        "openapi_schema": {}})
+        elif path.startswith("/files/"):
+            self.state.count("download")
+            self._send(200, self.state.png, "image/png")
+        else:
+            self._json({"detail": "not found"}, status=404)
+
+
+@contextmanager
+def mock_provider_server(latency: float = 0.2, image_size=(256, 256), queue: float = 0.0,
+                         rate_limit: Optional[float] = None) -> Iterator[_MockState]:
+    """Run the mock API on a free localhost port; yields its state (``.url`` is the base URL)."""
+    state = _MockState(latency, image_size, queue, rate_limit)
+    handler = type("Handler", (_Handler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        yield state
+    finally:
+        server.shutdown()
+        server.server_close()
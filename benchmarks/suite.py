@@ -0,0 +1,260 @@
+"""
+Offline regression suite for the prepress pipeline: every main code path on
+fixed synthetic inputs, each case in a fresh interpreter.
+
+- resize / upscale_lanczos: explicit resize to 1.5x and ``upscale_lanczos``
+  x2 at each IMAGE_MP input size (output MP/s);
+- ppi_probe: ``ppi_from_image_bytes`` on a PNG of each size (calls/s);
+- pdf_min_ppi: ``min_effective_ppi_in_pdf`` on generated PDFs of increasing
+  page and image count (pages/s);
+- openai_* / replicate_*: provider round trips against the mock API
+  (benchmarks/mock_server.py), including request encoding, polling and
+  output download, with the scheduler's rate limits off (calls/s).
+
+Each timed run repeats a case's call enough times to last at least
+MIN_RUN_S, so timer and scheduling noise stay small next to it. Each case
+reports the median and best wall time per call over ``--repeat`` runs,
+throughput, and peak RSS above what its inputs already used. ``--save``
+writes the results as a JSON baseline; ``--baseline`` compares against one
+and exits with status 1 when a case is slower than ``--max-slowdown`` or
+grew its peak memory by more than ``--max-memory-growth`` (per-case values
+can be set under ``"tolerances"`` in the baseline file). Baselines are only
+comparable on the same machine.
+
+Usage: python -m benchmarks.suite [--save base.json | --baseline base.json] [--only pdf_] [--repeat 3]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Tuple
+
+from benchmarks._harness import peak_rss_mb, synthetic_image, synthetic_pdf, synthetic_png
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMAGE_MP = (1, 4)
+PDF_SIZES = ((10, 2), (100, 3), (400, 6))  # (pages, images per page)
+MOCK_LATENCY = 0.02
+# Shortest timed run: faster cases repeat their call within a run
+MIN_RUN_S = 0.1
+# Peak memory differences below this are allocator noise and never a regression
+MEMORY_SLACK_MB = 8.0
+
+# Case setup: returns (run, units per run, unit); built inside the case's interpreter
+Setup = Callable[[contextlib.ExitStack], Tuple[Callable[[], object], float, str]]
+
+def _image(megapixels: float):
+    w = int(math.sqrt(megapixels * 1e6 * 1.414))
+    return synthetic_image((w, int(w / 1.414)), seed=1)
+
+def _resize(mp):
+    def setup(stack):
+        from services.tiled_resize import resize_lanczos_tiled
+
+        img = _image(mp)
+        size = (img.width * 3 // 2, img.height * 3 // 2)
+        return lambda: resize_lanczos_tiled(img, size, io.BytesIO()), size[0] * size[1] / 1e6, "MP"
+    return setup
+
+def _upscale(mp):
+    def setup(stack):
+        from services.upscale import upscale_lanczos
+
+        img = _image(mp)
+        data = _png(img)
+        return lambda: upscale_lanczos(data, scale=2.0), 4 * img.width * img.height / 1e6, "MP"
+    return setup
+
+def _ppi_probe(mp):
+    def setup(stack):
+        from utils.ppi import ppi_from_image_bytes
+
+        data = _png(_image(mp))
+        calls = 200
+        return lambda: [ppi_from_image_bytes(data, (210, 297)) for _ in range(calls)], calls, "calls"
+    return setup
+
+def _pdf(pages, images):
+    def setup(stack):
+        from utils.ppi import min_effective_ppi_in_pdf
+
+        pdf = synthetic_pdf(pages, images_per_page=images)
+        return lambda: min_effective_ppi_in_pdf(pdf, workers=1), pages, "pages"
+    return setup
+
+def _png(img) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+def _mock(stack) -> None:
+    from benchmarks.mock_server import mock_provider_server
+
+    mock = stack.enter_context(mock_provider_server(latency=MOCK_LATENCY, image_size=(1024, 1024)))
+    os.environ.update(OPENAI_BASE_URL=f"{mock.url}/v1", OPENAI_API_KEY="mock",
+                      REPLICATE_BASE_URL=f"{mock.url}/v1", REPLICATE_API_TOKEN="mock", PROVIDER_RATE_LIMITS="")
+
+def _provider(call, calls=5):
+    def setup(stack):
+        _mock(stack)  # before the import: providers read their URL and key on import
+        fn = call()
+        return lambda: [fn() for _ in range(calls)], calls, "calls"
+    return setup
+
+def _openai_generate():
+    os.environ["RESULT_CACHE_DIR"] = tempfile.mkdtemp()  # read on import of services.cache
+    from services import tasks
+
+    ctx = type("Ctx", (), {"cancelled": False})()
+    # the task path: result cache lookup, scheduler and provider call; refresh forces the round trip
+    return lambda: tasks.generate_openai_task(ctx, "benchmark", "1024x1024", refresh=True)
+
+def _openai_edit():
+    from providers.openai_provider import edit_image_openai
+
+    data = synthetic_png((1024, 1024), seed=2)
+    return lambda: edit_image_openai(data, "benchmark", size="1024x1024")
+
+def _replicate_generate():
+    from providers.replicate_provider import generate_image
+
+    return lambda: generate_image("benchmark", model_name="Flux Kontext Pro", width=1024, height=1024)
+
+def _replicate_upscale():
+    from services.upscale import upscale_replicate
+
+    data = synthetic_png((512, 512), seed=3)
+    return lambda: upscale_replicate(data, model_name="Real-ESRGAN", scale=2)
+
+CASES: Dict[str, Setup] = {
+    **{f"resize_{mp}mp": _resize(mp) for mp in IMAGE_MP},
+    **{f"upscale_lanczos_{mp}mp": _upscale(mp) for mp in IMAGE_MP},
+    **{f"ppi_probe_{mp}mp": _ppi_probe(mp) for mp in IMAGE_MP},
+    **{f"pdf_min_ppi_{p}p_{i}i": _pdf(p, i) for p, i in PDF_SIZES},
+    "openai_generate": _provider(_openai_generate),
+    "openai_edit": _provider(_openai_edit),
+    "replicate_generate": _provider(_replicate_generate),
+    "replicate_upscale": _provider(_replicate_upscale),
+}
+
+def _reset_peak() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")  # peak RSS restarts from the current RSS, i.e. after the inputs were built
+    except OSError:
+        pass
+
+def _iterations(run: Callable[[], object]) -> int:
+    """Warm ``run`` up (imports, lazy clients, first connections), then size a timed run to MIN_RUN_S."""
+    t0 = time.perf_counter()
+    run()
+    if time.perf_counter() - t0 >= MIN_RUN_S:
+        return 1
+    t0 = time.perf_counter()
+    run()
+    return max(1, math.ceil(MIN_RUN_S / max(time.perf_counter() - t0, 1e-6)))
+
+def run_case(name: str, repeat: int) -> dict:
+    """Set up and time one case in this interpreter."""
+    with contextlib.ExitStack() as stack:
+        run, units, unit = CASES[name](stack)
+        iterations = _iterations(run)
+        _reset_peak()
+        base = peak_rss_mb()
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                run()
+            times.append((time.perf_counter() - t0) / iterations)
+        median = statistics.median(times)
+        return {"case": name, "median_s": round(median, 6), "best_s": round(min(times), 6),
+                "iterations": iterations, "throughput": round(units / median, 2), "unit": f"{unit}/s",
+                "peak_mb": round(max(0.0, peak_rss_mb() - base), 1)}
+
+def _subprocess(name: str, repeat: int) -> dict:
+    cmd = [sys.executable, "-m", "benchmarks.suite", "--single", name, "--repeat", str(repeat)]
+    env = {**os.environ, "PYTHONPATH": ROOT, "METRICS_PORT": "0", "PROVIDER_WARMUP": "0"}
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"case": name, "error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def compare(row: dict, base: dict, max_slowdown: float, max_memory_growth: float) -> list:
+    """Regressions of ``row`` against its baseline ``base``, as readable strings."""
+    problems = []
+    if "error" in row:
+        return [f"failed: {row['error']}"]
+    if row["median_s"] > base["median_s"] * (1 + max_slowdown):
+        problems.append(f"time {base['median_s']}s -> {row['median_s']}s (+{row['median_s'] / base['median_s'] - 1:.0%})")
+    limit = base["peak_mb"] * (1 + max_memory_growth) + MEMORY_SLACK_MB
+    if row["peak_mb"] > limit:
+        problems.append(f"peak memory {base['peak_mb']} MB -> {row['peak_mb']} MB")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", default=[], help="Run the cases whose name starts with any of these")
+    parser.add_argument("--save", help="Write the results as a baseline JSON file")
+    parser.add_argument("--baseline", help="Compare against this baseline and exit 1 on regressions")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="Allowed median time increase (0.25 = 25%%)")
+    parser.add_argument("--max-memory-growth", type=float, default=0.25, help="Allowed peak memory increase")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_case(args.single, args.repeat)))
+        return
+    names = [n for n in CASES if not args.only or n.startswith(tuple(args.only))]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    tolerances = baseline.get("tolerances", {})
+    rows, regressions = [], 0
+    for name in names:
+        row = _subprocess(name, args.repeat)
+        base = baseline.get("cases", {}).get(name)
+        if base is not None:
+            tol = tolerances.get(name, {})
+            problems = compare(row, base, tol.get("max_slowdown", args.max_slowdown),
+                               tol.get("max_memory_growth", args.max_memory_growth))
+            row["regressions"] = problems
+            regressions += bool(problems)
+        rows.append(row)
+        print(json.dumps(row))
+
+    if args.save:
+        if not args.baseline and os.path.exists(args.save):
+            with open(args.save) as fh:
+                tolerances = json.load(fh).get("tolerances", {})  # keep hand-set tolerances, replace the results
+        data = {"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": os.cpu_count()},
+                "repeat": args.repeat, "tolerances": tolerances,
+                "cases": {r["case"]: {k: v for k, v in r.items() if k not in ("case", "regressions")}
+                          for r in rows if "error" not in r}}
+        with open(args.save, "w") as fh:
+            json.dump(data, fh, indent=2)
+    failed = regressions or any("error" in r for r in rows)
+    if args.baseline:
+        print(json.dumps({"case": "summary", "cases": len(rows), "regressions": regressions,
+                          "errors": sum("error" in r for r in rows)}))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Process-wide registry of provider clients.
+
+Each client is built on first use, from a factory that also imports the
+backend library, and then shared by every thread, Streamlit session and
+rerun in the process. Nothing heavy is imported until a client is needed.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Connections kept per host by the shared HTTP session
+POOL_MAXSIZE = 16
+
+_FACTORIES: Dict[str, Callable[[], Any]] = {}
+_CLIENTS: Dict[str, Any] = {}
+# one lock per client, so a slow import never blocks callers of another client
+_LOCKS: Dict[str, threading.Lock] = {}
+
+def register_client(name: str):
+    """Register the decorated zero-argument factory as the builder of client ``name``."""
+    def wrap(fn: Callable[[], Any]) -> Callable[[], Any]:
+        _FACTORIES[name] = fn
+        _LOCKS[name] = threading.Lock()
+        return fn
+    return wrap
+
+def get_client(name: str) -> Any:
+    """Return the shared client ``name``, building it on first use."""
+    client = _CLIENTS.get(name)
+    if client is None:
+        with _LOCKS[name]:
+            client = _CLIENTS.get(name)
+            if client is None:
+                client = _CLIENTS[name] = _FACTORIES[name]()
+    return client
+
+def warm_up(names: Optional[Iterable[str]] = None, background: bool = True,
+            delay: float = 0.0) -> Optional[threading.Thread]:
+    """
+    Build clients ahead of their first call so it does not pay the import.
+
+    Args:
+        names: Clients to build (defaults to all registered)
+        background: Build on a daemon thread and return it instead of blocking
+        delay: Seconds the background thread waits first, so the imports do
+            not compete with the page render that triggered the warm-up
+
+    Returns:
+        The warm-up thread when ``background`` is set
+    """
+    names = list(names or _FACTORIES)
+
+    def run():
+        time.sleep(delay)
+        for name in names:
+            try:
+                get_client(name)
+            except Exception:
+                pass  # the first real call reports the error
+    if not background:
+        run()
+        return None
+    t = threading.Thread(target=run, name="client-warm-up", daemon=True)
+    t.start()
+    return t
+
+@register_client("http")
+def _http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    # pooled keep-alive session shared by the synchronous providers, so repeated
+    # calls and result downloads reuse TLS connections
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+@register_client("replicate")
+def _replicate_client():
+    import replicate  # pulls in httpx; the largest import of the app
+
+    # REPLICATE_BASE_URL includes the /v1 prefix, which the client adds itself
+    base_url = os.getenv("REPLICATE_BASE_URL", "").rstrip("/").removesuffix("/v1") or None
+    return replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"), base_url=base_url)
@@ -0,0 +1,83 @@
+import io
+import time
+import uuid
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+from providers.clients import get_client
+
+def get_session():
+    """Return the shared, pooled ``requests.Session`` (see ``providers.clients``)."""
+    return get_client("http")
+
+def cancellable_sleep(seconds: float, cancelled: Optional[Callable[[], bool]], check: float = 0.25) -> bool:
+    """
+    Sleep up to ``seconds`` between attempts or polls, checking ``cancelled``
+    every ``check`` seconds.
+
+    Returns:
+        True as soon as ``cancelled`` does, False once the time is up
+    """
+    end = time.monotonic() + seconds
+    while True:
+        if cancelled is not None and cancelled():
+            return True
+        left = end - time.monotonic()
+        if left <= 0:
+            return False
+        time.sleep(min(left, check))
+
+class MultipartStream(io.RawIOBase):
+    """
+    multipart/form-data body read lazily from its parts.
+
+    ``requests`` builds ``files=`` bodies as one bytes object holding a copy
+    of every file; passing this as ``data=`` instead streams file parts
+    straight from their buffers. It has a known length, so the request is
+    sent with Content-Length rather than chunked encoding.
+
+    Args:
+        fields: (name, value) pairs; value is a string or a
+            (filename, buffer, content_type) tuple for file parts
+    """
+
+    def __init__(self, fields: List[Tuple[str, Union[str, Tuple[str, Any, str]]]]):
+        self.boundary = uuid.uuid4().hex
+        self._parts: List[memoryview] = []
+        for name, value in fields:
+            if isinstance(value, tuple):
+                filename, buf, ctype = value
+                head = (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                        f'filename="{filename}"\r\nContent-Type: {ctype}\r\n\r\n')
+                self._parts += [memoryview(head.encode()), memoryview(buf).cast("B"), memoryview(b"\r\n")]
+            else:
+                head = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                self._parts.append(memoryview(head.encode()))
+        self._parts.append(memoryview(f"--{self.boundary}--\r\n".encode()))
+        self._len = sum(len(p) for p in self._parts)
+        self._idx = self._off = self._pos = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = 0
+        while n < len(b) and self._idx < len(self._parts):
+            part = self._parts[self._idx]
+            take = min(len(b) - n, len(part) - self._off)
+            b[n:n + take] = part[self._off:self._off + take]
+            n += take
+            self._off += take
+            if self._off == len(part):
+                self._idx, self._off = self._idx + 1, 0
+        self._pos += n
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __len__(self) -> int:
+        return self._len
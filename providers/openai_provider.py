@@ -1,30 +1,57 @@
-import os, base64, requests
+import os, base64
+from typing import List, Union
+from providers.http import get_session, MultipartStream
+from utils.image_handle import ImageHandle, UPLOAD_FORMATS
+from utils.metrics import instrument, stage
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 
-def generate_image_openai(prompt: str, size: str="1024x1024") -> bytes:
+# Images per request the Images API accepts (``n``)
+OPENAI_MAX_N = 10
+
+def _generate(prompt: str, size: str, n: int) -> List[bytes]:
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY not set")
-    url = "https://api.openai.com/v1/images/generations"
+    url = f"{OPENAI_BASE_URL}/images/generations"
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
     payload = {"prompt": prompt, "size": size, "response_format": "b64_json"}
-    r = requests.post(url, json=payload, headers=headers, timeout=120)
-    r.raise_for_status()
-    b64 = r.json()["data"][0]["b64_json"]
-    return base64.b64decode(b64)
+    if n > 1:
+        payload["n"] = n
+    with stage("http"):
+        r = get_session().post(url, json=payload, headers=headers, timeout=120)
+        r.raise_for_status()
+    return [base64.b64decode(item["b64_json"]) for item in r.json()["data"]]
+
+@instrument("openai.generate")
+def generate_image_openai(prompt: str, size: str="1024x1024") -> bytes:
+    return _generate(prompt, size, 1)[0]
+
+@instrument("openai.generate_n")
+def generate_images_openai(prompt: str, size: str="1024x1024", n: int = 1) -> List[bytes]:
+    """Up to OPENAI_MAX_N variants of ``prompt`` from a single request."""
+    if not 1 <= n <= OPENAI_MAX_N:
+        raise ValueError(f"n must be between 1 and {OPENAI_MAX_N}")
+    return _generate(prompt, size, n)
 
-def edit_image_openai(image_bytes: bytes, prompt: str, size: str="1024x1024") -> bytes:
+@instrument("openai.edit")
+def edit_image_openai(image_bytes: Union[bytes, ImageHandle], prompt: str, size: str="1024x1024") -> bytes:
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY not set")
-    url = "https://api.openai.com/v1/images/edits"
+    url = f"{OPENAI_BASE_URL}/images/edits"
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-    files = {
-        "image": ("image.png", image_bytes, "image/png"),
-        "prompt": (None, prompt),
-        "size": (None, size),
-        "response_format": (None, "b64_json"),
-    }
-    r = requests.post(url, files=files, headers=headers, timeout=180)
-    r.raise_for_status()
+    # stream the upload from the caller's buffer instead of building the body in memory
+    image = ImageHandle.wrap(image_bytes)
+    upload = image.stream()
+    body = MultipartStream([
+        ("image", (upload.name, image.upload_buffer(), UPLOAD_FORMATS.get(image.format, "image/png"))),
+        ("prompt", prompt),
+        ("size", size),
+        ("response_format", "b64_json"),
+    ])
+    headers["Content-Type"] = body.content_type
+    with stage("http"):
+        r = get_session().post(url, data=body, headers=headers, timeout=180)
+        r.raise_for_status()
     b64 = r.json()["data"][0]["b64_json"]
     return base64.b64decode(b64)
@@ -0,0 +1,152 @@
+"""
+Replicate prediction lifecycle: create, poll, cancel and download.
+
+``replicate.run`` blocks inside the client until the prediction finishes and
+offers no way to stop it, so a job the user cancels keeps running (and
+billing) on Replicate. Here the prediction is created without waiting and
+polled with a backoff that resets whenever its status changes; between polls
+the caller's ``cancelled`` callback is checked and the prediction cancelled
+upstream as soon as it returns True, or when anything interrupts the wait.
+"""
+import base64
+import tempfile
+import time
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from providers.clients import get_client
+from providers.http import cancellable_sleep, get_session
+from utils.metrics import observe_prediction, stage
+
+TERMINAL = ("succeeded", "failed", "canceled")
+
+# Poll delays: start short, grow by POLL_BACKOFF per unchanged poll, capped at POLL_MAX
+# (the cap bounds how long after completion a result can go unnoticed)
+POLL_INITIAL = 0.25
+POLL_BACKOFF = 1.5
+POLL_MAX = 2.0
+# Granularity of the cancellation checks while waiting for the next poll
+CANCEL_CHECK = 0.25
+# Give up (and cancel) a prediction that has not finished after this many seconds
+PREDICTION_TIMEOUT = 900.0
+
+DOWNLOAD_CHUNK = 1 << 20
+DOWNLOAD_TIMEOUT = 120
+
+class PredictionCancelled(RuntimeError):
+    """Raised when a prediction was cancelled on behalf of the caller."""
+
+def _cancel(prediction) -> None:
+    if prediction.status in TERMINAL:
+        return
+    try:
+        prediction.cancel()
+    except Exception:
+        pass  # best effort: the prediction may have finished meanwhile
+
+def create_prediction(model: str, input: Dict[str, Any]):
+    """
+    Submit a prediction without waiting for it.
+
+    Args:
+        model: ``owner/name`` for official models or ``owner/name:version``
+        input: Model input; file objects are uploaded by the client
+
+    Returns:
+        The client's Prediction object, typically still "starting"
+    """
+    client = get_client("replicate")
+    if ":" in model:
+        return client.predictions.create(version=model.split(":", 1)[1], input=input)
+    return client.models.predictions.create(model=model, input=input)
+
+def wait_prediction(prediction, cancelled: Optional[Callable[[], bool]] = None,
+                    timeout: float = PREDICTION_TIMEOUT):
+    """
+    Poll ``prediction`` until it reaches a terminal status.
+
+    Args:
+        prediction: Prediction returned by ``create_prediction``
+        cancelled: Optional callback; when it returns True the prediction is
+            cancelled on Replicate and ``PredictionCancelled`` raised
+        timeout: Seconds before the prediction is cancelled and TimeoutError raised
+
+    Returns:
+        The same prediction, succeeded
+
+    Raises:
+        RuntimeError: If the prediction failed or was cancelled elsewhere
+    """
+    deadline = time.monotonic() + timeout
+    delay, status = POLL_INITIAL, prediction.status
+    try:
+        while prediction.status not in TERMINAL:
+            if cancellable_sleep(min(delay, max(0.0, deadline - time.monotonic())), cancelled, CANCEL_CHECK):
+                _cancel(prediction)
+                raise PredictionCancelled(f"Prediction {prediction.id} cancelled")
+            if time.monotonic() >= deadline:
+                _cancel(prediction)
+                raise TimeoutError(f"Prediction {prediction.id} did not finish in {timeout:.0f}s")
+            prediction.reload()
+            # a status change (starting -> processing) means the end is nearer: poll eagerly again
+            if prediction.status != status:
+                delay, status = POLL_INITIAL, prediction.status
+            else:
+                delay = min(delay * POLL_BACKOFF, POLL_MAX)
+    except BaseException:
+        # interrupted while polling (network error, shutdown): do not leave it running
+        _cancel(prediction)
+        raise
+    observe_prediction(prediction, prediction.model or prediction.version or "")
+    if prediction.status != "succeeded":
+        raise RuntimeError(prediction.error or f"prediction {prediction.status}")
+    return prediction
+
+def run_prediction(model: str, input: Dict[str, Any], cancelled: Optional[Callable[[], bool]] = None,
+                   timeout: float = PREDICTION_TIMEOUT):
+    """``create_prediction`` followed by ``wait_prediction``; returns the succeeded prediction."""
+    return wait_prediction(create_prediction(model, input), cancelled, timeout)
+
+def output_url(prediction, index: int = 0) -> str:
+    """URL of output file ``index`` of a succeeded prediction."""
+    output = prediction.output
+    if isinstance(output, (list, tuple)):
+        return output[index]
+    if isinstance(output, dict):
+        return list(output.values())[index]
+    return output
+
+def download(url: str, out: BinaryIO, chunk_size: int = DOWNLOAD_CHUNK) -> int:
+    """
+    Stream ``url`` into ``out`` chunk by chunk.
+
+    Args:
+        url: HTTP(S) URL, or a ``data:`` URI as some models return
+        out: Writable binary file object
+        chunk_size: Bytes read per chunk
+
+    Returns:
+        Number of bytes written
+    """
+    if url.startswith("data:"):
+        data = base64.b64decode(url.split(",", 1)[1])
+        out.write(data)
+        return len(data)
+    written = 0
+    with get_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size):
+            out.write(chunk)
+            written += len(chunk)
+    return written
+
+def read_output(prediction, index: int = 0) -> bytes:
+    """
+    Download output file ``index`` of a succeeded prediction.
+
+    The body is streamed to a temporary file and read back with a single
+    allocation, instead of holding the received chunks and their join.
+    """
+    with stage("download"), tempfile.TemporaryFile() as fh:
+        download(output_url(prediction, index), fh)
+        fh.seek(0)
+        return fh.read()
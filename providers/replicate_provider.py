@@ -1,13 +1,11 @@
 import os
-import base64
-import replicate
-import requests
-import io
+from typing import Callable, List, Optional, Union
+from providers.predictions import read_output, run_prediction
+from utils.image_handle import ImageHandle
+from utils.metrics import instrument, stage
 
-# Initialize Replicate client
-replicate_client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-# Model configurations
+# Model configurations; an optional "max_outputs" marks models that return several
+# images per prediction through "num_outputs"
 AVAILABLE_MODELS = {
     "Imagen 4": {
         "model": "google/imagen-4",
@@ -41,7 +39,9 @@ AVAILABLE_MODELS = {
     }
 }
 
-def generate_image(prompt: str, model_name: str = "Flux Kontext Pro", width=1024, height=1024) -> bytes:
+@instrument("replicate.generate")
+def generate_image(prompt: str, model_name: str = "Flux Kontext Pro", width=1024, height=1024,
+                   cancelled: Optional[Callable[[], bool]] = None, seed: Optional[int] = None) -> bytes:
     """
     Generate an image using the specified model.
     
@@ -50,6 +50,9 @@ def generate_image(prompt: str, model_name: str = "Flux Kontext Pro", width=1024
         model_name: Name of the model to use (must be in AVAILABLE_MODELS)
         width: Image width in pixels
         height: Image height in pixels
+        cancelled: Optional callback polled while waiting; when it returns
+            True the prediction is cancelled on Replicate
+        seed: Optional seed, for reproducible variants
     
     Returns:
         Image content as bytes
@@ -62,48 +65,73 @@ def generate_image(prompt: str, model_name: str = "Flux Kontext Pro", width=1024
     
     model_config = AVAILABLE_MODELS[model_name]
     input_params = model_config["input_params"](prompt, width, height)
+    if seed is not None:
+        input_params["seed"] = seed
     
     try:
-        # Run the prediction using the replicate library
-        output = replicate_client.run(
-            model_config["model"],
-            input=input_params
-        )
-        
-        # Handle different output formats
-        if hasattr(output, 'read'):
-            # New Replicate API format
-            return output.read()
-        elif hasattr(output, 'url'):
-            # Get URL and download
-            response = requests.get(output.url(), timeout=120)
-            response.raise_for_status()
-            return response.content
-        elif isinstance(output, list):
-            # List of URLs
-            image_url = output[0]
-            response = requests.get(image_url, timeout=120)
-            response.raise_for_status()
-            return response.content
-        else:
-            # Single URL
-            response = requests.get(output, timeout=120)
-            response.raise_for_status()
-            return response.content
+        # Submit the prediction and poll it, so it can be cancelled midway
+        with stage("replicate.run"):
+            prediction = run_prediction(model_config["model"], input_params, cancelled=cancelled)
+        return read_output(prediction)
         
     except Exception as e:
         raise RuntimeError(f"Replicate {model_name} failed: {str(e)}")
 
-def edit_image_replicate(image_bytes: bytes, prompt: str, model_name: str = "Flux Kontext Pro", width=1024, height=1024) -> bytes:
+def max_outputs(model_name: str) -> int:
+    """Images one prediction of ``model_name`` can return (``num_outputs``); 1 unless configured."""
+    return AVAILABLE_MODELS[model_name].get("max_outputs", 1)
+
+@instrument("replicate.generate_n")
+def generate_images(prompt: str, model_name: str = "Flux Kontext Pro", width=1024, height=1024, n: int = 1,
+                    cancelled: Optional[Callable[[], bool]] = None) -> List[bytes]:
+    """
+    Generate ``n`` variants with a single prediction, for models configured
+    with ``max_outputs`` (passed as ``num_outputs``).
+
+    Args:
+        prompt: Text prompt for image generation
+        model_name: Name of the model to use (must be in AVAILABLE_MODELS)
+        width: Image width in pixels
+        height: Image height in pixels
+        n: Number of variants, at most ``max_outputs(model_name)``
+        cancelled: Optional callback polled while waiting; when it returns
+            True the prediction is cancelled on Replicate
+
+    Returns:
+        Image contents as bytes, in output order
+    """
+    if n == 1:
+        return [generate_image(prompt, model_name=model_name, width=width, height=height, cancelled=cancelled)]
+    if not os.getenv("REPLICATE_API_TOKEN"):
+        raise RuntimeError("REPLICATE_API_TOKEN not set")
+    if model_name not in AVAILABLE_MODELS:
+        raise ValueError(f"Model '{model_name}' not available. Choose from: {list(AVAILABLE_MODELS.keys())}")
+    if n > max_outputs(model_name):
+        raise ValueError(f"Model '{model_name}' returns at most {max_outputs(model_name)} images per prediction")
+
+    model_config = AVAILABLE_MODELS[model_name]
+    input_params = {**model_config["input_params"](prompt, width, height), "num_outputs": n}
+    try:
+        with stage("replicate.run"):
+            prediction = run_prediction(model_config["model"], input_params, cancelled=cancelled)
+        return [read_output(prediction, i) for i in range(n)]
+    except Exception as e:
+        raise RuntimeError(f"Replicate {model_name} failed: {str(e)}")
+
+@instrument("replicate.edit")
+def edit_image_replicate(image_bytes: Union[bytes, ImageHandle], prompt: str, model_name: str = "Flux Kontext Pro", width=1024, height=1024,
+                         cancelled: Optional[Callable[[], bool]] = None) -> bytes:
     """
     Edit an image using the specified Replicate model's img2img capabilities.
     
     Args:
-        image_bytes: Input image as bytes
+        image_bytes: Input image as bytes or ImageHandle
         prompt: Text prompt for image editing
         model_name: Name of the model to use for editing (must be in AVAILABLE_MODELS)
         width: Output image width in pixels
         height: Output image height in pixels
+        cancelled: Optional callback polled while waiting; when it returns
+            True the prediction is cancelled on Replicate
     
     Returns:
         Edited image content as bytes
@@ -121,37 +149,15 @@ def edit_image_replicate(image_bytes: bytes, prompt: str, model_name: str = "Flu
         if "edit_params" not in model_config:
             raise ValueError(f"Model '{model_name}' does not support image editing")
         
-        # Create a file-like object from the image bytes
-        image_file = io.BytesIO(image_bytes)
+        # File object over the caller's buffer; the client uploads it as multipart
+        image_file = ImageHandle.wrap(image_bytes).stream()
         
         input_params = model_config["edit_params"](prompt, width, height, image_file)
         
         # Use the selected model for editing
-        output = replicate_client.run(
-            model_config["model"],
-            input=input_params
-        )
-        
-        # Handle different output formats based on the new Replicate API
-        if hasattr(output, 'read'):
-            # New Replicate API format - can read directly
-            return output.read()
-        elif hasattr(output, 'url'):
-            # Has URL method
-            response = requests.get(output.url(), timeout=120)
-            response.raise_for_status()
-            return response.content
-        elif isinstance(output, list):
-            # List of URLs
-            image_url = output[0]
-            response = requests.get(image_url, timeout=120)
-            response.raise_for_status()
-            return response.content
-        else:
-            # Single URL string
-            response = requests.get(output, timeout=120)
-            response.raise_for_status()
-            return response.content
+        with stage("replicate.run"):
+            prediction = run_prediction(model_config["model"], input_params, cancelled=cancelled)
+        return read_output(prediction)
         
     except Exception as e:
         raise RuntimeError(f"Replicate {model_name} image editing failed: {str(e)}")
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from services.scheduler import get_scheduler
+
+# Defaults, overridable through environment variables
+CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "poc-ia-preimpresion-cache"))
+CACHE_MEMORY_MB = float(os.getenv("RESULT_CACHE_MEMORY_MB", "256"))
+CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", "2048"))
+CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", "168"))
+
+def cache_key(provider: str, model: str, params: Dict[str, Any], image_bytes: Optional[bytes] = None) -> str:
+    """
+    Content address for a provider call.
+
+    Args:
+        provider: Provider name, e.g. "openai" or "replicate"
+        model: Model id including version when the provider exposes one
+        params: JSON-serialisable call parameters (prompt, size, scale, ...)
+        image_bytes: Input image, if the call takes one
+
+    Returns:
+        Hex SHA-256 digest identifying the result
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([provider, model, params], sort_keys=True, default=str).encode())
+    if image_bytes is not None:
+        h.update(b"\0image\0")
+        h.update(image_bytes)
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    Two-tier byte cache: an in-memory LRU bounded by total size in front of an
+    on-disk store with TTL expiry and oldest-first eviction.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = CACHE_DIR, max_memory_bytes: int = int(CACHE_MEMORY_MB * 2**20),
+                 max_disk_bytes: int = int(CACHE_DISK_MB * 2**20), ttl_seconds: float = CACHE_TTL_HOURS * 3600):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                      "memory_evicted_bytes": 0, "disk_evicted_bytes": 0, "expired": 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(cache_dir) if e.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _mem_put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_memory_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = value
+        self._mem_bytes += len(value)
+        while self._mem_bytes > self.max_memory_bytes:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+            self.stats["memory_evicted_bytes"] += len(evicted)
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if time.time() - st.st_mtime > self.ttl_seconds:
+            self._disk_remove(path, st.st_size)
+            self.stats["expired"] += 1
+            return None
+        with open(path, "rb") as fh:
+            data = fh.read()
+        os.utime(path, (time.time(), st.st_mtime))  # atime marks recent use for eviction
+        return data
+
+    def _disk_remove(self, path: str, size: int) -> None:
+        try:
+            os.remove(path)
+            self._disk_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def _disk_put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            self._disk_bytes -= os.path.getsize(path)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(value)
+        os.replace(tmp, path)
+        self._disk_bytes += len(value)
+        if self._disk_bytes > self.max_disk_bytes:
+            self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        entries = [e for e in os.scandir(self.cache_dir) if e.is_file() and not e.name.startswith(".tmp-")]
+        now = time.time()
+        # expired entries first, then least recently used
+        entries.sort(key=lambda e: (now - e.stat().st_mtime <= self.ttl_seconds, e.stat().st_atime))
+        for e in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            size = e.stat().st_size
+            self._disk_remove(e.path, size)
+            self.stats["disk_evicted_bytes"] += size
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._mem.get(key)
+            if value is not None:
+                self._mem.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return value
+            if self.cache_dir:
+                value = self._disk_get(key)
+                if value is not None:
+                    self._mem_put(key, value)
+                    self.stats["disk_hits"] += 1
+                    return value
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._mem_put(key, value)
+            if self.cache_dir:
+                self._disk_put(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes]) -> bytes:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus current tier sizes, for display."""
+        with self._lock:
+            return {**self.stats, "memory_bytes": self._mem_bytes, "memory_entries": len(self._mem),
+                    "disk_bytes": self._disk_bytes}
+
+_default_cache: Optional[ResultCache] = None
+_default_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Process-wide cache shared by all Streamlit sessions."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+def cached_call(provider: str, model: str, params: Dict[str, Any], image_bytes: Optional[bytes],
+                compute: Callable[[], bytes], refresh: bool = False,
+                cancelled: Optional[Callable[[], bool]] = None) -> bytes:
+    """
+    Return the cached result for this call, running ``compute`` on a miss.
+
+    Identical calls running at the same time share one ``compute`` (see
+    ``services.scheduler``), so a burst of the same request costs one
+    upstream call even before the first result is stored.
+
+    Args:
+        provider: Provider name used in the cache key
+        model: Model id/version used in the cache key
+        params: Call parameters used in the cache key
+        image_bytes: Input image used in the cache key, if any
+        compute: Zero-argument callable performing the real call
+        refresh: Skip the lookup and overwrite the stored result
+        cancelled: Optional callback checked while waiting for an identical call
+
+    Returns:
+        Result bytes
+    """
+    cache = get_result_cache()
+    key = cache_key(provider, model, params, image_bytes)
+    if not refresh:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    def run():
+        value = compute()
+        cache.put(key, value)
+        return value
+    return get_scheduler().single_flight(key, run, cancelled)
@@ -0,0 +1,120 @@
+"""
+Run one prompt against several models (or seeds) at once.
+
+Every leg is an ordinary provider call made through the shared scheduler
+(``services.scheduler``), so a fan-out obeys the same rate limits and
+per-provider in-flight caps as the background jobs, and reuses the pooled
+keep-alive clients of ``providers.clients``. ``fan_out`` is the asyncio
+interface; it runs the blocking calls on a dedicated thread pool.
+``iter_fan_out`` is the blocking form for Streamlit code and jobs. Both yield
+results in completion order, so a side-by-side comparison costs the slowest
+leg rather than the sum of them. Leaving either early cancels the legs still
+running, their Replicate predictions included.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from providers.openai_provider import generate_image_openai
+from providers.replicate_provider import AVAILABLE_MODELS, generate_image
+from services.scheduler import INTERACTIVE, ProviderScheduler, get_scheduler
+
+# Threads running fan-out legs; the scheduler's in-flight caps decide how many reach a provider at once
+FAN_OUT_THREADS = 32
+
+class Target(NamedTuple):
+    """One leg of a fan-out: a provider/model pair and an optional seed."""
+    provider: str  # "openai" or "replicate"
+    model_name: Optional[str] = None  # key of AVAILABLE_MODELS for Replicate
+    seed: Optional[int] = None  # Replicate only
+
+    @property
+    def label(self) -> str:
+        name = self.model_name or "OpenAI Images"
+        return name if self.seed is None else f"{name} (seed {self.seed})"
+
+Result = Tuple[Target, Union[bytes, Exception]]
+
+def generate(target: Target, prompt: str, width: int = 1024, height: int = 1024, priority: int = INTERACTIVE,
+             cancelled: Optional[Callable[[], bool]] = None, scheduler: Optional[ProviderScheduler] = None) -> bytes:
+    """
+    Generate one image for ``target`` under the scheduler's limits (blocking).
+
+    Args:
+        target: Provider, model and seed
+        prompt: Text prompt
+        width: Image width in pixels
+        height: Image height in pixels
+        priority: Scheduler priority (INTERACTIVE, BATCH)
+        cancelled: Optional callback; when it returns True the call stops waiting
+            and its prediction is cancelled on Replicate
+        scheduler: Scheduler to go through; the process-wide one by default
+
+    Returns:
+        Image content as bytes
+    """
+    scheduler = scheduler or get_scheduler()
+    if target.provider == "openai":
+        if target.seed is not None:
+            raise ValueError("OpenAI Images does not take a seed")
+        return scheduler.call("openai", "images/generations",
+                              lambda: generate_image_openai(prompt, size=f"{width}x{height}"), priority, cancelled)
+    if target.model_name not in AVAILABLE_MODELS:
+        raise ValueError(f"Model '{target.model_name}' not available. Choose from: {list(AVAILABLE_MODELS.keys())}")
+    return scheduler.call("replicate", AVAILABLE_MODELS[target.model_name]["model"],
+                          lambda: generate_image(prompt, model_name=target.model_name, width=width, height=height,
+                                                 cancelled=cancelled, seed=target.seed),
+                          priority, cancelled)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FAN_OUT_THREADS, thread_name_prefix="fan-out")
+        return _executor
+
+def _leg(target: Target, prompt: str, width: int, height: int, priority: int, stop: threading.Event,
+         scheduler: Optional[ProviderScheduler]) -> Result:
+    try:
+        return target, generate(target, prompt, width, height, priority, stop.is_set, scheduler)
+    except Exception as e:
+        return target, e
+
+async def fan_out(prompt: str, targets: List[Target], width: int = 1024, height: int = 1024,
+                  priority: int = INTERACTIVE, scheduler: Optional[ProviderScheduler] = None) -> AsyncIterator[Result]:
+    """
+    Run ``prompt`` against all ``targets`` concurrently.
+
+    Yields:
+        (target, image bytes or the exception it raised), in completion order
+    """
+    loop, stop = asyncio.get_running_loop(), threading.Event()
+    futures = [loop.run_in_executor(_get_executor(), _leg, t, prompt, width, height, priority, stop, scheduler)
+               for t in targets]
+    try:
+        for fut in asyncio.as_completed(futures):
+            yield await fut
+    finally:
+        # when the consumer stops early, the legs still running give up and cancel their predictions
+        stop.set()
+
+def iter_fan_out(prompt: str, targets: List[Target], width: int = 1024, height: int = 1024,
+                 priority: int = INTERACTIVE, scheduler: Optional[ProviderScheduler] = None) -> Iterator[Result]:
+    """
+    Blocking counterpart of ``fan_out``; closing the iterator early (e.g. a
+    Streamlit rerun) cancels the legs still running.
+
+    Yields:
+        (target, image bytes or the exception it raised), in completion order
+    """
+    stop = threading.Event()
+    futures = [_get_executor().submit(_leg, t, prompt, width, height, priority, stop, scheduler) for t in targets]
+    try:
+        for fut in as_completed(futures):
+            yield fut.result()
+    finally:
+        stop.set()
@@ -0,0 +1,619 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from utils.metrics import annotate, capture, instrument
+
+# Backend selection, overridable through environment variables
+JOB_BACKEND = os.getenv("JOB_BACKEND", "thread")  # "thread" or "sqlite"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs are dropped after this many hours, or earlier, least recently read
+# first, while their results take more than JOB_RESULTS_MB
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_RESULTS_MB = float(os.getenv("JOB_RESULTS_MB", "512"))
+# SQLite backend: a running job whose process has not renewed its lease for this long is requeued
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.path.expanduser("~"), ".cache", "poc-ia-preimpresion", "jobs",
+                                                   "jobs.sqlite3"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Finished jobs kept for the latency percentiles
+METRICS_WINDOW = 200
+
+TASKS: Dict[str, Callable[..., Any]] = {}
+
+def register_task(name: str):
+    """Decorator registering a job function under ``name``; it receives a ``JobContext`` first."""
+    def deco(fn):
+        TASKS[name] = fn
+        return fn
+    return deco
+
+class JobCancelled(Exception):
+    pass
+
+class Job(NamedTuple):
+    id: str
+    kind: str
+    status: str
+    progress: float
+    message: str
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+    error: Optional[str]
+
+class JobContext:
+    """Handed to task functions to report progress and observe cancellation."""
+
+    def __init__(self, backend: "JobBackend", job_id: str):
+        self._backend = backend
+        self.job_id = job_id
+
+    @property
+    def cancelled(self) -> bool:
+        return self._backend._cancel_requested(self.job_id)
+
+    def check(self) -> None:
+        """Raise ``JobCancelled`` if the user cancelled this job."""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, fraction: float, message: str = "", partial: Any = None) -> None:
+        """
+        Report progress, then raise ``JobCancelled`` if the user cancelled.
+
+        ``partial``, if given, is the result so far (JSON-like values and
+        bytes), which pollers read with ``partial()`` while the job runs.
+        """
+        self._backend._set_progress(self.job_id, min(max(fraction, 0.0), 1.0), message, partial)
+        self.check()
+
+def _result_size(value: Any) -> int:
+    # bytes held by a result; other scalars are negligible next to images
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_result_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_result_size(v) for v in value)
+    return 0
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+class JobBackend(ABC):
+    """Interface shared by the job queue backends."""
+
+    @abstractmethod
+    def submit(self, kind: str, params: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+        """Queue a job and return its id; with ``dedupe_key``, an identical live job's id instead."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Current state of a job, or None if unknown."""
+
+    @abstractmethod
+    def result(self, job_id: str) -> Any:
+        """Result of a succeeded job, or None."""
+
+    @abstractmethod
+    def partial(self, job_id: str) -> Any:
+        """Latest partial result reported by a running job, or None."""
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation; False if the job is unknown or already finished."""
+
+    @abstractmethod
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, status counts and latency percentiles."""
+
+    @abstractmethod
+    def _cancel_requested(self, job_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _set_progress(self, job_id: str, fraction: float, message: str, partial: Any = None) -> None:
+        ...
+
+    def _execute(self, job_id: str, kind: str, params: Dict[str, Any]):
+        """Run a task; returns (status, result, error)."""
+        # "profile" is not a task argument: it turns on cProfile/tracemalloc for this job
+        params = dict(params)
+        profile = params.pop("profile", False)
+        def run(**kwargs):
+            annotate(job_id=job_id)
+            return TASKS[kind](JobContext(self, job_id), **kwargs)
+        try:
+            with capture(profile):
+                result = instrument(f"job.{kind}")(run)(**params)
+            if self._cancel_requested(job_id):
+                return CANCELLED, None, None
+            return SUCCEEDED, result, None
+        except JobCancelled:
+            return CANCELLED, None, None
+        except Exception as e:
+            # a task stopped by its cancel check may surface it as any error (e.g. a cancelled prediction)
+            if self._cancel_requested(job_id):
+                return CANCELLED, None, None
+            return FAILED, None, str(e) or type(e).__name__
+
+class ThreadJobBackend(JobBackend):
+    """
+    In-process queue on a thread pool. Jobs and results are shared by all
+    sessions, so Streamlit reruns of any session can pick them up, until
+    ``retention`` seconds after they finished or, when results exceed
+    ``max_result_bytes``, until they are the least recently read.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, retention: float = JOB_RETENTION_HOURS * 3600,
+                 max_result_bytes: int = int(JOB_RESULTS_MB * 2**20)):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._results: Dict[str, Any] = {}
+        self._partial: Dict[str, Any] = {}
+        self._cancel: set = set()
+        self._dedupe: Dict[str, str] = {}
+        self._keys: Dict[str, str] = {}  # job id -> its dedupe key
+        self._finished: "OrderedDict[str, int]" = OrderedDict()  # job id -> result bytes, least recently read first
+        self._result_bytes = 0
+        self.retention, self.max_result_bytes = retention, max_result_bytes
+        self._latencies: deque = deque(maxlen=METRICS_WINDOW)
+
+    def submit(self, kind: str, params: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+        if kind not in TASKS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        with self._lock:
+            self._prune()
+            existing = self._dedupe.get(dedupe_key) if dedupe_key else None
+            if existing and self._jobs[existing].status not in (FAILED, CANCELLED):
+                return existing
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = Job(job_id, kind, QUEUED, 0.0, "", time.time(), None, None, None)
+            if dedupe_key:
+                self._dedupe[dedupe_key] = job_id
+                self._keys[job_id] = dedupe_key
+        self._pool.submit(self._run, job_id, kind, params)
+        return job_id
+
+    def _finish(self, job_id: str, result: Any = None) -> None:
+        # called with the lock held, once the job reached a final status
+        size = _result_size(result)
+        self._partial.pop(job_id, None)
+        if result is not None:
+            self._results[job_id] = result
+        self._finished[job_id] = size
+        self._result_bytes += size
+        self._prune()
+
+    def _drop(self, job_id: str) -> None:
+        self._result_bytes -= self._finished.pop(job_id)
+        self._jobs.pop(job_id, None)
+        self._results.pop(job_id, None)
+        self._cancel.discard(job_id)
+        key = self._keys.pop(job_id, None)
+        if key is not None and self._dedupe.get(key) == job_id:
+            del self._dedupe[key]
+
+    def _prune(self) -> None:
+        # called with the lock held
+        expired = time.time() - self.retention
+        for job_id in [j for j in self._finished if self._jobs[j].finished < expired]:
+            self._drop(job_id)
+        while self._result_bytes > self.max_result_bytes and self._finished:
+            self._drop(next(iter(self._finished)))
+
+    def _update(self, job_id: str, **fields) -> Job:
+        with self._lock:
+            job = self._jobs[job_id]._replace(**fields)
+            self._jobs[job_id] = job
+            return job
+
+    def _run(self, job_id: str, kind: str, params: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return  # cancelled while queued, and maybe already pruned
+            self._jobs[job_id] = job._replace(status=RUNNING, started=time.time())
+        status, result, error = self._execute(job_id, kind, params)
+        job = self._update(job_id, status=status, error=error, finished=time.time(),
+                           progress=1.0 if status == SUCCEEDED else self._jobs[job_id].progress)
+        with self._lock:
+            self._finish(job_id, result if status == SUCCEEDED else None)
+        self._latencies.append((job.started - job.created, job.finished - job.started))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result(self, job_id: str) -> Any:
+        with self._lock:
+            if job_id in self._results:
+                self._finished.move_to_end(job_id)
+            return self._results.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            self._cancel.add(job_id)
+            if job.status == QUEUED:
+                self._jobs[job_id] = job._replace(status=CANCELLED, finished=time.time())
+                self._finish(job_id)
+            return True
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        return job_id in self._cancel
+
+    def partial(self, job_id: str) -> Any:
+        with self._lock:
+            return self._partial.get(job_id)
+
+    def _set_progress(self, job_id: str, fraction: float, message: str, partial: Any = None) -> None:
+        with self._lock:
+            self._jobs[job_id] = self._jobs[job_id]._replace(progress=fraction, message=message)
+            if partial is not None:
+                self._partial[job_id] = partial
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            lat = list(self._latencies)
+        return _metrics(counts, [w for w, _ in lat], [r for _, r in lat])
+
+def _metrics(counts: Dict[str, int], waits: List[float], runs: List[float]) -> Dict[str, Any]:
+    return {
+        "queue_depth": counts.get(QUEUED, 0),
+        "running": counts.get(RUNNING, 0),
+        "counts": counts,
+        "wait_s_p50": _percentile(waits, 0.5), "wait_s_p95": _percentile(waits, 0.95),
+        "run_s_p50": _percentile(runs, 0.5), "run_s_p95": _percentile(runs, 0.95),
+    }
+
+def _private_dir(path: str) -> str:
+    """Create ``path`` readable by this user only; refuse a directory owned by someone else."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, "getuid"):
+        st = os.stat(path)
+        if st.st_uid != os.getuid():
+            raise PermissionError(f"Job directory {path} is owned by another user")
+        if st.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+def _encode(value: Any, blobs: List[bytes]) -> Any:
+    # JSON-ready copy of ``value``: bytes are moved to ``blobs`` and tuples are marked, so both survive a round trip
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        blobs.append(bytes(value))
+        return {"__blob__": len(blobs) - 1}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, blobs) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, blobs) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v, blobs) for k, v in value.items()}
+    return value
+
+def _decode(value: Any, blob: Callable[[int], bytes]) -> Any:
+    if isinstance(value, list):
+        return [_decode(v, blob) for v in value]
+    if isinstance(value, dict):
+        if set(value) == {"__blob__"}:
+            return blob(int(value["__blob__"]))
+        if set(value) == {"__tuple__"}:
+            return tuple(_decode(v, blob) for v in value["__tuple__"])
+        return {k: _decode(v, blob) for k, v in value.items()}
+    return value
+
+class SQLiteJobBackend(JobBackend):
+    """
+    Queue stored in a SQLite file so several Streamlit processes share it.
+
+    Every process starts ``workers`` polling threads that atomically claim the
+    oldest queued job. Parameters and results are stored as JSON, with their
+    bytes values in per-job files next to the database, so a job submitted by
+    one process can be executed and read by any other. The database directory
+    is private to the user (mode 0700) and nothing read from it is unpickled.
+
+    Running jobs hold a lease that a heartbeat thread renews every third of
+    ``lease`` seconds. When a process dies, its jobs' leases expire: they are
+    no longer offered to dedupe and are requeued (at startup and while
+    polling), or failed after ``MAX_ATTEMPTS`` claims.
+    """
+
+    POLL_INTERVAL = 0.25
+    MAX_ATTEMPTS = 3
+    # Bumped when the table layout changes; older tables are dropped
+    SCHEMA_VERSION = 5
+    # Seconds between two retention sweeps of one process
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, path: str = JOB_DB_PATH, workers: int = JOB_WORKERS, lease: float = JOB_LEASE_SECONDS,
+                 retention: float = JOB_RETENTION_HOURS * 3600, max_result_bytes: int = int(JOB_RESULTS_MB * 2**20)):
+        self.path = path
+        self.lease = lease
+        self.retention, self.max_result_bytes = retention, max_result_bytes
+        self.blob_dir = os.path.join(_private_dir(os.path.dirname(os.path.abspath(path))), "blobs")
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._running: Dict[str, int] = {}  # job id -> attempt, for this process's workers
+        self._running_lock = threading.Lock()
+        self._next_requeue = self._next_prune = 0.0
+        with self._conn() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS jobs")  # pickled params/results of an older version
+                db.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT, dedupe_key TEXT,
+                status TEXT NOT NULL, progress REAL DEFAULT 0, message TEXT DEFAULT '',
+                result TEXT, error TEXT, cancel_requested INTEGER DEFAULT 0,
+                created REAL NOT NULL, started REAL, finished REAL,
+                heartbeat REAL, attempts INTEGER DEFAULT 0, accessed REAL, result_bytes INTEGER DEFAULT 0,
+                partial TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs(dedupe_key)")
+        self._requeue_stale()
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f"sqlite-job-{i}")
+                         for i in range(workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, daemon=True, name="sqlite-job-heartbeat"))
+        for t in self._threads:
+            t.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _dump(self, job_id: str, prefix: str, value: Any) -> str:
+        # JSON for the table; bytes values go to <blob_dir>/<job id>/<prefix><n>
+        blobs: List[bytes] = []
+        text = json.dumps(_encode(value, blobs))
+        if blobs:
+            folder = os.path.join(self.blob_dir, job_id)
+            os.makedirs(folder, exist_ok=True)
+            for i, data in enumerate(blobs):
+                fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(data)
+                os.replace(tmp, os.path.join(folder, f"{prefix}{i}"))
+        return text
+
+    def _load(self, job_id: str, prefix: str, text: str) -> Any:
+        def blob(i: int) -> bytes:
+            with open(os.path.join(self.blob_dir, job_id, f"{prefix}{i}"), "rb") as fh:
+                return fh.read()
+        return _decode(json.loads(text), blob)
+
+    def submit(self, kind: str, params: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+        if kind not in TASKS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        db = self._conn()
+        job_id = None
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe_key:
+                # a running job with an expired lease belongs to a dead process: do not attach to it
+                row = db.execute("SELECT id FROM jobs WHERE dedupe_key=? AND status NOT IN (?, ?) "
+                                 "AND NOT (status=? AND heartbeat < ?) ORDER BY created DESC LIMIT 1",
+                                 (dedupe_key, FAILED, CANCELLED, RUNNING, time.time() - self.lease)).fetchone()
+                if row:
+                    db.execute("COMMIT")
+                    return row[0]
+            job_id = uuid.uuid4().hex
+            db.execute("INSERT INTO jobs (id, kind, params, dedupe_key, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+                       (job_id, kind, self._dump(job_id, "p", params), dedupe_key, QUEUED, time.time()))
+            db.execute("COMMIT")
+            return job_id
+        except Exception:
+            db.execute("ROLLBACK")
+            if job_id is not None:
+                shutil.rmtree(os.path.join(self.blob_dir, job_id), ignore_errors=True)
+            raise
+
+    def _requeue_stale(self) -> None:
+        """Requeue running jobs whose lease expired; cancel or fail them instead when due."""
+        now = time.time()
+        stale = "status=? AND heartbeat < ?"
+        db = self._conn()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(f"UPDATE jobs SET status=?, finished=? WHERE {stale} AND cancel_requested=1",
+                       (CANCELLED, now, RUNNING, now - self.lease))
+            db.execute(f"UPDATE jobs SET status=?, finished=?, error=? WHERE {stale} AND attempts >= ?",
+                       (FAILED, now, "Worker lost", RUNNING, now - self.lease, self.MAX_ATTEMPTS))
+            db.execute(f"UPDATE jobs SET status=?, started=NULL, progress=0, message='' WHERE {stale}",
+                       (QUEUED, RUNNING, now - self.lease))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        self._next_requeue = now + self.lease / 3
+
+    def _prune(self) -> None:
+        """Delete finished jobs past the retention, then the least recently read beyond the size cap."""
+        now = time.time()
+        self._next_prune = now + self.PRUNE_INTERVAL
+        db = self._conn()
+        rows = db.execute("SELECT id, finished, result_bytes FROM jobs WHERE status IN (?, ?, ?) "
+                          "ORDER BY COALESCE(accessed, finished) DESC", FINISHED).fetchall()
+        drop, kept = [], 0
+        for job_id, finished, size in rows:
+            kept += size or 0
+            if finished < now - self.retention or kept > self.max_result_bytes:
+                drop.append(job_id)
+                kept -= size or 0
+        for i in range(0, len(drop), 500):
+            chunk = drop[i:i + 500]
+            db.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        for job_id in drop:
+            shutil.rmtree(os.path.join(self.blob_dir, job_id), ignore_errors=True)
+
+    def _claim(self):
+        if time.time() >= self._next_requeue:
+            self._requeue_stale()
+        if time.time() >= self._next_prune:
+            self._prune()
+        db = self._conn()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT id, kind, params, attempts + 1 FROM jobs WHERE status=? ORDER BY created LIMIT 1",
+                             (QUEUED,)).fetchone()
+            if row:
+                now = time.time()
+                db.execute("UPDATE jobs SET status=?, started=?, heartbeat=?, attempts=? WHERE id=?",
+                           (RUNNING, now, now, row[3], row[0]))
+            db.execute("COMMIT")
+            return row
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _heartbeat(self) -> None:
+        # renews the lease of every job this process is running
+        while not self._stop.wait(self.lease / 3):
+            with self._running_lock:
+                running = list(self._running.items())
+            try:
+                self._conn().executemany("UPDATE jobs SET heartbeat=? WHERE id=? AND attempts=? AND status=?",
+                                         [(time.time(), job_id, attempt, RUNNING) for job_id, attempt in running])
+            except sqlite3.OperationalError:
+                pass  # busy: the lease has two more beats before it expires
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.OperationalError:
+                row = None  # database busy under another process's write
+            if row is None:
+                self._stop.wait(self.POLL_INTERVAL)
+                continue
+            job_id, kind, params, attempt = row
+            with self._running_lock:
+                self._running[job_id] = attempt
+            try:
+                self._run(job_id, kind, params, attempt)
+            finally:
+                with self._running_lock:
+                    del self._running[job_id]
+
+    def _run(self, job_id: str, kind: str, params: str, attempt: int) -> None:
+        if kind not in TASKS:
+            status, result, error = FAILED, None, f"Unknown job kind '{kind}'"
+        else:
+            try:
+                params = self._load(job_id, "p", params)
+            except (ValueError, OSError) as e:
+                status, result, error = FAILED, None, f"Parameters cannot be read: {e}"
+            else:
+                status, result, error = self._execute(job_id, kind, params)
+        size = 0
+        if status == SUCCEEDED:
+            try:
+                size = _result_size(result)
+                result = self._dump(job_id, "r", result)
+                size += len(result)
+            except (TypeError, ValueError, OSError) as e:
+                status, result, error = FAILED, None, f"Result cannot be stored: {e}"
+        # ``attempts`` guards against a run whose lease expired and was claimed again meanwhile
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE jobs SET status=?, result=?, error=?, finished=?, accessed=?, result_bytes=?, params=NULL, "
+            "partial=NULL, progress=CASE WHEN ?=? THEN 1 ELSE progress END WHERE id=? AND attempts=? AND status=?",
+            (status, result if status == SUCCEEDED else None, error, now, now, size,
+             status, SUCCEEDED, job_id, attempt, RUNNING))
+        if cur.rowcount:
+            folder = os.path.join(self.blob_dir, job_id)
+            for name in os.listdir(folder) if os.path.isdir(folder) else ():
+                if name.startswith(("p", "s")):
+                    os.unlink(os.path.join(folder, name))  # inputs and partial results are not needed any more
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute("SELECT id, kind, status, progress, message, created, started, finished, error "
+                                   "FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return Job(*row) if row else None
+
+    def result(self, job_id: str) -> Any:
+        db = self._conn()
+        row = db.execute("SELECT result, accessed FROM jobs WHERE id=? AND status=?", (job_id, SUCCEEDED)).fetchone()
+        if not row or row[0] is None:
+            return None
+        now = time.time()
+        if now - (row[1] or 0) > self.PRUNE_INTERVAL:
+            db.execute("UPDATE jobs SET accessed=? WHERE id=?", (now, job_id))  # coarse: reads happen on every rerun
+        return self._load(job_id, "r", row[0])
+
+    def cancel(self, job_id: str) -> bool:
+        db = self._conn()
+        now = time.time()
+        cur = db.execute("UPDATE jobs SET status=?, finished=?, cancel_requested=1 WHERE id=? AND status=?",
+                         (CANCELLED, now, job_id, QUEUED))
+        if cur.rowcount:
+            return True
+        cur = db.execute("UPDATE jobs SET cancel_requested=1 WHERE id=? AND status=?", (job_id, RUNNING))
+        return bool(cur.rowcount)
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        row = self._conn().execute("SELECT cancel_requested FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def partial(self, job_id: str) -> Any:
+        row = self._conn().execute("SELECT partial FROM jobs WHERE id=? AND status=?", (job_id, RUNNING)).fetchone()
+        return self._load(job_id, "s", row[0]) if row and row[0] is not None else None
+
+    def _set_progress(self, job_id: str, fraction: float, message: str, partial: Any = None) -> None:
+        if partial is None:
+            self._conn().execute("UPDATE jobs SET progress=?, message=? WHERE id=?", (fraction, message, job_id))
+        else:
+            self._conn().execute("UPDATE jobs SET progress=?, message=?, partial=? WHERE id=?",
+                                 (fraction, message, self._dump(job_id, "s", partial), job_id))
+
+    def metrics(self) -> Dict[str, Any]:
+        db = self._conn()
+        counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        rows = db.execute("SELECT started - created, finished - started FROM jobs WHERE status IN (?, ?, ?) "
+                          "AND started IS NOT NULL ORDER BY finished DESC LIMIT ?",
+                          (*FINISHED, METRICS_WINDOW)).fetchall()
+        return _metrics(counts, [w for w, _ in rows], [r for _, r in rows])
+
+    def close(self) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+_queue: Optional[JobBackend] = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobBackend:
+    """Process-wide job queue, backend chosen by ``JOB_BACKEND``."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            import services.tasks  # noqa: F401  registers the app's job kinds
+            if JOB_BACKEND == "sqlite":
+                _queue = SQLiteJobBackend()
+            else:
+                _queue = ThreadJobBackend()
+        return _queue
@@ -0,0 +1,242 @@
+"""
+On-demand PDF renders for inspecting PPI results: page thumbnails, page
+previews and zoomed clips of single image placements.
+
+Renders are PNG-encoded and kept in a process-wide LRU bounded by total bytes
+and keyed by (document hash, page, clip, dpi), so every session browsing the
+same job shares them. One background thread renders what the viewer is
+likely to ask for next; a new prefetch request replaces the pending one, as
+the user has moved on by then. MuPDF is not thread-safe, so all document
+access goes through a single lock, held for one render at a time; a view
+passes the loader of its document so that one closed by another session is
+reopened under that lock before rendering.
+"""
+import os
+import math
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from utils.metrics import PDF_RENDER_CACHE, PDF_RENDER_SECONDS
+from utils.ppi import _fitz, _open_pdf
+
+# Defaults, overridable through environment variables
+RENDER_CACHE_MB = float(os.getenv("PDF_RENDER_CACHE_MB", "192"))
+# Documents kept open for rendering; each holds its PDF bytes
+OPEN_DOCUMENTS = 4
+# A render above this many pixels is produced at a proportionally lower dpi
+MAX_RENDER_PIXELS = 12_000_000
+THUMB_DPI = 24
+PAGE_DPI = 96
+# Views prefetched after the current one in browsing order
+PREFETCH_AHEAD = 3
+
+Clip = Tuple[float, float, float, float]
+
+class RenderKey(NamedTuple):
+    doc: str  # document_id()
+    page: int  # 0-based
+    clip: Optional[Clip]  # bbox in points, None for the whole page
+    dpi: int
+
+def document_id(pdf_bytes: bytes) -> str:
+    """Content hash identifying a PDF in the render cache."""
+    return hashlib.sha256(pdf_bytes).hexdigest()[:32]
+
+def render_key(doc: str, page: int, clip: Optional[Sequence[float]] = None, dpi: int = PAGE_DPI) -> RenderKey:
+    # rounded so that bboxes coming back from JSON results hit the same entry
+    return RenderKey(doc, page, tuple(round(v, 1) for v in clip) if clip else None, int(dpi))
+
+class PdfRenderCache:
+    """
+    Byte-bounded LRU of page renders with a background prefetcher.
+
+    Args:
+        max_bytes: Budget for the encoded renders; 0 disables caching
+        open_documents: Documents kept open, least recently used closed first
+    """
+
+    def __init__(self, max_bytes: int = int(RENDER_CACHE_MB * 2**20), open_documents: int = OPEN_DOCUMENTS):
+        self.max_bytes = max_bytes
+        self.open_documents = open_documents
+        self._renders: "OrderedDict[RenderKey, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._docs: "OrderedDict[str, Any]" = OrderedDict()
+        self._prefetched = set()  # rendered ahead and not requested yet
+        self._pending: Deque[RenderKey] = deque()
+        self._lock = threading.Lock()  # cache state
+        self._wake = threading.Condition(self._lock)
+        self._mupdf = threading.Lock()  # document access and rendering
+        self._worker: Optional[threading.Thread] = None
+        self.stats = {"hits": 0, "misses": 0, "prefetched": 0, "prefetch_hits": 0, "evicted_bytes": 0}
+
+    def open(self, doc: str, load: Callable[[], bytes]) -> None:
+        """Make document ``doc`` available for rendering, calling ``load`` for its bytes if it is not open."""
+        with self._mupdf:
+            self._open(doc, load)
+
+    def _open(self, doc: str, load: Callable[[], bytes]) -> Any:
+        # called with the MuPDF lock held
+        if doc in self._docs:
+            self._docs.move_to_end(doc)
+            return self._docs[doc]
+        self._docs[doc] = opened = _open_pdf(load())
+        while len(self._docs) > self.open_documents:
+            self._docs.popitem(last=False)[1].close()
+        return opened
+
+    def page_count(self, doc: str) -> int:
+        with self._mupdf:
+            return self._docs[doc].page_count
+
+    def _put(self, key: RenderKey, value: bytes) -> None:
+        if len(value) > self.max_bytes or key in self._renders:
+            return
+        self._renders[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            old, evicted = self._renders.popitem(last=False)
+            self._prefetched.discard(old)
+            self._bytes -= len(evicted)
+            self.stats["evicted_bytes"] += len(evicted)
+
+    def _lookup(self, key: RenderKey, prefetch: bool) -> Optional[bytes]:
+        value = self._renders.get(key)
+        if value is not None and not prefetch:
+            self._renders.move_to_end(key)
+            self.stats["hits"] += 1
+            if key in self._prefetched:
+                self._prefetched.discard(key)
+                self.stats["prefetch_hits"] += 1
+            PDF_RENDER_CACHE.inc(result="hit")
+        return value
+
+    def _render(self, key: RenderKey, load: Optional[Callable[[], bytes]] = None) -> bytes:
+        # called with the MuPDF lock held
+        fitz = _fitz()
+        doc = self._open(key.doc, load) if load else self._docs.get(key.doc)
+        if doc is None:
+            raise KeyError(f"PDF {key.doc} is not open")
+        page = doc[key.page]
+        clip = (fitz.Rect(key.clip) & page.rect) if key.clip else page.rect
+        if clip.is_empty:
+            raise ValueError(f"Clip {key.clip} is outside page {key.page + 1}")
+        zoom = key.dpi / 72.0
+        pixels = clip.width * clip.height * zoom * zoom
+        if pixels > MAX_RENDER_PIXELS:
+            zoom *= math.sqrt(MAX_RENDER_PIXELS / pixels)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False).tobytes("png")
+
+    def _get(self, key: RenderKey, prefetch: bool = False, load: Optional[Callable[[], bytes]] = None) -> bytes:
+        with self._lock:
+            value = self._lookup(key, prefetch)
+        if value is not None:
+            return value
+        with self._mupdf:
+            # the prefetcher (or another session) may have rendered it while we waited
+            with self._lock:
+                value = self._lookup(key, prefetch)
+            if value is not None:
+                return value
+            t0 = time.perf_counter()
+            value = self._render(key, load)
+            PDF_RENDER_SECONDS.observe(time.perf_counter() - t0, source="prefetch" if prefetch else "view")
+        with self._lock:
+            if prefetch:
+                self.stats["prefetched"] += 1
+                self._prefetched.add(key)
+            else:
+                self.stats["misses"] += 1
+                PDF_RENDER_CACHE.inc(result="miss")
+            self._put(key, value)
+        return value
+
+    def render(self, doc: str, page: int, clip: Optional[Sequence[float]] = None, dpi: int = PAGE_DPI,
+               load: Optional[Callable[[], bytes]] = None) -> bytes:
+        """
+        PNG of page ``page`` (0-based) of a document, from the cache when possible.
+
+        Args:
+            doc: ``document_id`` of a document passed to ``open``
+            page: Page number, 0-based
+            clip: Optional bbox in points (e.g. a placement's ``bbox``); the whole page otherwise
+            dpi: Render resolution, lowered if the result would exceed MAX_RENDER_PIXELS
+            load: Returns the PDF bytes; with it the document is (re)opened if needed, in the
+                same critical section as the render, so another session cannot close it in between
+
+        Returns:
+            PNG bytes
+
+        Raises:
+            KeyError: If the document is not open and no ``load`` is given
+        """
+        return self._get(render_key(doc, page, clip, dpi), load=load)
+
+    def prefetch(self, keys: Iterable[RenderKey]) -> None:
+        """Render ``keys`` in the background, in order, dropping any earlier prefetch still pending."""
+        with self._lock:
+            self._pending.clear()
+            self._pending.extend(k for k in keys if k not in self._renders)
+            if self._pending and self.max_bytes > 0:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._prefetch_loop, name="pdf-prefetch", daemon=True)
+                    self._worker.start()
+                self._wake.notify()
+
+    def _prefetch_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wake.wait()
+                key = self._pending.popleft()
+            try:
+                self._get(key, prefetch=True)
+            except Exception:
+                pass  # document closed or page gone: the view will report it if it is ever asked for
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus current size, for display."""
+        with self._lock:
+            return {**self.stats, "bytes": self._bytes, "entries": len(self._renders),
+                    "pending": len(self._pending), "open_documents": len(self._docs)}
+
+def browse_keys(doc: str, order: Sequence[int], current: int, clips: Dict[int, List[Clip]],
+                page_dpi: int = PAGE_DPI, clip_dpi: int = 300, ahead: int = PREFETCH_AHEAD,
+                thumbs: Sequence[int] = ()) -> List[RenderKey]:
+    """
+    Renders to prefetch while page ``current`` is on screen, most likely first.
+
+    Args:
+        doc: ``document_id`` of the document being browsed
+        order: Pages in browsing order (all pages, or only the flagged ones)
+        current: Page on screen
+        clips: Placement bboxes shown zoomed, per page
+        page_dpi: Resolution of the page previews
+        clip_dpi: Resolution of the zoomed clips
+        ahead: Pages prefetched after ``current``; the previous one is added last
+        thumbs: Pages of the next thumbnail strip
+
+    Returns:
+        Keys for ``PdfRenderCache.prefetch``
+    """
+    i = order.index(current) if current in order else -1
+    pages = list(order[i + 1:i + 1 + ahead]) + (list(order[i - 1:i]) if i > 0 else [])
+    keys = []
+    for p in pages:
+        keys.append(render_key(doc, p, None, page_dpi))
+        keys.extend(render_key(doc, p, c, clip_dpi) for c in clips.get(p, []))
+    keys.extend(render_key(doc, p, None, THUMB_DPI) for p in thumbs)
+    return keys
+
+_default_cache: Optional[PdfRenderCache] = None
+_default_lock = threading.Lock()
+
+def get_render_cache() -> PdfRenderCache:
+    """Process-wide render cache shared by all Streamlit sessions."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = PdfRenderCache()
+        return _default_cache
@@ -0,0 +1,209 @@
+"""
+Batch preflight: effective-PPI check of every asset in a folder or ZIP.
+
+Usage: python -m services.preflight ASSETS [--target A4=210x297@300 ...] [--format csv|jsonl] [--out FILE]
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, TextIO
+
+from utils.image_probe import probe_image
+from utils.ppi import iter_effective_ppi_in_pdf
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".webp"}
+PDF_EXTS = {".pdf"}
+# Files handed to each worker per task. Raster checks only parse headers, so
+# tasks must be large enough to amortise the round trip to the worker.
+FILES_PER_TASK = 32
+DEFAULT_MIN_PPI = 300
+
+REPORT_FIELDS = ["file", "kind", "target", "pixels", "dpi", "mode", "icc", "pages", "ppi", "min_ppi", "status", "detail"]
+OK, LOW, ERROR = "ok", "low", "error"
+
+class PrintTarget(NamedTuple):
+    """Final print size of an asset and the PPI it needs at that size."""
+    name: str
+    width_mm: float
+    height_mm: float
+    min_ppi: float = DEFAULT_MIN_PPI
+
+    @classmethod
+    def parse(cls, spec: str) -> "PrintTarget":
+        """Parse ``NAME=WxH[@PPI]`` with sizes in mm, e.g. ``A4=210x297@300``."""
+        name, _, rest = spec.partition("=")
+        size, _, ppi = rest.partition("@")
+        try:
+            w, h = (float(v) for v in size.lower().split("x"))
+            return cls(name, w, h, float(ppi) if ppi else DEFAULT_MIN_PPI)
+        except ValueError:
+            raise ValueError(f"Invalid target {spec!r}, expected NAME=WxH[@PPI] in mm") from None
+
+DEFAULT_TARGETS = [PrintTarget("A4", 210, 297)]
+
+def list_assets(source: str) -> List[str]:
+    """Image and PDF entries of a folder (relative paths) or ZIP archive (member names), sorted."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            names = [i.filename for i in zf.infolist() if not i.is_dir()]
+    else:
+        names = [os.path.relpath(os.path.join(d, f), source) for d, _, files in os.walk(source) for f in files]
+    return sorted(n for n in names
+                  if os.path.splitext(n)[1].lower() in IMAGE_EXTS | PDF_EXTS
+                  and not any(p.startswith(".") or p == "__MACOSX" for p in n.replace("\\", "/").split("/")))
+
+def _row(name: str, kind: str, target: PrintTarget, **fields) -> Dict[str, Any]:
+    return {"file": name, "kind": kind, "target": target.name, "pixels": None, "dpi": None,
+            "mode": None, "icc": None, "pages": None,
+            "ppi": None, "min_ppi": target.min_ppi, "status": ERROR, "detail": "", **fields}
+
+def _check_image(src, name: str, targets: List[PrintTarget]) -> List[Dict[str, Any]]:
+    info = probe_image(src)  # header only, pixel data is never read
+    px_w, px_h = info.size
+    dpi = tuple(round(d, 1) for d in info.dpi) if info.dpi else None
+    rows = []
+    for t in targets:
+        ppi = round(min(px_w / (t.width_mm / 25.4), px_h / (t.height_mm / 25.4)), 1)
+        rows.append(_row(name, "image", t, pixels=(px_w, px_h), dpi=dpi, mode=info.mode, icc=info.has_icc,
+                         ppi=ppi, status=OK if ppi >= t.min_ppi else LOW,
+                         detail=f"{t.width_mm:g}x{t.height_mm:g} mm"))
+    return rows
+
+def _check_pdf(pdf, name: str, targets: List[PrintTarget]) -> List[Dict[str, Any]]:
+    # placed images carry their own scale, so the target only sets the threshold
+    worst, worst_page, pages = None, None, 0
+    for res in iter_effective_ppi_in_pdf(pdf, workers=1):
+        pages += 1
+        if res["min_ppi"] is not None and (worst is None or res["min_ppi"] < worst):
+            worst, worst_page = res["min_ppi"], res["page"]
+    return [_row(name, "pdf", t, pages=pages, ppi=worst,
+                 status=OK if worst is None or worst >= t.min_ppi else LOW,
+                 detail=f"página {worst_page}" if worst_page else "sin imágenes") for t in targets]
+
+def check_assets(source: str, names: List[str], targets: List[PrintTarget]) -> List[Dict[str, Any]]:
+    """
+    Check ``names`` from ``source`` against every target; one row per file and target.
+
+    Runs in a worker process, which opens the folder or archive itself so only
+    names and report rows cross the process boundary. A file that cannot be
+    read yields error rows instead of failing the batch.
+    """
+    zf = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else None
+    rows = []
+    try:
+        for name in names:
+            is_pdf = os.path.splitext(name)[1].lower() in PDF_EXTS
+            try:
+                if zf is not None:
+                    # ZIP members are seekable, so a header read only inflates the first blocks
+                    with zf.open(name) as fh:
+                        rows += _check_pdf(fh.read(), name, targets) if is_pdf else _check_image(fh, name, targets)
+                else:
+                    path = os.path.join(source, name)
+                    rows += _check_pdf(path, name, targets) if is_pdf else _check_image(path, name, targets)
+            except Exception as e:
+                rows += [_row(name, "pdf" if is_pdf else "image", t, detail=f"{type(e).__name__}: {e}") for t in targets]
+    finally:
+        if zf is not None:
+            zf.close()
+    return rows
+
+def iter_preflight(source: str, targets: Optional[List[PrintTarget]] = None, workers: Optional[int] = None,
+                   files_per_task: int = FILES_PER_TASK,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield preflight report rows for every asset in ``source`` as they are computed.
+
+    Files are split into chunks and checked on a process pool, so rows arrive
+    in completion order. Small batches, or ``workers=1``, run in this process.
+
+    Args:
+        source: Folder or ZIP archive path
+        targets: Print targets to check against (defaults to ``DEFAULT_TARGETS``)
+        workers: Number of worker processes (defaults to the CPU count)
+        files_per_task: Files checked per task
+        progress: Optional callback ``(done_files, total_files)``
+
+    Yields:
+        One row dict per file and target, with the keys in ``REPORT_FIELDS``
+    """
+    targets = targets or DEFAULT_TARGETS
+    names = list_assets(source)
+    workers = workers or os.cpu_count() or 1
+    chunks = [names[i:i + files_per_task] for i in range(0, len(names), files_per_task)]
+    done = 0
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from check_assets(source, chunk, targets)
+            done += len(chunk)
+            if progress:
+                progress(done, len(names))
+        return
+
+    # spawn: the Streamlit server is multi-threaded, forking it is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=ctx) as pool:
+        futures = {pool.submit(check_assets, source, chunk, targets): len(chunk) for chunk in chunks}
+        try:
+            for fut in as_completed(futures):
+                yield from fut.result()
+                done += futures[fut]
+                if progress:
+                    progress(done, len(names))
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+def _flat(value: Any) -> Any:
+    return "x".join(str(v) for v in value) if isinstance(value, tuple) else value
+
+def write_report(rows: Iterator[Dict[str, Any]], out: TextIO, fmt: str = "csv") -> Dict[str, int]:
+    """
+    Write report rows to ``out`` as CSV or JSON Lines, flushing after each row.
+
+    Returns:
+        Row counts per status
+    """
+    counts = {OK: 0, LOW: 0, ERROR: 0}
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+    for row in rows:
+        counts[row["status"]] += 1
+        if writer:
+            writer.writerow({k: _flat(v) for k, v in row.items()})
+        else:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        out.flush()
+    return counts
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="Folder or ZIP archive of images and PDFs")
+    parser.add_argument("--target", action="append", type=PrintTarget.parse, dest="targets",
+                        help="Print target NAME=WxH[@PPI] in mm; repeatable (default: A4=210x297@300)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--out", help="Report file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    out = open(args.out, "w", newline="", encoding="utf-8") if args.out else sys.stdout
+    try:
+        counts = write_report(iter_preflight(args.source, args.targets, workers=args.workers), out, args.format)
+    finally:
+        if args.out:
+            out.close()
+    print(f"{sum(counts.values())} rows in {time.perf_counter() - t0:.1f}s: "
+          f"{counts[OK]} ok, {counts[LOW]} low, {counts[ERROR]} error", file=sys.stderr)
+    return 1 if counts[LOW] or counts[ERROR] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Shared scheduler in front of the provider calls.
+
+- Single-flight: identical calls in flight at the same time (same cache key)
+  run upstream once; the others wait for that result.
+- Rate limits: token buckets per provider and per provider/model. Callers
+  waiting for a token are served by priority, then arrival order, so batch
+  work queues behind interactive requests instead of in front of them.
+- Concurrency: a cap on the calls each provider (or provider/model) has in
+  flight, as a bucket only spaces out their starts.
+- Retries: throttling (429), timeouts and 5xx answers are retried with
+  jittered exponential backoff, at least as long as the server's
+  Retry-After, which also pauses the bucket for everyone else.
+
+Limits come from PROVIDER_RATE_LIMITS, e.g.
+``openai=0.5:5,replicate=10:20,replicate:google/imagen-4=1:4`` (requests per
+second : burst). Calls without a configured bucket are not throttled.
+In-flight caps come from PROVIDER_CONCURRENCY, e.g. ``openai=4,replicate=8``.
+"""
+import os
+import random
+import threading
+import time
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from providers.http import cancellable_sleep
+from providers.predictions import PredictionCancelled
+from utils.metrics import SCHEDULER_EVENTS, SCHEDULER_WAIT
+
+INTERACTIVE = 0
+BATCH = 10
+
+DEFAULT_RATE_LIMITS = "openai=0.5:5,replicate=10:20"
+PROVIDER_RATE_LIMITS = os.getenv("PROVIDER_RATE_LIMITS", DEFAULT_RATE_LIMITS)
+DEFAULT_CONCURRENCY = "openai=4,replicate=8"
+PROVIDER_CONCURRENCY = os.getenv("PROVIDER_CONCURRENCY", DEFAULT_CONCURRENCY)
+# Extra attempts after a transient failure, and the backoff base/cap in seconds
+RETRIES = 3
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 30.0
+# Granularity of the cancellation checks while waiting
+CANCEL_CHECK = 0.25
+
+# Status codes worth retrying: timeouts, throttling and gateway/server hiccups
+RETRY_STATUS = (408, 425, 429, 500, 502, 503, 504)
+# Network failures of requests, httpx and the stdlib, matched by class name so
+# that neither library has to be imported here
+_TRANSIENT_ERRORS = ("ConnectionError", "Timeout", "TimeoutException", "TransportError")
+
+class RequestCancelled(RuntimeError):
+    """Raised when the caller cancelled while its call was queued or coalesced."""
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """``"name=rate:burst,..."`` -> ``{name: (rate per second, burst)}``."""
+    limits = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, value = item.rpartition("=")
+        rate, _, burst = value.partition(":")
+        limits[name.strip()] = (float(rate), float(burst or 1))
+    return limits
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    """``"name=limit,..."`` -> ``{name: calls in flight}``."""
+    limits = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, value = item.rpartition("=")
+        limits[name.strip()] = max(1, int(value))
+    return limits
+
+def _retry_after(response) -> float:
+    value = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0  # absent, or an HTTP date
+
+def transient_delay(exc: BaseException) -> Optional[float]:
+    """
+    Whether ``exc`` is worth retrying.
+
+    The exception's cause/context chain is inspected, as providers wrap
+    client errors in RuntimeError.
+
+    Returns:
+        Seconds the server asked to wait (0 if it did not say) for transient
+        failures; None for anything else
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None) or getattr(exc, "status", None)
+        if isinstance(status, int):
+            return _retry_after(response) if status in RETRY_STATUS else None
+        if any(c.__name__ in _TRANSIENT_ERRORS for c in type(exc).__mro__):
+            return 0.0
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+def is_cancellation(exc: BaseException) -> bool:
+    """Whether ``exc`` or any exception in its cause/context chain is a cancellation."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (RequestCancelled, PredictionCancelled)) or type(exc).__name__ == "JobCancelled":
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``; not thread-safe on its own."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, max(1.0, burst)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float, now: float) -> None:
+        """Hand out no token for ``seconds``, e.g. after a Retry-After."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class ProviderScheduler:
+    """
+    Rate limiting, prioritised queueing, retries and single-flight for provider calls.
+
+    Args:
+        limits: ``{bucket name: (rate per second, burst)}``; bucket names are
+            a provider (``"openai"``) or ``"provider:model"``
+        concurrency: ``{name: calls in flight}``, with the same names
+        retries: Extra attempts after a transient failure
+        backoff: Base of the exponential backoff, in seconds
+        backoff_max: Cap of a single backoff, in seconds
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 concurrency: Optional[Dict[str, int]] = None, retries: int = RETRIES,
+                 backoff: float = RETRY_BACKOFF, backoff_max: float = RETRY_BACKOFF_MAX):
+        limits = parse_rate_limits(PROVIDER_RATE_LIMITS) if limits is None else limits
+        concurrency = parse_concurrency(PROVIDER_CONCURRENCY) if concurrency is None else concurrency
+        self._buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in limits.items()}
+        self._caps = dict(concurrency)
+        self._running: Dict[str, int] = {}  # calls in flight per capped name, under the condition
+        self.retries, self.backoff, self.backoff_max = retries, backoff, backoff_max
+        self._cond = threading.Condition()
+        self._waiting: List[Tuple[int, int, Tuple[TokenBucket, ...]]] = []
+        self._seq = count()
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "throttled": 0, "wait_s": 0.0}
+
+    def _ready(self, waiter, now: float) -> bool:
+        # called with the condition held: a token in each bucket and a free slot under each cap
+        return all(self._running.get(n, 0) < self._caps[n] for n in waiter[3]) and \
+            all(b.wait_time(now) == 0 for b in waiter[2])
+
+    def _turn(self, waiter, now: float) -> bool:
+        # called with the condition held
+        if not self._ready(waiter, now):
+            return False
+        for other in self._waiting:
+            # an earlier or higher-priority waiter that could go now, on a shared bucket or cap, goes first
+            if other[:2] < waiter[:2] and (set(other[2]) & set(waiter[2]) or set(other[3]) & set(waiter[3])) and \
+                    self._ready(other, now):
+                return False
+        return True
+
+    def acquire(self, names: Iterable[str], priority: int = INTERACTIVE,
+                cancelled: Optional[Callable[[], bool]] = None) -> float:
+        """
+        Take a token from each configured bucket in ``names`` and an in-flight
+        slot under each cap, waiting by priority. Give the slots back with
+        ``release(names)``.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RequestCancelled: If ``cancelled`` returned True while waiting
+        """
+        names = tuple(names)
+        buckets = tuple(self._buckets[n] for n in names if n in self._buckets)
+        capped = tuple(n for n in names if n in self._caps)
+        if not buckets and not capped:
+            return 0.0
+        t0 = time.monotonic()
+        with self._cond:
+            waiter = (priority, next(self._seq), buckets, capped)
+            self._waiting.append(waiter)
+            try:
+                for attempt in count():
+                    now = time.monotonic()
+                    if self._turn(waiter, now):
+                        for b in buckets:
+                            b.take()
+                        for n in capped:
+                            self._running[n] = self._running.get(n, 0) + 1
+                        return now - t0 if attempt else 0.0
+                    if cancelled is not None and cancelled():
+                        raise RequestCancelled("Cancelled while waiting for a rate-limit token or provider slot")
+                    # a finished call notifies; a bucket refills on its own
+                    hint = max((b.wait_time(now) for b in buckets), default=CANCEL_CHECK)
+                    self._cond.wait(min(CANCEL_CHECK, max(hint, 0.001)))
+            finally:
+                self._waiting.remove(waiter)
+                self._cond.notify_all()
+
+    def release(self, names: Iterable[str]) -> None:
+        """Give back the in-flight slots taken by ``acquire(names)``."""
+        with self._cond:
+            for n in names:
+                if n in self._caps:
+                    self._running[n] -= 1
+            self._cond.notify_all()
+
+    def _pause(self, names: Iterable[str], seconds: float) -> None:
+        with self._cond:
+            now = time.monotonic()
+            for n in names:
+                if n in self._buckets:
+                    self._buckets[n].pause(seconds, now)
+
+    def call(self, provider: str, model: str, fn: Callable[[], Any], priority: int = INTERACTIVE,
+             cancelled: Optional[Callable[[], bool]] = None) -> Any:
+        """
+        Run ``fn`` under the ``provider`` and ``provider:model`` rate limits
+        and in-flight caps, retrying transient failures. The slots are held
+        while ``fn`` runs, not during a backoff.
+
+        Args:
+            provider: Provider name, e.g. "openai" or "replicate"
+            model: Model id, for per-model limits
+            fn: Zero-argument callable making the upstream call
+            priority: Lower is served first (INTERACTIVE, BATCH)
+            cancelled: Optional callback checked while queued and between attempts
+
+        Returns:
+            Whatever ``fn`` returns
+        """
+        names = (provider, f"{provider}:{model}")
+        with self._flights_lock:
+            self.stats["calls"] += 1
+        for attempt in range(self.retries + 1):
+            waited = self.acquire(names, priority, cancelled)
+            SCHEDULER_WAIT.observe(waited, provider=provider)
+            if waited > 0:
+                with self._flights_lock:
+                    self.stats["throttled"] += 1
+                    self.stats["wait_s"] += waited
+            try:
+                return fn()
+            except Exception as e:
+                error = e
+            finally:
+                self.release(names)  # free during the backoff
+            hint = transient_delay(error)
+            if hint is None or attempt == self.retries or (cancelled is not None and cancelled()):
+                raise error
+            if hint:
+                self._pause(names, hint)
+            # full jitter, so callers throttled together do not come back together
+            delay = max(hint, random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+            SCHEDULER_EVENTS.inc(event="retry", provider=provider)
+            with self._flights_lock:
+                self.stats["retries"] += 1
+            if cancellable_sleep(delay, cancelled, CANCEL_CHECK):
+                raise RequestCancelled("Cancelled while backing off") from error
+
+    def single_flight(self, key: str, fn: Callable[[], Any], cancelled: Optional[Callable[[], bool]] = None) -> Any:
+        """
+        Run ``fn`` once for all concurrent callers with the same ``key``.
+
+        If the caller that ran it was cancelled, a waiting caller runs it again
+        rather than inheriting the cancellation.
+        """
+        while True:
+            with self._flights_lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                else:
+                    self.stats["coalesced"] += 1
+            if leader:
+                try:
+                    flight.result = fn()
+                    return flight.result
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self._flights_lock:
+                        del self._flights[key]
+                    flight.done.set()
+            SCHEDULER_EVENTS.inc(event="coalesced", provider="any")
+            while not flight.done.wait(CANCEL_CHECK):
+                if cancelled is not None and cancelled():
+                    raise RequestCancelled("Cancelled while waiting for an identical call")
+            if flight.error is None:
+                return flight.result
+            if not is_cancellation(flight.error):  # providers wrap a cancelled prediction in RuntimeError
+                raise flight.error
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus bucket levels, queue length and calls running, for display."""
+        with self._cond:
+            now = time.monotonic()
+            buckets = {}
+            for name, b in self._buckets.items():
+                b._refill(now)
+                buckets[name] = round(b.tokens, 2)
+            waiting = len(self._waiting)
+            running = {k: v for k, v in self._running.items() if v}
+        with self._flights_lock:
+            return {**self.stats, "wait_s": round(self.stats["wait_s"], 2), "waiting": waiting,
+                    "in_flight": len(self._flights), "tokens": buckets, "running": running}
+
+_scheduler: Optional[ProviderScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> ProviderScheduler:
+    """Process-wide scheduler shared by all Streamlit sessions and jobs."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ProviderScheduler()
+        return _scheduler
+
+def scheduled(provider: str, model: str, fn: Callable[[], Any], priority: int = INTERACTIVE,
+              cancelled: Optional[Callable[[], bool]] = None) -> Any:
+    """``get_scheduler().call(...)``: run a provider call under the shared limits."""
+    return get_scheduler().call(provider, model, fn, priority, cancelled)
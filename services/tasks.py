@@ -0,0 +1,190 @@
+"""Job kinds run by the background queue (see ``services.jobs``)."""
+import bisect
+import io
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from providers.openai_provider import generate_image_openai, generate_images_openai, edit_image_openai
+from providers.replicate_provider import generate_image, generate_images, edit_image_replicate, AVAILABLE_MODELS
+from services.cache import cached_call
+from services.jobs import JobContext, register_task
+from services.scheduler import scheduled
+from services.preflight import PrintTarget, iter_preflight
+from services.upscale import upscale_lanczos, upscale_replicate, UPSCALE_MODELS
+from services.variants import store_variant
+from utils.image_handle import ImageHandle
+from utils.ppi import iter_effective_ppi_in_pdf, pdf_page_count, page_result_as_json
+
+# Seconds between progress reports of a PDF analysis; each one carries the page summary so far
+PDF_PROGRESS_INTERVAL = 0.5
+
+@register_task("generate_openai")
+def generate_openai_task(ctx: JobContext, prompt: str, size: str, refresh: bool = False) -> bytes:
+    cancelled = lambda: ctx.cancelled
+    return cached_call("openai", "images/generations", {"prompt": prompt, "size": size}, None,
+                       lambda: scheduled("openai", "images/generations",
+                                         lambda: generate_image_openai(prompt, size=size), cancelled=cancelled),
+                       refresh=refresh, cancelled=cancelled)
+
+@register_task("generate_replicate")
+def generate_replicate_task(ctx: JobContext, prompt: str, model_name: str, width: int, height: int,
+                            refresh: bool = False) -> bytes:
+    model, cancelled = AVAILABLE_MODELS[model_name]["model"], lambda: ctx.cancelled
+    return cached_call("replicate", model, {"op": "generate", "prompt": prompt, "width": width, "height": height}, None,
+                       lambda: scheduled("replicate", model,
+                                         lambda: generate_image(prompt, model_name=model_name, width=width, height=height,
+                                                                cancelled=cancelled),
+                                         cancelled=cancelled),
+                       refresh=refresh, cancelled=cancelled)
+
+@register_task("generate_variants")
+def generate_variants_task(ctx: JobContext, provider: str, prompt: str, count: int, index: int = 0,
+                           size: str = "1024x1024", model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    # ``count`` variants from one provider call, returned as thumbnails plus store keys (see services.variants).
+    # ``index`` only keeps the jobs of one batch apart; variants never come from the result cache.
+    cancelled = lambda: ctx.cancelled
+    if provider == "openai":
+        images = scheduled("openai", "images/generations",
+                           lambda: generate_images_openai(prompt, size=size, n=count), cancelled=cancelled)
+    else:
+        w, h = [int(x) for x in size.split("x")]
+        images = scheduled("replicate", AVAILABLE_MODELS[model_name]["model"],
+                           lambda: generate_images(prompt, model_name=model_name, width=w, height=h, n=count,
+                                                   cancelled=cancelled),
+                           cancelled=cancelled)
+    variants = []
+    for data in images:
+        variants.append(store_variant(data))
+        ctx.progress(len(variants) / len(images), f"{len(variants)}/{len(images)} miniaturas")
+    return variants
+
+@register_task("edit_openai")
+def edit_openai_task(ctx: JobContext, image_bytes: bytes, prompt: str, size: str, refresh: bool = False) -> bytes:
+    cancelled = lambda: ctx.cancelled
+    return cached_call("openai", "images/edits", {"prompt": prompt, "size": size}, image_bytes,
+                       lambda: scheduled("openai", "images/edits",
+                                         lambda: edit_image_openai(image_bytes, prompt, size=size), cancelled=cancelled),
+                       refresh=refresh, cancelled=cancelled)
+
+@register_task("edit_replicate")
+def edit_replicate_task(ctx: JobContext, image_bytes: bytes, prompt: str, model_name: str, width: int, height: int,
+                        refresh: bool = False) -> bytes:
+    model, cancelled = AVAILABLE_MODELS[model_name]["model"], lambda: ctx.cancelled
+    return cached_call("replicate", model, {"op": "edit", "prompt": prompt, "width": width, "height": height}, image_bytes,
+                       lambda: scheduled("replicate", model,
+                                         lambda: edit_image_replicate(image_bytes, prompt, model_name=model_name,
+                                                                      width=width, height=height, cancelled=cancelled),
+                                         cancelled=cancelled),
+                       refresh=refresh, cancelled=cancelled)
+
+@register_task("resize_lanczos")
+def resize_lanczos_task(ctx: JobContext, image_bytes: bytes, width: int, height: int, refresh: bool = False) -> bytes:
+    def run():
+        from services.tiled_resize import resize_lanczos_tiled
+
+        im = ImageHandle(image_bytes).image.convert("RGB")
+        out = io.BytesIO()
+        resize_lanczos_tiled(im, (width, height), out)
+        return out.getvalue()
+    return cached_call("local", "lanczos", {"width": width, "height": height}, image_bytes, run, refresh=refresh)
+
+@register_task("upscale_lanczos")
+def upscale_lanczos_task(ctx: JobContext, image_bytes: bytes, scale: float, refresh: bool = False) -> bytes:
+    return cached_call("local", "lanczos", {"scale": scale}, image_bytes,
+                       lambda: upscale_lanczos(image_bytes, scale=scale), refresh=refresh)
+
+@register_task("upscale_replicate")
+def upscale_replicate_task(ctx: JobContext, image_bytes: bytes, model_name: str, scale: int, tiled: bool = False,
+                           refresh: bool = False) -> bytes:
+    def progress(done, total):
+        ctx.progress(done / total, f"Teselas {done}/{total}")
+    return cached_call("replicate", UPSCALE_MODELS[model_name]["model"],
+                       {"op": "upscale", "scale": scale, "tiled": tiled}, image_bytes,
+                       lambda: upscale_replicate(image_bytes, model_name=model_name, scale=scale, tiled=tiled,
+                                                 progress=progress if tiled else None,
+                                                 cancelled=lambda: ctx.cancelled),
+                       refresh=refresh, cancelled=lambda: ctx.cancelled)
+
+@register_task("export_print")
+def export_print_task(ctx: JobContext, image_bytes: bytes, format: str, dpi: float, refresh: bool = False) -> bytes:
+    from services.print_export import CMYK_ICC_PROFILE, export_print  # NumPy and LittleCMS only load on export
+
+    def run():
+        out = io.BytesIO()
+        export_print(image_bytes, out, format=format, dpi=dpi)
+        return out.getvalue()
+    return cached_call("local", "cmyk", {"format": format, "dpi": dpi, "profile": CMYK_ICC_PROFILE}, image_bytes,
+                       run, refresh=refresh)
+
+@register_task("sharpness")
+def sharpness_task(ctx: JobContext, image_bytes: bytes, ppi: float, min_ppi: float = 300.0) -> Dict[str, Any]:
+    # effective resolution of an image printed at ``ppi``: summary plus detail heatmap PNG
+    from utils.sharpness import analyze_image, render_heatmap  # NumPy is only loaded once an image is analysed
+
+    image = ImageHandle(image_bytes)
+    report = analyze_image(image)
+    ctx.check()
+    out = io.BytesIO()
+    render_heatmap(report, image, ppi=ppi, min_ppi=min_ppi).save(out, format="PNG")
+    return {"summary": report.summary(ppi), "heatmap": out.getvalue()}
+
+@register_task("sharpness_pdf_page")
+def sharpness_pdf_page_task(ctx: JobContext, pdf_bytes: bytes, page: int, min_ppi: float = 300.0) -> Dict[str, Any]:
+    # effective PPI of every image drawn on one page, plus the page preview tinted by it
+    from PIL import Image
+    from services.pdf_render import PAGE_DPI
+    from utils.ppi import _open_pdf
+    from utils.sharpness import analyze_pdf_page, render_page_heatmap
+
+    placed = analyze_pdf_page(pdf_bytes, page)
+    ctx.check()
+    doc = _open_pdf(pdf_bytes)
+    try:
+        pdf_page = doc[page]
+        pix = pdf_page.get_pixmap(dpi=PAGE_DPI)
+        background = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        page_size = (pdf_page.rect.width, pdf_page.rect.height)
+    finally:
+        doc.close()
+    out = io.BytesIO()
+    render_page_heatmap(placed, background, page_size, min_ppi=min_ppi, width=background.width).save(out, format="PNG")
+    images = [{"bbox": p.placement.bbox, "ppi": round(p.placement.min_ppi, 1),
+               "effective_ppi": round(p.effective_ppi, 1), "detail_scale": round(p.report.effective_scale, 2)}
+              for p in placed]
+    return {"heatmap": out.getvalue(), "images": images}
+
+@register_task("pdf_ppi")
+def pdf_ppi_task(ctx: JobContext, pdf_bytes: bytes) -> List[Dict[str, Any]]:
+    n_pages = pdf_page_count(pdf_bytes)
+    data, index = [], {}
+    pages: List[Dict[str, Any]] = []  # light summary of the pages so far, in page order, for the polling UI
+    page_min, reported = None, 0.0
+    for res in iter_effective_ppi_in_pdf(pdf_bytes, index=index):
+        data.append(res)
+        if res["min_ppi"] is not None and (page_min is None or res["min_ppi"] < page_min):
+            page_min = res["min_ppi"]
+        bisect.insort(pages, {"page": res["page"], "min_ppi": res["min_ppi"], "images": len(res["images"])},
+                      key=lambda r: r["page"])
+        # throttled: the SQLite backend writes the whole summary on every report
+        if time.monotonic() - reported >= PDF_PROGRESS_INTERVAL or len(data) == n_pages:
+            reported = time.monotonic()
+            ctx.progress(len(data) / n_pages,
+                         f"{len(data)}/{n_pages} páginas · PPI mínimo hasta ahora: {page_min or '—'}", partial=list(pages))
+    data.sort(key=lambda r: r["page"])
+    return [page_result_as_json(r, index) for r in data]
+
+@register_task("preflight_batch")
+def preflight_batch_task(ctx: JobContext, zip_bytes: bytes, targets: List[Tuple[str, float, float, float]]) -> List[Dict[str, Any]]:
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(zip_bytes)
+    try:
+        # progress() also raises JobCancelled, stopping the pool between chunks
+        rows = list(iter_preflight(path, [PrintTarget(*t) for t in targets],
+                                   progress=lambda done, total: ctx.progress(done / total, f"{done}/{total} archivos")))
+        rows.sort(key=lambda r: (r["file"], r["target"]))
+        return rows
+    finally:
+        os.unlink(path)
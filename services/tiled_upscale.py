@@ -0,0 +1,168 @@
+import io
+import time
+import random
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from services.scheduler import is_cancellation
+from services.tiled_resize import write_png_strips
+from utils.image_handle import ImageHandle
+from utils.metrics import stage
+
+# Input-side tile geometry, in source pixels
+TILE_SIZE = 512
+TILE_OVERLAP = 32
+# Tiles submitted to the model at the same time
+MAX_IN_FLIGHT = 4
+# Extra attempts per tile before the whole job fails
+TILE_RETRIES = 2
+TILE_RETRY_BACKOFF = 1.0
+
+def tile_spans(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """Evenly spaced, overlapping [start, end) spans covering ``length``."""
+    if length <= tile:
+        return [(0, length)]
+    # spread the tiles evenly so every overlap is at least ``overlap``
+    n = -(-(length - overlap) // (tile - overlap))
+    starts = [round(i * (length - tile) / (n - 1)) for i in range(n)]
+    return [(s, s + tile) for s in starts]
+
+def _ramp(n: int, lead: int, trail: int) -> np.ndarray:
+    """1-D blend weights: ramp up over ``lead`` samples, down over ``trail``."""
+    w = np.ones(n, dtype=np.float32)
+    if lead:
+        w[:lead] = (np.arange(lead, dtype=np.float32) + 0.5) / lead
+    if trail:
+        w[n - trail:] = np.minimum(w[n - trail:], (np.arange(trail, 0, -1, dtype=np.float32) - 0.5) / trail)
+    return w
+
+def local_tile_model(scale: int) -> Callable[[bytes], bytes]:
+    """
+    Deterministic stand-in for a Replicate upscaler: Lanczos-enlarges a PNG
+    tile by ``scale``. Used to exercise and benchmark the tiling offline.
+    """
+    def upscale_tile(tile_png: bytes) -> bytes:
+        im = Image.open(io.BytesIO(tile_png))
+        out = io.BytesIO()
+        im.resize((im.width * scale, im.height * scale), Image.LANCZOS).save(out, format="PNG", compress_level=1)
+        return out.getvalue()
+    return upscale_tile
+
+def _with_retries(fn: Callable[[bytes], bytes], data: bytes, retries: int) -> bytes:
+    for attempt in range(retries + 1):
+        try:
+            return fn(data)
+        except Exception as e:
+            if attempt == retries or is_cancellation(e):
+                raise
+            time.sleep(TILE_RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+
+def iter_upscaled_strips(image: Image.Image, upscale_tile: Callable[[bytes], bytes], scale: int,
+                         tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP,
+                         max_in_flight: int = MAX_IN_FLIGHT, retries: int = TILE_RETRIES,
+                         progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Image.Image]:
+    """
+    Upscale ``image`` tile by tile and yield finished output rows top to bottom.
+
+    Tiles are submitted concurrently in row-major order. Overlaps are blended
+    with linear feathering, each weight ramp spanning the actual overlap with
+    the neighbouring tile so the weights sum to one. Only one tile row's band
+    of output is held at a time; rows no later tile can touch are yielded.
+
+    Args:
+        image: RGB source image
+        upscale_tile: Callable taking a PNG tile and returning the upscaled PNG
+        scale: Integer upscale factor of ``upscale_tile``
+        tile_size: Tile edge in source pixels
+        overlap: Minimum overlap between neighbouring tiles in source pixels
+        max_in_flight: Tiles submitted to the model at once
+        retries: Extra attempts per failed tile
+        progress: Optional callback ``(done_tiles, total_tiles)``
+    """
+    w, h = image.size
+    xs, ys = tile_spans(w, tile_size, overlap), tile_spans(h, tile_size, overlap)
+    total, done = len(xs) * len(ys), 0
+    out_w = w * scale
+
+    def run(box):
+        buf = io.BytesIO()
+        image.crop(box).save(buf, format="PNG", compress_level=1)
+        res = ImageHandle(_with_retries(upscale_tile, buf.getbuffer(), retries)).image.convert("RGB")
+        size = ((box[2] - box[0]) * scale, (box[3] - box[1]) * scale)
+        return res if res.size == size else res.resize(size, Image.LANCZOS)
+
+    x_weights = [_ramp((x1 - x0) * scale,
+                       (xs[i - 1][1] - x0) * scale if i else 0,
+                       (x1 - xs[i + 1][0]) * scale if i + 1 < len(xs) else 0) for i, (x0, x1) in enumerate(xs)]
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        boxes = [(x0, y0, x1, y1) for (y0, y1) in ys for (x0, x1) in xs]
+        futures: Dict[int, object] = {}
+        next_submit = 0
+
+        def top_up():
+            nonlocal next_submit
+            while next_submit < len(boxes) and len(futures) < max_in_flight:
+                # carry the caller's trace into the worker so per-tile stages are attributed
+                futures[next_submit] = pool.submit(contextvars.copy_context().run, run, boxes[next_submit])
+                next_submit += 1
+
+        band_top = 0  # output row where the pending accumulator starts
+        acc = np.zeros((0, out_w, 3), dtype=np.float32)
+        wsum = np.zeros((0, out_w), dtype=np.float32)
+        for r, (y0, y1) in enumerate(ys):
+            lead = (ys[r - 1][1] - y0) * scale if r else 0
+            trail = (y1 - ys[r + 1][0]) * scale if r + 1 < len(ys) else 0
+            wy = _ramp((y1 - y0) * scale, lead, trail)
+            # grow the accumulator down to this tile row's bottom edge
+            grow = y1 * scale - band_top - acc.shape[0]
+            acc = np.concatenate([acc, np.zeros((grow, out_w, 3), dtype=np.float32)])
+            wsum = np.concatenate([wsum, np.zeros((grow, out_w), dtype=np.float32)])
+            oy = y0 * scale - band_top
+            for c, (x0, x1) in enumerate(xs):
+                idx = r * len(xs) + c
+                top_up()
+                tile = np.asarray(futures.pop(idx).result(), dtype=np.float32)
+                weight = wy[:, None] * x_weights[c][None, :]
+                acc[oy:oy + tile.shape[0], x0 * scale:x1 * scale] += tile * weight[..., None]
+                wsum[oy:oy + tile.shape[0], x0 * scale:x1 * scale] += weight
+                done += 1
+                if progress:
+                    progress(done, total)
+            # rows above the next tile row's top edge are final
+            final = (ys[r + 1][0] * scale if r + 1 < len(ys) else h * scale) - band_top
+            rows = acc[:final] / wsum[:final, :, None]
+            yield Image.fromarray(np.clip(np.rint(rows), 0, 255).astype(np.uint8), "RGB")
+            acc, wsum = acc[final:], wsum[final:]
+            band_top += final
+
+def upscale_tiled(image_bytes: Union[bytes, ImageHandle], upscale_tile: Callable[[bytes], bytes], scale: int,
+                  tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP, max_in_flight: int = MAX_IN_FLIGHT,
+                  retries: int = TILE_RETRIES, progress: Optional[Callable[[int, int], None]] = None) -> bytes:
+    """
+    Upscale by splitting into overlapping tiles and blending the results.
+
+    Args:
+        image_bytes: Image data as bytes or ImageHandle
+        upscale_tile: Callable taking a PNG tile and returning the upscaled PNG
+        scale: Integer upscale factor of ``upscale_tile``
+        tile_size: Tile edge in source pixels
+        overlap: Minimum overlap between neighbouring tiles in source pixels
+        max_in_flight: Tiles submitted to the model at once
+        retries: Extra attempts per failed tile
+        progress: Optional callback ``(done_tiles, total_tiles)``
+
+    Returns:
+        Upscaled image as PNG bytes
+    """
+    with stage("decode"):
+        image = ImageHandle.wrap(image_bytes).image.convert("RGB")
+    size = (image.width * scale, image.height * scale)
+    out = io.BytesIO()
+    strips = iter_upscaled_strips(image, upscale_tile, scale, tile_size, overlap, max_in_flight, retries, progress)
+    write_png_strips(strips, size, "RGB", out, wait_stage="tiles")
+    return out.getvalue()
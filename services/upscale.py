@@ -1,58 +1,86 @@
 import io
 import os
-import base64
-import replicate
-from PIL import Image
-
-# Initialize Replicate client
-replicate_client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
+from typing import Callable, Optional, Union
+from providers.predictions import read_output, run_prediction
+from services.scheduler import BATCH, INTERACTIVE, scheduled
+from utils.image_handle import ImageHandle
+from utils.metrics import instrument, stage
 
 # Available upscaling models
 UPSCALE_MODELS = {
     "Real-ESRGAN": {
         "model": "nightmareai/real-esrgan:42fed1c4974146d4d2414e2be2c5277c7fcf05fcc972b6f011297b040ecc4694",
-        "input_params": lambda image_data, scale: {
-            "image": f"data:image/png;base64,{base64.b64encode(image_data).decode()}",
+        "input_params": lambda image_file, scale: {
+            "image": image_file,
             "scale": scale
         }
     },
     "Topaz Labs": {
         "model": "topazlabs/image-upscale",
-        "input_params": lambda image_data, scale: {
-            "image": f"data:image/png;base64,{base64.b64encode(image_data).decode()}",
+        "input_params": lambda image_file, scale: {
+            "image": image_file,
             "scale": scale
         }
     }
 }
 
-def upscale_lanczos(image_bytes: bytes, scale: float = 2.0) -> bytes:
+@instrument("upscale.lanczos")
+def upscale_lanczos(image_bytes: Union[bytes, ImageHandle], scale: float = 2.0, compress_level: int = 6) -> bytes:
     """
     Upscale image using Lanczos algorithm (local processing).
+
+    The output is resampled and PNG-encoded strip by strip, so the full
+    upscaled raster is never held in memory.
     
     Args:
-        image_bytes: Image data as bytes
+        image_bytes: Image data as bytes or ImageHandle
         scale: Scale factor
+        compress_level: PNG zlib level of the output
     
     Returns:
         Upscaled image as bytes
     """
-    img = Image.open(io.BytesIO(image_bytes))
+    from services.tiled_resize import resize_lanczos_tiled  # NumPy is only loaded once an image is resampled
+
+    img = ImageHandle.wrap(image_bytes)
     w, h = img.size
     new_w, new_h = int(w * scale), int(h * scale)
-    upscaled = img.resize((new_w, new_h), Image.LANCZOS)
-    
     output = io.BytesIO()
-    upscaled.save(output, format="PNG")
+    resize_lanczos_tiled(img, (new_w, new_h), output, compress_level=compress_level)
     return output.getvalue()
 
-def upscale_replicate(image_bytes: bytes, model_name: str = "Real-ESRGAN", scale: int = 2) -> bytes:
+def _run_upscale_model(image_bytes: Union[bytes, ImageHandle], model_config: dict, scale: int,
+                       cancelled: Optional[Callable[[], bool]] = None, priority: int = INTERACTIVE) -> bytes:
+    image = ImageHandle.wrap(image_bytes)
+
+    def predict():
+        # The client uploads file inputs as multipart instead of inlining a data URI
+        input_params = model_config["input_params"](image.stream(), scale)
+        return run_prediction(model_config["model"], input_params, cancelled=cancelled)
+
+    # Submit the upscaling prediction under the shared Replicate limits and poll it until done (or cancelled)
+    with stage("replicate.run"):
+        prediction = scheduled("replicate", model_config["model"], predict, priority, cancelled)
+    
+    # Stream the upscaled image down
+    return read_output(prediction)
+
+@instrument("upscale.replicate")
+def upscale_replicate(image_bytes: Union[bytes, ImageHandle], model_name: str = "Real-ESRGAN", scale: int = 2, tiled: bool = False,
+                      progress: Optional[Callable[[int, int], None]] = None,
+                      cancelled: Optional[Callable[[], bool]] = None) -> bytes:
     """
     Upscale image using Replicate models.
     
     Args:
-        image_bytes: Image data as bytes
+        image_bytes: Image data as bytes or ImageHandle
         model_name: Name of the upscaling model to use
         scale: Scale factor (must be integer)
+        tiled: Split into overlapping tiles sent as concurrent predictions and
+            blend the results (for inputs beyond the models' size limits)
+        progress: Optional callback ``(done_tiles, total_tiles)`` in tiled mode
+        cancelled: Optional callback polled while waiting; when it returns
+            True the outstanding predictions are cancelled on Replicate
     
     Returns:
         Upscaled image as bytes
@@ -64,26 +92,16 @@ def upscale_replicate(image_bytes: bytes, model_name: str = "Real-ESRGAN", scale
         raise ValueError(f"Model '{model_name}' not available. Choose from: {list(UPSCALE_MODELS.keys())}")
     
     model_config = UPSCALE_MODELS[model_name]
-    input_params = model_config["input_params"](image_bytes, scale)
     
     try:
-        # Run the upscaling prediction
-        output = replicate_client.run(
-            model_config["model"],
-            input=input_params
-        )
-        
-        # Handle different output formats
-        if isinstance(output, list):
-            image_url = output[0]
-        else:
-            image_url = output
-        
-        # Download the upscaled image
-        import requests
-        response = requests.get(image_url, timeout=120)
-        response.raise_for_status()
-        return response.content
+        if tiled:
+            from services.tiled_upscale import upscale_tiled
+
+            # Tiles queue behind single interactive calls. The scheduler retries transient HTTP
+            # errors; failed predictions are retried per tile, unless the job was cancelled
+            return upscale_tiled(image_bytes, lambda tile: _run_upscale_model(tile, model_config, scale, cancelled, BATCH),
+                                 scale, progress=progress)
+        return _run_upscale_model(image_bytes, model_config, scale, cancelled)
         
     except Exception as e:
         raise RuntimeError(f"Replicate {model_name} upscaling failed: {str(e)}")
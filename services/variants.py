@@ -0,0 +1,64 @@
+"""
+Batch generation of variants: full-resolution results go to a disk-only
+store and only small JPEG thumbnails travel through the job queue, the
+session and the browser until the user picks one.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+from services.cache import ResultCache
+
+# Defaults, overridable through environment variables
+VARIANT_DIR = os.getenv("VARIANT_STORE_DIR", os.path.join(tempfile.gettempdir(), "poc-ia-preimpresion-variants"))
+VARIANT_DISK_MB = float(os.getenv("VARIANT_STORE_DISK_MB", "1024"))
+VARIANT_TTL_HOURS = float(os.getenv("VARIANT_STORE_TTL_HOURS", "24"))
+# Most variants one batch may request, and the thumbnail edge/quality shown in the grid
+MAX_VARIANTS = 16
+THUMB_PX = 256
+THUMB_QUALITY = 80
+
+_store: Optional[ResultCache] = None
+_store_lock = threading.Lock()
+
+def get_variant_store() -> ResultCache:
+    """Process-wide store of full-resolution variants: disk only, no memory tier."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultCache(cache_dir=VARIANT_DIR, max_memory_bytes=0,
+                                 max_disk_bytes=int(VARIANT_DISK_MB * 2**20), ttl_seconds=VARIANT_TTL_HOURS * 3600)
+        return _store
+
+def plan_batches(count: int, per_call: int) -> List[int]:
+    """Split ``count`` variants into calls of at most ``per_call`` images, e.g. (10, 4) -> [4, 3, 3]."""
+    calls = -(-count // max(1, per_call))
+    return [count // calls + (i < count % calls) for i in range(calls)]
+
+def thumbnail(data: bytes, edge: int = THUMB_PX) -> bytes:
+    """JPEG of ``data`` fitting in ``edge`` x ``edge``."""
+    from utils.image_handle import ImageHandle
+
+    img = ImageHandle(data).draft("RGB", (edge, edge)).convert("RGB")
+    img.thumbnail((edge, edge))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=THUMB_QUALITY)
+    return out.getvalue()
+
+def store_variant(data: bytes) -> Dict[str, Any]:
+    """
+    Keep ``data`` in the variant store and describe it for the grid.
+
+    Returns:
+        ``{"key", "thumb", "width", "height", "bytes"}``; ``key`` fetches the
+        full-resolution bytes back with ``get_variant_store().get(key)``
+    """
+    from utils.image_handle import ImageHandle
+
+    key = hashlib.sha256(data).hexdigest()
+    get_variant_store().put(key, data)
+    width, height = ImageHandle(data).size
+    return {"key": key, "thumb": thumbnail(data), "width": width, "height": height, "bytes": len(data)}
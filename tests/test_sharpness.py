@@ -0,0 +1,30 @@
+import io
+import unittest
+
+from PIL import Image
+
+from utils.sharpness import analyze_image, render_heatmap
+
+def _png(size, colour="red") -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, colour).save(out, format="PNG")
+    return out.getvalue()
+
+class RenderHeatmapTest(unittest.TestCase):
+    def test_images_smaller_than_a_tile(self):
+        for size in [(1, 1), (3, 2), (1, 300), (300, 1)]:
+            with self.subTest(size=size):
+                data = _png(size)
+                report = analyze_image(data)
+                self.assertEqual(report.detail_scale.shape, (1 + (size[1] - 1) // 128, 1 + (size[0] - 1) // 128))
+                heatmap = render_heatmap(report, data, ppi=300, width=64)
+                self.assertEqual(heatmap.mode, "RGB")
+                self.assertEqual(heatmap.width, 64)
+
+    def test_heatmap_covers_partial_edge_tiles(self):
+        data = _png((300, 200))
+        heatmap = render_heatmap(analyze_image(data), data, width=150)
+        self.assertEqual(heatmap.size, (150, 100))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import io
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Formats providers accept as-is; anything else is re-encoded at the edge
+UPLOAD_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+# zlib level used when an upload has to be re-encoded: speed over size
+UPLOAD_COMPRESS_LEVEL = 1
+
+class MemoryReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a buffer without copying it.
+
+    ``io.BytesIO(data)`` copies ``data`` up front (and ``getbuffer()`` on an
+    upload forces a copy too); this reader only ever slices the memoryview.
+    """
+
+    def __init__(self, data: Buffer, name: str = "image"):
+        self._mv = memoryview(data).cast("B")
+        self._pos = 0
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._mv) - self._pos)
+        b[:n] = self._mv[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._mv) if size is None or size < 0 else min(len(self._mv), self._pos + size)
+        chunk = self._mv[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._mv)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __len__(self) -> int:
+        return len(self._mv)
+
+class ImageHandle:
+    """
+    An image travelling through the pipeline: its original encoded bytes (kept
+    as a memoryview, never copied) together with the decoded raster, which is
+    only produced when a stage actually needs pixels.
+
+    Handles built from a PIL image have no encoded form until ``encoded()`` is
+    called at the edge (upload, download, cache) with the format it needs.
+    """
+
+    def __init__(self, data: Optional[Buffer] = None, image: Optional["Image.Image"] = None):
+        if data is None and image is None:
+            raise ValueError("ImageHandle needs encoded data or a decoded image")
+        self._data = memoryview(data).cast("B") if data is not None else None
+        self._image = image
+        self._header: Optional["Image.Image"] = None
+        self._encoded: Dict[Tuple[str, int], memoryview] = {}
+
+    @classmethod
+    def wrap(cls, obj: Union["ImageHandle", Buffer, "Image.Image"]) -> "ImageHandle":
+        if isinstance(obj, ImageHandle):
+            return obj
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            return cls(obj)
+        return cls(image=obj)
+
+    def _open(self) -> "Image.Image":
+        # Image.open only parses the header; pixels are decoded on load()
+        if self._header is None:
+            from PIL import Image  # loaded on first use: with NumPy it is ~80 ms of import
+
+            self._header = Image.open(MemoryReader(self._data))
+        return self._header
+
+    @property
+    def format(self) -> Optional[str]:
+        return self._open().format if self._data is not None else None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._image.size if self._image is not None else self._open().size
+
+    @property
+    def image(self) -> "Image.Image":
+        """Decoded raster, decoded once on first access."""
+        if self._image is None:
+            img = self._open()
+            img.load()
+            self._image = img
+        return self._image
+
+    def draft(self, mode: str, size: Tuple[int, int]) -> "Image.Image":
+        """
+        Raster for previews: JPEG sources decode straight to ``mode`` at the
+        smallest scale still covering ``size``, other formats in full. The
+        handle's own raster is left untouched.
+        """
+        if self._image is not None or self._data is None:
+            return self.image
+        from PIL import Image
+
+        img = Image.open(MemoryReader(self._data))  # own header: draft() must not change the handle's
+        img.draft(mode, size)
+        img.load()
+        return img
+
+    @property
+    def data(self) -> Optional[memoryview]:
+        """Original encoded bytes, if the handle came from encoded data."""
+        return self._data
+
+    def stream(self, name: Optional[str] = None) -> MemoryReader:
+        """File object over the encoded bytes, e.g. for multipart uploads."""
+        buf = self.upload_buffer()
+        fmt = self.format if self._data is not None and self.format in UPLOAD_FORMATS else "PNG"
+        return MemoryReader(buf, name=name or f"image.{fmt.lower()}")
+
+    def upload_buffer(self) -> memoryview:
+        """Encoded bytes a provider accepts: the original when possible, else PNG."""
+        if self._data is not None and self.format in UPLOAD_FORMATS:
+            return self._data
+        return self.encoded("PNG", UPLOAD_COMPRESS_LEVEL)
+
+    def encoded(self, format: str = "PNG", compress_level: int = 6) -> memoryview:
+        """
+        Encoded bytes in ``format``; the original buffer is returned untouched
+        when it is already in that format, otherwise the result is cached.
+        """
+        format = format.upper()
+        if self._data is not None and self.format == format:
+            return self._data
+        key = (format, compress_level)
+        if key not in self._encoded:
+            out = io.BytesIO()
+            img = self.image
+            if format == "JPEG" and img.mode not in ("RGB", "L", "CMYK"):
+                img = img.convert("RGB")
+            img.save(out, format=format, compress_level=compress_level)
+            self._encoded[key] = out.getbuffer()
+        return self._encoded[key]
@@ -0,0 +1,338 @@
+"""
+Header-only image probing: size, DPI, colour mode and ICC presence without
+decoding pixel data.
+
+PNG, JPEG, TIFF (classic and BigTIFF) and WebP headers are parsed directly,
+reading only the few hundred bytes the metadata lives in and skipping over
+everything else. Other formats fall back to Pillow's lazy ``Image.open``.
+"""
+import io
+import os
+import struct
+from typing import BinaryIO, Dict, NamedTuple, Optional, Tuple, Union
+
+from utils.image_handle import MemoryReader
+
+Source = Union[bytes, bytearray, memoryview, str, os.PathLike, BinaryIO]
+
+class ImageInfo(NamedTuple):
+    format: str  # Pillow format name: PNG, JPEG, TIFF, WEBP, ...
+    width: int
+    height: int
+    dpi: Optional[Tuple[float, float]]  # None when the file does not declare a resolution
+    mode: str  # Pillow-style mode of the decoded image: L, RGB, RGBA, CMYK, P, ...
+    has_icc: bool
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+class ProbeError(ValueError):
+    """The header is truncated or malformed."""
+
+class _Reader:
+    """Reads and skips over a stream, tracking the offset from where it started."""
+
+    def __init__(self, fh: BinaryIO):
+        self.fh = fh
+        self.seekable = fh.seekable() if hasattr(fh, "seekable") else False
+        self.base = fh.tell() if self.seekable else 0
+        self.pos = 0
+
+    def read(self, n: int) -> bytes:
+        data = self.fh.read(n)
+        while len(data) < n:  # raw and network streams may return short reads
+            more = self.fh.read(n - len(data))
+            if not more:
+                raise ProbeError("truncated image header")
+            data += more
+        self.pos += n
+        return data
+
+    def skip(self, n: int) -> None:
+        if self.seekable:
+            self.fh.seek(n, io.SEEK_CUR)
+            self.pos += n
+            return
+        while n > 0:
+            n -= len(self.read(min(n, 65536)))
+
+    def seek(self, pos: int) -> None:
+        """Move to ``pos``; forward-only streams can only move forward."""
+        if self.seekable:
+            self.fh.seek(self.base + pos)
+            self.pos = pos
+        elif pos >= self.pos:
+            self.skip(pos - self.pos)
+        else:
+            raise ProbeError("header points backwards in a forward-only stream")
+
+_PNG_MODES = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+
+def _probe_png(r: _Reader) -> ImageInfo:
+    r.skip(8)
+    length, tag = struct.unpack(">I4s", r.read(8))
+    if tag != b"IHDR":
+        raise ProbeError("PNG without IHDR")
+    w, h, depth, color = struct.unpack(">IIBB", r.read(10))
+    r.skip(length - 10 + 4)
+    mode = _PNG_MODES.get(color, "RGB")
+    if color == 0:
+        mode = {1: "1", 16: "I;16"}.get(depth, "L")
+    dpi, icc = None, False
+    # ancillary chunks that matter here all precede the first IDAT
+    while True:
+        length, tag = struct.unpack(">I4s", r.read(8))
+        if tag in (b"IDAT", b"IEND"):
+            break
+        if tag == b"pHYs":
+            px, py, unit = struct.unpack(">IIB", r.read(9))
+            dpi = (px * 0.0254, py * 0.0254) if unit == 1 else None
+            r.skip(length - 9 + 4)
+        else:
+            icc = icc or tag == b"iCCP"
+            r.skip(length + 4)
+    return ImageInfo("PNG", w, h, dpi, mode, icc)
+
+# SOF markers carrying frame dimensions (DHT, JPG and DAC share the range)
+_JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _probe_jpeg(r: _Reader) -> ImageInfo:
+    r.skip(2)
+    size = dpi = exif_dpi = None
+    components, icc = 0, False
+    while size is None:
+        marker = r.read(2)
+        while marker[0] != 0xFF or marker[1] == 0xFF:  # fill bytes
+            marker = marker[1:] + r.read(1)
+        code = marker[1]
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue  # standalone markers
+        if code == 0xDA:
+            raise ProbeError("JPEG scan before frame header")
+        length = struct.unpack(">H", r.read(2))[0] - 2
+        if code == 0xE0 and length >= 12:
+            seg = r.read(length)
+            if seg[:5] == b"JFIF\x00":
+                unit, dx, dy = struct.unpack(">BHH", seg[7:12])
+                if unit in (1, 2) and dx and dy:
+                    dpi = (float(dx), float(dy)) if unit == 1 else (dx * 2.54, dy * 2.54)
+        elif code == 0xE1 and length > 14:
+            seg = r.read(length)
+            if seg[:6] == b"Exif\x00\x00":
+                try:
+                    exif_dpi = _tiff_ifd0(_Reader(MemoryReader(seg[6:])))[1]
+                except (ProbeError, struct.error):
+                    pass
+        elif code == 0xE2 and length >= 12:
+            icc = icc or r.read(12) == b"ICC_PROFILE\x00"
+            r.skip(length - 12)
+        elif code in _JPEG_SOF:
+            _bits, h, w, components = struct.unpack(">BHHB", r.read(6))
+            size = (w, h)
+        else:
+            r.skip(length)
+    mode = {1: "L", 3: "RGB", 4: "CMYK"}.get(components, "RGB")
+    return ImageInfo("JPEG", size[0], size[1], dpi or exif_dpi, mode, icc)
+
+_TIFF_TYPES = {1: "B", 2: "B", 3: "H", 4: "I", 5: "II", 6: "b", 7: "B", 8: "h", 9: "i", 10: "ii",
+               11: "f", 12: "d", 16: "Q", 17: "q", 18: "Q"}
+_TIFF_TAGS = {256, 257, 258, 262, 277, 282, 283, 296, 338, 34675}
+
+def _tiff_values(order: str, typ: int, n: int, data: bytes) -> tuple:
+    fmt = _TIFF_TYPES[typ] * n
+    vals = struct.unpack(order + fmt, data[:struct.calcsize(order + fmt)])
+    if typ in (5, 10):  # rationals
+        vals = tuple(vals[k] / vals[k + 1] if vals[k + 1] else 0.0 for k in range(0, len(vals), 2))
+    return vals
+
+def _tiff_ifd0(r: _Reader) -> Tuple[Dict[int, tuple], Optional[Tuple[float, float]]]:
+    """Read the first IFD's tags of interest and the resolution they declare."""
+    order = {b"II": "<", b"MM": ">"}.get(r.read(2))
+    if order is None:
+        raise ProbeError("not a TIFF header")
+    magic = struct.unpack(order + "H", r.read(2))[0]
+    big = magic == 43
+    if big:
+        r.skip(4)
+        offset = struct.unpack(order + "Q", r.read(8))[0]
+    elif magic == 42:
+        offset = struct.unpack(order + "I", r.read(4))[0]
+    else:
+        raise ProbeError("not a TIFF header")
+    r.seek(offset)
+    count = struct.unpack(order + ("Q" if big else "H"), r.read(8 if big else 2))[0]
+    entry, inline = (20, 8) if big else (12, 4)
+    table = r.read(count * entry)
+    tags: Dict[int, tuple] = {}
+    deferred = []  # (offset, tag, type, count) of values stored outside the table
+    for i in range(count):
+        raw = table[i * entry:(i + 1) * entry]
+        tag, typ = struct.unpack(order + "HH", raw[:4])
+        n = struct.unpack(order + ("Q" if big else "I"), raw[4:4 + inline])[0]
+        if tag not in _TIFF_TAGS or typ not in _TIFF_TYPES:
+            continue
+        if tag == 34675:  # ICC profile: presence is all we need
+            tags[tag] = (n,)
+            continue
+        nbytes = struct.calcsize(order + _TIFF_TYPES[typ]) * n
+        if nbytes > inline:
+            deferred.append((struct.unpack(order + ("Q" if big else "I"), raw[4 + inline:])[0], tag, typ, n))
+        else:
+            tags[tag] = _tiff_values(order, typ, n, raw[4 + inline:])
+    # read out-of-line values in file order, so forward-only streams never seek back
+    for pos, tag, typ, n in sorted(deferred):
+        if pos < r.pos and not r.seekable:
+            continue
+        r.seek(pos)
+        tags[tag] = _tiff_values(order, typ, n, r.read(struct.calcsize(order + _TIFF_TYPES[typ]) * n))
+    dpi = None
+    if 282 in tags and 283 in tags:
+        unit = tags.get(296, (2,))[0]
+        if unit in (2, 3):
+            f = 1.0 if unit == 2 else 2.54
+            dpi = (tags[282][0] * f, tags[283][0] * f)
+    return tags, dpi
+
+def _probe_tiff(r: _Reader) -> ImageInfo:
+    tags, dpi = _tiff_ifd0(r)
+    if 256 not in tags or 257 not in tags:
+        raise ProbeError("TIFF without dimensions")
+    photometric = tags.get(262, (1,))[0]
+    samples = tags.get(277, (1,))[0]
+    bits = tags.get(258, (1,))[0]
+    extra = 338 in tags
+    if photometric in (0, 1):
+        mode = "1" if bits == 1 else "I;16" if bits == 16 else "LA" if samples == 2 and extra else "L"
+    elif photometric == 2:
+        mode = "RGBA" if samples >= 4 and extra else "RGBX" if samples >= 4 else "RGB"
+    elif photometric == 3:
+        mode = "P"
+    elif photometric == 5:
+        mode = "CMYK"
+    elif photometric == 8:
+        mode = "LAB"
+    else:  # YCbCr and friends decode to RGB
+        mode = "RGB"
+    return ImageInfo("TIFF", tags[256][0], tags[257][0], dpi, mode, 34675 in tags)
+
+def _probe_webp(r: _Reader) -> ImageInfo:
+    riff_size = struct.unpack("<4sI4s", r.read(12))[1]
+    size, alpha, icc = None, False, False
+    consumed = 4
+    while size is None and consumed < riff_size:
+        tag, length = struct.unpack("<4sI", r.read(8))
+        padded = length + (length & 1)
+        consumed += 8 + padded
+        if tag == b"VP8X":
+            head = r.read(10)
+            icc, alpha = bool(head[0] & 0x20), bool(head[0] & 0x10)
+            size = (int.from_bytes(head[4:7], "little") + 1, int.from_bytes(head[7:10], "little") + 1)
+            r.skip(padded - 10)
+        elif tag == b"VP8 ":
+            head = r.read(10)
+            if head[3:6] != b"\x9d\x01\x2a":
+                raise ProbeError("bad VP8 frame header")
+            w, h = struct.unpack("<HH", head[6:10])
+            size = (w & 0x3FFF, h & 0x3FFF)
+        elif tag == b"VP8L":
+            head = r.read(5)
+            if head[0] != 0x2F:
+                raise ProbeError("bad VP8L header")
+            bits = int.from_bytes(head[1:5], "little")
+            size = ((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+            alpha = bool(bits >> 28 & 1)
+        else:
+            r.skip(padded)
+    if size is None:
+        raise ProbeError("WebP without image chunk")
+    return ImageInfo("WEBP", size[0], size[1], None, "RGBA" if alpha else "RGB", icc)
+
+def _sniff(head: bytes):
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return _probe_png
+    if head.startswith(b"\xff\xd8"):
+        return _probe_jpeg
+    if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return _probe_tiff
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return _probe_webp
+    return None
+
+def _probe_pil(fh: BinaryIO) -> ImageInfo:
+    from PIL import Image
+
+    with Image.open(fh) as img:
+        dpi = img.info.get("dpi")
+        return ImageInfo(img.format, img.width, img.height, tuple(float(d) for d in dpi) if dpi else None,
+                         img.mode, bool(img.info.get("icc_profile")))
+
+class _Prepend(io.RawIOBase):
+    """Forward-only stream that replays already-consumed ``head`` bytes first."""
+
+    def __init__(self, head: bytes, fh: BinaryIO):
+        self._head, self._fh = head, fh
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n], self._head = self._head[:n], self._head[n:]
+            return n
+        data = self._fh.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def probe_stream(fh: BinaryIO) -> ImageInfo:
+    """
+    Probe an image from a binary stream positioned at its first byte.
+
+    Seekable streams skip straight past pixel data and are rewound to where
+    they started afterwards. Forward-only streams (e.g. an HTTP response
+    body) are read up to the metadata, which for a TIFF storing its first
+    IFD after the pixels means reading through them.
+
+    Raises:
+        ProbeError: The header is truncated or malformed
+        PIL.UnidentifiedImageError: The format is not recognised at all
+    """
+    seekable = fh.seekable() if hasattr(fh, "seekable") else False
+    start = fh.tell() if seekable else 0
+    head = fh.read(12)
+    parser = _sniff(head)
+    if seekable:
+        fh.seek(start)
+    elif parser is not None:
+        fh = _Prepend(head, fh)
+    else:
+        fh = io.BytesIO(head + fh.read())
+    try:
+        if parser is None:
+            return _probe_pil(fh)
+        return parser(_Reader(fh))
+    except (struct.error, IndexError) as e:
+        raise ProbeError(f"malformed {parser.__name__[7:].upper()} header: {e}") from None
+    finally:
+        if seekable:  # leave seekable streams where they were, e.g. for a later full read
+            fh.seek(start)
+
+def probe_image(src: Source) -> ImageInfo:
+    """
+    Size, DPI, colour mode and ICC presence of an image without decoding it.
+
+    Args:
+        src: Encoded bytes, a path, or a binary stream at the start of the image
+
+    Returns:
+        An ``ImageInfo``; ``dpi`` is in dots per inch, from pHYs, JFIF, Exif or
+        TIFF resolution tags. Unlike Pillow, a TIFF resolution without an
+        absolute unit is reported as ``None`` rather than as dpi.
+    """
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as fh:
+            return probe_stream(fh)
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return probe_stream(MemoryReader(src))
+    return probe_stream(src)
@@ -0,0 +1,341 @@
+"""
+Per-stage timings, byte counts and memory for the pipeline hot paths.
+
+``instrument(op)`` wraps an entry point: every call opens a trace, counts
+bytes in and out and records its wall time. ``stage(name)`` times a step
+inside it (HTTP call, download, decode, ...). Everything lands in
+process-wide Prometheus-style counters and histograms, served as text by
+``start_metrics_server`` on ``/metrics``; recent traces, with optional
+cProfile/tracemalloc captures, are served as JSON on ``/traces``.
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 disables the endpoint
+# Finished traces kept for /traces
+TRACE_HISTORY = 200
+# Functions listed per cProfile capture
+PROFILE_TOP = 25
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class _Metric:
+    def __init__(self, name: str, help: str, kind: str):
+        self.name, self.help, self.kind = name, help, kind
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+def _fmt_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter(_Metric):
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help, "counter")
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            return self._header() + [f"{self.name}{_fmt_labels(k)} {v:g}" for k, v in sorted(self._values.items())]
+
+class Histogram(_Metric):
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = _SECONDS_BUCKETS):
+        super().__init__(name, help, "histogram")
+        self.buckets = buckets
+        self._values: Dict[Labels, List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            v = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    def expose(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                for bound, n in zip(self.buckets, v):
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, 'le=%s' % json.dumps('%g' % bound))} {n:g}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, 'le=%s' % json.dumps('+Inf'))} {v[-1]:g}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {v[-2]:.6f}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {v[-1]:g}")
+        return lines
+
+OP_CALLS = Counter("prepress_op_calls_total", "Instrumented calls by operation and outcome")
+OP_SECONDS = Histogram("prepress_op_seconds", "Wall time of instrumented calls")
+STAGE_SECONDS = Histogram("prepress_stage_seconds", "Wall time of pipeline stages")
+BYTES_IN = Counter("prepress_bytes_in_total", "Payload bytes handed to an operation")
+BYTES_OUT = Counter("prepress_bytes_out_total", "Payload bytes returned by an operation")
+REPLICATE_QUEUE = Histogram("prepress_replicate_queue_seconds", "Replicate prediction time from creation to start")
+REPLICATE_RUN = Histogram("prepress_replicate_run_seconds", "Replicate prediction time from start to completion")
+PDF_PAGE_SECONDS = Histogram("prepress_pdf_page_seconds", "PyMuPDF analysis time per page",
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+PDF_RENDER_SECONDS = Histogram("prepress_pdf_render_seconds", "PyMuPDF render and PNG encode time per view",
+                               buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+PDF_RENDER_CACHE = Counter("prepress_pdf_render_cache_total", "PDF render cache lookups by result")
+SCHEDULER_WAIT = Histogram("prepress_scheduler_wait_seconds", "Time provider calls waited for a rate-limit token",
+                           buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+SCHEDULER_EVENTS = Counter("prepress_scheduler_events_total", "Provider calls coalesced or retried by the scheduler")
+_METRICS = [OP_CALLS, OP_SECONDS, STAGE_SECONDS, BYTES_IN, BYTES_OUT, REPLICATE_QUEUE, REPLICATE_RUN, PDF_PAGE_SECONDS,
+            PDF_RENDER_SECONDS, PDF_RENDER_CACHE, SCHEDULER_WAIT, SCHEDULER_EVENTS]
+
+log = logging.getLogger(__name__)
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Trace:
+    """One instrumented call: stage timings, bytes and (optionally) a profile."""
+
+    def __init__(self, op: str):
+        self.op = op
+        self.started = time.time()
+        self.stages: Dict[str, float] = {}
+        self.bytes_in = self.bytes_out = 0
+        self.fields: Dict[str, Any] = {}
+        self._lock = threading.Lock()  # stages may be added from worker threads
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_capture: contextvars.ContextVar[bool] = contextvars.ContextVar("capture", default=False)
+_traces: Deque[Dict[str, Any]] = deque(maxlen=TRACE_HISTORY)
+# One profiled call at a time: tracemalloc's peak and cProfile are process-wide
+_profile_lock = threading.Lock()
+
+def _payload_size(value: Any) -> int:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return memoryview(value).nbytes
+    data = getattr(value, "data", None)  # ImageHandle
+    if isinstance(data, memoryview):
+        return data.nbytes
+    if isinstance(value, list):
+        return sum(_payload_size(v) for v in value)
+    return 0
+
+def record_stage(name: str, seconds: float) -> None:
+    """Record ``seconds`` spent in stage ``name`` of the current operation."""
+    trace = _current.get()
+    STAGE_SECONDS.observe(seconds, op=trace.op if trace else "none", stage=name)
+    if trace:
+        trace.add_stage(name, seconds)
+
+def annotate(**fields: Any) -> None:
+    """Attach ``fields`` (e.g. a job id) to the current trace's record."""
+    trace = _current.get()
+    if trace:
+        trace.fields.update(fields)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage ``name`` of the current operation."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+def observe_prediction(prediction: Any, model: str) -> None:
+    """Split a finished Replicate prediction (API dict or client object) into queue and run time."""
+    def ts(key):
+        value = prediction.get(key) if isinstance(prediction, dict) else getattr(prediction, key, None)
+        if isinstance(value, str) and value:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        return value.timestamp() if isinstance(value, datetime) else None
+    created, started, completed = ts("created_at"), ts("started_at"), ts("completed_at")
+    if created and started:
+        REPLICATE_QUEUE.observe(max(0.0, started - created), model=model)
+        record_stage("replicate_queue", max(0.0, started - created))
+    if started and completed:
+        REPLICATE_RUN.observe(max(0.0, completed - started), model=model)
+        record_stage("replicate_run", max(0.0, completed - started))
+
+@contextmanager
+def capture(enabled: bool = True) -> Iterator[None]:
+    """Profile instrumented calls made inside the block with cProfile and tracemalloc."""
+    token = _capture.set(enabled)
+    try:
+        yield
+    finally:
+        _capture.reset(token)
+
+def _start_tracemalloc() -> bool:
+    """Start tracing, or reset the peak if someone else already traces; True if we started it."""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        return False
+    tracemalloc.start()
+    return True
+
+def _stop_tracemalloc(started: bool) -> Tuple[float, List[str]]:
+    peak = tracemalloc.get_traced_memory()[1]
+    top = [str(s) for s in tracemalloc.take_snapshot().statistics("lineno")[:10]]
+    if started:
+        tracemalloc.stop()
+    return peak / 2 ** 20, top
+
+def instrument(op: str) -> Callable:
+    """
+    Decorator recording calls, wall time, bytes in/out and stages of ``op``.
+
+    Calls nested inside another instrumented call are also recorded as a
+    stage of the outer trace, with their own stages as ``op/stage``. Each
+    record carries the change in resident memory over the call
+    (``rss_delta_mb``) and the process's peak so far (``process_peak_rss_mb``).
+
+    Inside ``capture()`` the call is profiled; profiled calls run one at a
+    time, since the traced memory is process-wide (the profile covers the
+    calling thread).
+    """
+    def wrap(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            outer = _current.get()
+            trace = Trace(op)
+            trace.bytes_in = sum(_payload_size(v) for v in (*args, *kwargs.values()))
+            token = _current.set(trace)
+            profiling = _capture.get() and outer is None
+            profiler = cProfile.Profile() if profiling else None
+            if profiling:
+                _profile_lock.acquire()
+                started_tracing = _start_tracemalloc()
+                profiler.enable()
+            rss0 = rss_bytes()
+            status, t0 = "ok", time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                trace.bytes_out = _payload_size(result)
+                return result
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                elapsed = time.perf_counter() - t0
+                _current.reset(token)
+                record = {"op": op, **trace.fields, "status": status, "started": trace.started,
+                          "seconds": round(elapsed, 4),
+                          "stages": {k: round(v, 4) for k, v in trace.stages.items()},
+                          "bytes_in": trace.bytes_in, "bytes_out": trace.bytes_out,
+                          "process_peak_rss_mb": round(peak_rss_bytes() / 2 ** 20, 1)}
+                rss1 = rss_bytes()
+                if rss0 is not None and rss1 is not None:
+                    record["rss_delta_mb"] = round((rss1 - rss0) / 2 ** 20, 1)
+                if profiling:
+                    profiler.disable()
+                    out = io.StringIO()
+                    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+                    record["profile"] = out.getvalue()
+                    try:
+                        record["traced_peak_mb"], record["top_allocations"] = _stop_tracemalloc(started_tracing)
+                    finally:
+                        _profile_lock.release()
+                OP_CALLS.inc(op=op, status=status)
+                OP_SECONDS.observe(elapsed, op=op)
+                BYTES_IN.inc(trace.bytes_in, op=op)
+                BYTES_OUT.inc(trace.bytes_out, op=op)
+                if outer is not None:
+                    # the outer trace sees this call as one stage, plus its own stages under "op/"
+                    record_stage(op, elapsed)
+                    for name, seconds in trace.stages.items():
+                        outer.add_stage(f"{op}/{name}", seconds)
+                else:
+                    _traces.append(record)
+        return wrapper
+    return wrap
+
+def recent_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent top-level traces, newest first."""
+    return list(_traces)[::-1][:limit]
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _METRICS:
+        lines += metric.expose()
+    lines += ["# HELP prepress_process_peak_rss_bytes Peak resident set size of the process",
+              "# TYPE prepress_process_peak_rss_bytes gauge",
+              f"prepress_process_peak_rss_bytes {peak_rss_bytes()}"]
+    return "\n".join(lines) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = render_metrics().encode(), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/traces":
+            body, ctype = json.dumps(recent_traces(TRACE_HISTORY), default=str).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve ``/metrics`` and ``/traces`` on a daemon thread.
+
+    When ``port`` is taken, e.g. by another app process on the same host,
+    this process serves on a free port instead and logs a warning naming it.
+
+    Returns:
+        The server, or None when disabled (port 0) or no port could be bound
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        try:
+            server = ThreadingHTTPServer((host, 0), _Handler)
+        except OSError:
+            log.warning("Metrics endpoint disabled: cannot bind %s:%s (%s)", host, port, e)
+            return None
+        log.warning("Metrics port %s:%s unavailable (%s); this process (pid %s) serves /metrics on port %s",
+                    host, port, e, os.getpid(), server.server_address[1])
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
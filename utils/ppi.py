@@ -1,11 +1,21 @@
-import io
-from typing import Tuple, List, Dict, Any
-from PIL import Image
-import fitz  # PyMuPDF
-
-def ppi_from_image_bytes(data: bytes, target_mm: Tuple[float,float]) -> Dict[str, Any]:
-    img = Image.open(io.BytesIO(data))
-    px_w, px_h = img.size
+import os
+import math
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Tuple, List, Dict, Any, Iterator, Optional, Union, NamedTuple, BinaryIO
+
+from utils.image_probe import probe_image
+from utils.metrics import PDF_PAGE_SECONDS, instrument, record_stage
+
+# Pages handed to each worker per task; small enough that results stream back
+# steadily, large enough that the per-task overhead stays cheap.
+PAGES_PER_TASK = 16
+
+def ppi_from_image_bytes(data: Union[bytes, str, BinaryIO], target_mm: Tuple[float,float]) -> Dict[str, Any]:
+    info = probe_image(data)
+    px_w, px_h = info.size
     tw_mm, th_mm = target_mm
     tw_in, th_in = tw_mm / 25.4, th_mm / 25.4
     req_ppi_w = px_w / tw_in if tw_in > 0 else None
@@ -14,26 +24,208 @@ def ppi_from_image_bytes(data: bytes, target_mm: Tuple[float,float]) -> Dict[str
         "pixels": (px_w, px_h),
         "target_mm": target_mm,
         "required_ppi": (round(req_ppi_w,2) if req_ppi_w else None, round(req_ppi_h,2) if req_ppi_h else None),
+        "dpi": tuple(round(d, 1) for d in info.dpi) if info.dpi else None,
     }
 
-def min_effective_ppi_in_pdf(pdf_bytes: bytes) -> List[Dict[str, Any]]:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    results = []
-    for pno, page in enumerate(doc):
-        page_min = None
-        page_images = []
-        images = page.get_images(full=True)
-        for (xref, smask, w, h, bpc, cs, name, filter, d, enc, interp) in images:
-            rect = page.get_image_bbox(xref)  # display bbox in points
-            w_in, h_in = rect.width/72.0, rect.height/72.0
+def _fitz():
+    # PyMuPDF is only loaded once a PDF is analysed, not when the app starts
+    import fitz
+    return fitz
+
+def _open_pdf(pdf: Union[bytes, str]):
+    return _fitz().open(pdf) if isinstance(pdf, str) else _fitz().open(stream=pdf, filetype="pdf")
+
+class ImageMeta(NamedTuple):
+    width: int
+    height: int
+    bpc: int
+    colorspace: str
+
+class Placement(NamedTuple):
+    """One drawing of an image on a page; pixel data lives in ``ImageMeta``."""
+    xref: int  # 0 for inline images
+    bbox: Tuple[float, float, float, float]  # display bbox in points
+    display_in: Tuple[float, float]
+    ppi_x: float
+    ppi_y: float
+    min_ppi: float
+
+class PdfImageIndex:
+    """
+    Document-level image index shared by all pages handled in one process.
+
+    Each xref's metadata is recorded the first time a page references it, and
+    image content digests (only needed to tell apart same-sized images on one
+    page) are computed at most once per xref. Pool workers build one index per
+    document when they start and reuse it for every page range they get.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.images: Dict[int, ImageMeta] = {}
+        self._digests: Dict[int, bytes] = {}
+
+    def _digest(self, xref: int) -> bytes:
+        if xref not in self._digests:
+            self._digests[xref] = _fitz().Pixmap(self.doc, xref).digest
+        return self._digests[xref]
+
+    def placements(self, page) -> List[Placement]:
+        by_sig: Dict[Tuple, List[int]] = {}
+        for item in page.get_images(full=True):
+            xref, _smask, w, h, bpc, cs = item[:6]
+            if xref not in self.images:
+                self.images[xref] = ImageMeta(w, h, bpc, cs)
+            sig = (w, h, bpc)
+            if xref not in by_sig.setdefault(sig, []):
+                by_sig[sig].append(xref)
+
+        # get_image_info() lists every draw with its own transform; hashing is
+        # only requested when two xrefs on this page share a pixel signature.
+        ambiguous = any(len(x) > 1 for x in by_sig.values())
+        infos = page.get_image_info(hashes=ambiguous)
+        by_digest = {}
+        if ambiguous:
+            by_digest = {self._digest(x): x for xs in by_sig.values() if len(xs) > 1 for x in xs}
+
+        out = []
+        for info in infos:
+            w, h = info["width"], info["height"]
+            candidates = by_sig.get((w, h, info["bpc"]), [])
+            if len(candidates) == 1:
+                xref = candidates[0]
+            else:
+                xref = by_digest.get(info.get("digest"), 0)
+            a, b, c, d, _e, _f = info["transform"]
+            # the transform maps the unit square onto the page, so its column
+            # lengths are the displayed size along the image's own axes
+            w_in, h_in = math.hypot(a, b)/72.0, math.hypot(c, d)/72.0
             if w_in <= 0 or h_in <= 0:
                 continue
-            ppi_x = w / w_in
-            ppi_y = h / h_in
-            eff = min(ppi_x, ppi_y)
-            entry = {"xref": xref, "display_in": (round(w_in,2), round(h_in,2)), "pixels": (w, h),
-                     "ppi_x": round(ppi_x,1), "ppi_y": round(ppi_y,1), "min_ppi": round(eff,1)}
-            page_images.append(entry)
-            page_min = entry if (page_min is None or eff < page_min["min_ppi"]) else page_min
-        results.append({"page": pno+1, "min_ppi": (page_min["min_ppi"] if page_min else None), "images": page_images})
+            ppi_x, ppi_y = w / w_in, h / h_in
+            out.append(Placement(xref, tuple(round(v, 2) for v in info["bbox"]),
+                                 (round(w_in,2), round(h_in,2)),
+                                 round(ppi_x,1), round(ppi_y,1), round(min(ppi_x, ppi_y),1)))
+        return out
+
+def _page_effective_ppi(index: PdfImageIndex, page, pno: int) -> Dict[str, Any]:
+    placements = index.placements(page)
+    page_min = min((p.min_ppi for p in placements), default=None)
+    return {"page": pno+1, "min_ppi": page_min, "images": placements}
+
+def page_result_as_json(result: Dict[str, Any], index: Optional[Dict[int, ImageMeta]] = None) -> Dict[str, Any]:
+    """Expand the compact placement tuples of a page result for display."""
+    images = []
+    for p in result["images"]:
+        entry = p._asdict()
+        if index and p.xref in index:
+            entry["pixels"] = (index[p.xref].width, index[p.xref].height)
+        images.append(entry)
+    return {**result, "images": images}
+
+def _timed_page(index: PdfImageIndex, page, pno: int) -> Tuple[Dict[str, Any], float]:
+    t0 = time.perf_counter()
+    result = _page_effective_ppi(index, page, pno)
+    return result, time.perf_counter() - t0
+
+_worker_index: Optional[PdfImageIndex] = None
+
+def _init_worker(path: str) -> None:
+    # Pool initializer: each worker opens the file once and keeps its index
+    # for all the page ranges it analyses; the process exits with the pool.
+    global _worker_index
+    _worker_index = PdfImageIndex(_open_pdf(path))
+
+def _analyze_page_range(start: int, stop: int) -> Tuple[List[Dict[str, Any]], Dict[int, ImageMeta], List[float]]:
+    # Runs in a worker process. Only the xrefs first seen by this task are
+    # returned; page times travel back with the results, as metrics are per process.
+    index = _worker_index
+    known = set(index.images)
+    timed = [_timed_page(index, index.doc[pno], pno) for pno in range(start, stop)]
+    new = {x: m for x, m in index.images.items() if x not in known}
+    return [r for r, _ in timed], new, [t for _, t in timed]
+
+def pdf_page_count(pdf: Union[bytes, str]) -> int:
+    doc = _open_pdf(pdf)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+def iter_effective_ppi_in_pdf(pdf: Union[bytes, str], workers: Optional[int] = None,
+                              pages_per_task: int = PAGES_PER_TASK,
+                              index: Optional[Dict[int, ImageMeta]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield per-page PPI results as soon as they are computed.
+
+    Page ranges are spread over a process pool, each worker opening the PDF by
+    path once, so results arrive in completion order rather than page order. Short
+    documents, or ``workers=1``, are analysed serially in this process.
+
+    Args:
+        pdf: PDF content as bytes, or a path to the PDF on disk
+        workers: Number of worker processes (defaults to the CPU count)
+        pages_per_task: Number of consecutive pages analysed per task
+        index: Optional dict filled with ``xref -> ImageMeta`` as pages complete
+
+    Yields:
+        One result dict per page, same shape as ``min_effective_ppi_in_pdf``.
+        ``images`` holds one ``Placement`` per draw, so an image placed twice
+        at different scales is reported twice.
+    """
+    workers = workers or os.cpu_count() or 1
+    n_pages = pdf_page_count(pdf)
+    if workers <= 1 or n_pages <= pages_per_task:
+        doc = _open_pdf(pdf)
+        try:
+            total = 0.0
+            doc_index = PdfImageIndex(doc)
+            if index is not None:
+                doc_index.images = index
+            for pno, page in enumerate(doc):
+                result, seconds = _timed_page(doc_index, page, pno)
+                PDF_PAGE_SECONDS.observe(seconds)
+                total += seconds
+                yield result
+        finally:
+            record_stage("pdf_page", total)
+            doc.close()
+        return
+
+    tmp_path = None
+    if isinstance(pdf, str):
+        path = pdf
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(pdf)
+        path = tmp_path
+    try:
+        ranges = [(s, min(s + pages_per_task, n_pages)) for s in range(0, n_pages, pages_per_task)]
+        # spawn: the Streamlit server is multi-threaded, forking it is unsafe
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=ctx,
+                                 initializer=_init_worker, initargs=(path,)) as pool:
+            futures = [pool.submit(_analyze_page_range, s, e) for s, e in ranges]
+            try:
+                for fut in as_completed(futures):
+                    pages, images, seconds = fut.result()
+                    if index is not None:
+                        index.update(images)
+                    for t in seconds:
+                        PDF_PAGE_SECONDS.observe(t)
+                    # summed over workers, so it can exceed the wall time
+                    record_stage("pdf_page", sum(seconds))
+                    yield from pages
+            finally:
+                for fut in futures:
+                    fut.cancel()
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+
+@instrument("pdf.min_ppi")
+def min_effective_ppi_in_pdf(pdf_bytes: bytes, workers: Optional[int] = 1) -> List[Dict[str, Any]]:
+    results = list(iter_effective_ppi_in_pdf(pdf_bytes, workers=workers))
+    results.sort(key=lambda r: r["page"])
     return results
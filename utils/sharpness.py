@@ -0,0 +1,429 @@
+"""
+Pixel-level sharpness and effective resolution.
+
+The PPI check in ``utils.ppi`` only divides pixels by millimetres, so an
+image enlarged with Lanczos passes it while holding no more detail than the
+original. Here the luminance is measured tile by tile:
+
+- Laplacian variance, the usual focus measure (higher is sharper);
+- the residual left after reducing the tile by a factor ``k`` and expanding
+  it back, for each ``k`` in SCALES. Content enlarged by ``s`` has almost no
+  energy above 1/s of its Nyquist frequency, so the residual stays near zero
+  up to ``k = s``. The factor where it reaches DETAIL_THRESHOLD of the
+  residual at the coarsest factor is the tile's *detail scale*: about 1 for
+  a sharp original, about ``s`` for an ``s``-times upscale. Dividing the
+  nominal PPI by it gives the resolution the print actually holds.
+
+The luminance is analysed in strips with a halo, so the analysis buffers
+grow with the image width only, whatever its height. 8-bit PNGs and
+uncompressed TIFFs are also decoded strip by strip; other formats are decoded
+once to a one-byte grey raster (JPEG straight from the codec).
+"""
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from utils.image_handle import ImageHandle, MemoryReader
+from utils.metrics import instrument
+
+# Tile edge in pixels; one heatmap cell per tile
+TILE = 128
+# Reduce/expand factors probed; the last one normalises the residuals
+SCALES = (1.5, 2.0, 3.0, 4.0, 6.0, 8.0)
+# Fraction of the coarsest residual at which a tile counts as holding detail
+DETAIL_THRESHOLD = 0.12
+# Mean squared residual (grey levels²) at the coarsest factor below which a tile is flat
+FLAT_ENERGY = 4.0
+# Rows/columns of context around each strip, enough for the coarsest reduce/expand
+HALO = 16
+
+# Heatmap colours, from no detail at print size to enough
+_RED, _YELLOW, _GREEN = (214, 39, 40), (240, 196, 25), (44, 160, 44)
+
+class SharpnessReport(NamedTuple):
+    size: Tuple[int, int]  # analysed raster, in pixels
+    tile: int
+    laplacian_var: np.ndarray  # per tile (rows x cols)
+    detail_scale: np.ndarray  # per tile; NaN where the tile is flat
+
+    @property
+    def effective_scale(self) -> float:
+        """Median detail scale over the tiles with content (1.0 if all are flat)."""
+        finite = self.detail_scale[np.isfinite(self.detail_scale)]
+        return float(np.median(finite)) if finite.size else 1.0
+
+    @property
+    def flat_fraction(self) -> float:
+        return float(np.mean(~np.isfinite(self.detail_scale)))
+
+    @property
+    def effective_size(self) -> Tuple[int, int]:
+        """Pixel size a sharp image with the same detail would have."""
+        s = self.effective_scale
+        return round(self.size[0] / s), round(self.size[1] / s)
+
+    def effective_ppi(self, ppi: float) -> float:
+        return ppi / self.effective_scale
+
+    def summary(self, ppi: Optional[float] = None) -> Dict[str, Any]:
+        """JSON-friendly digest; with ``ppi`` (the nominal print resolution) adds the effective PPI."""
+        finite = self.detail_scale[np.isfinite(self.detail_scale)]
+        out = {
+            "pixels": self.size,
+            "effective_pixels": self.effective_size,
+            "effective_scale": round(self.effective_scale, 2),
+            "worst_tile_scale": round(float(np.percentile(finite, 90)), 2) if finite.size else None,
+            "laplacian_var": round(float(np.median(self.laplacian_var)), 1),
+            "flat_fraction": round(self.flat_fraction, 3),
+        }
+        if ppi:
+            out["nominal_ppi"] = round(ppi, 1)
+            out["effective_ppi"] = round(self.effective_ppi(ppi), 1)
+        return out
+
+def _tile_means(a: np.ndarray, tile: int, squared: bool = False) -> np.ndarray:
+    """Mean of ``a`` (or of its square) over each ``tile``-wide block of a one-tile-high strip."""
+    cols = np.einsum("ij,ij->j", a, a) if squared else a.sum(axis=0)
+    starts = np.arange(0, a.shape[1], tile)
+    return (np.add.reduceat(cols, starts) / (np.diff(np.append(starts, a.shape[1])) * a.shape[0]))[None]
+
+def _detail_scale(energy: np.ndarray) -> np.ndarray:
+    """Per-tile detail scale from the residual energies stacked along axis 0 (one per SCALES entry)."""
+    ks = np.log(np.array((1.0,) + SCALES))
+    norm = np.maximum(energy[-1], 1e-9)
+    # ratio 0 at k=1 (nothing removed); forced monotonic so the first crossing is well defined
+    ratios = np.concatenate([np.zeros((1,) + energy.shape[1:]), np.maximum.accumulate(energy / norm, axis=0)])
+    hi = np.argmax(ratios >= DETAIL_THRESHOLD, axis=0)[None]
+    r_hi, r_lo = np.take_along_axis(ratios, hi, 0)[0], np.take_along_axis(ratios, hi - 1, 0)[0]
+    t = (DETAIL_THRESHOLD - r_lo) / np.maximum(r_hi - r_lo, 1e-9)
+    scale = np.exp(ks[hi[0] - 1] + t * (ks[hi[0]] - ks[hi[0] - 1]))
+    return np.where(energy[-1] < FLAT_ENERGY, np.nan, scale)
+
+def _strip_metrics(padded: np.ndarray, rows: int, width: int, tile: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Metrics of the tiles in the ``rows`` x ``width`` interior of a grey strip padded by HALO on every side."""
+    g = padded.astype(np.float32)
+    inner = (slice(HALO, HALO + rows), slice(HALO, HALO + width))
+    c = g[inner]
+    lap = 4 * c - g[HALO - 1:HALO - 1 + rows, HALO:HALO + width] - g[HALO + 1:HALO + 1 + rows, HALO:HALO + width] \
+        - g[HALO:HALO + rows, HALO - 1:HALO - 1 + width] - g[HALO:HALO + rows, HALO + 1:HALO + 1 + width]
+    lap_var = _tile_means(lap, tile, squared=True) - _tile_means(lap, tile) ** 2
+
+    src = Image.fromarray(padded, "L")
+    h, w = padded.shape
+    energy = []
+    for k in SCALES:
+        small = src.resize((max(1, round(w / k)), max(1, round(h / k))), Image.BOX)
+        r = c - np.asarray(small.resize((w, h), Image.BICUBIC), dtype=np.float32)[inner]
+        energy.append(_tile_means(r, tile, squared=True))
+    return lap_var, _detail_scale(np.stack(energy))
+
+def _analyze(read_rows: Callable[[int, int], np.ndarray], size: Tuple[int, int], tile: int,
+             workers: Optional[int]) -> SharpnessReport:
+    """
+    Run the tile metrics strip by strip.
+
+    Args:
+        read_rows: Returns rows [y0, y1) of the raster as a uint8 grey array;
+            called from this thread, top to bottom, with overlapping ranges
+        size: Raster (width, height)
+        tile: Tile edge in pixels (also the strip height)
+        workers: Threads (Pillow and NumPy release the GIL); defaults to the CPU count
+    """
+    width, height = size
+
+    def strip(grey: np.ndarray, y0: int, top: int, bottom: int):
+        y1 = min(height, y0 + tile)
+        # mirror the missing context at the image borders
+        padded = np.pad(grey, ((HALO - (y0 - top), HALO - (bottom - y1)), (HALO, HALO)), mode="reflect")
+        return _strip_metrics(padded, y1 - y0, width, tile)
+
+    workers = workers or os.cpu_count() or 1
+    results: List[Tuple[np.ndarray, np.ndarray]] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # bounded window: only ``workers + 1`` strips are in memory at once
+        window = []
+        for y0 in range(0, height, tile):
+            top, bottom = max(0, y0 - HALO), min(height, y0 + tile + HALO)
+            window.append(pool.submit(strip, read_rows(top, bottom), y0, top, bottom))
+            if len(window) > workers:
+                results.append(window.pop(0).result())
+        results.extend(f.result() for f in window)
+    return SharpnessReport(size, tile, np.concatenate([r[0] for r in results]),
+                           np.concatenate([r[1] for r in results]))
+
+@instrument("sharpness.image")
+def analyze_image(image: Union[bytes, Image.Image, ImageHandle], tile: int = TILE,
+                  workers: Optional[int] = None) -> SharpnessReport:
+    """
+    Tile sharpness and detail scale of an image.
+
+    Args:
+        image: Image data as bytes, ImageHandle or a decoded image
+        tile: Tile edge in pixels
+        workers: Analysis threads (defaults to the CPU count)
+
+    Returns:
+        SharpnessReport over the full-resolution image
+    """
+    read_rows, size = _row_reader(image)
+    return _analyze(read_rows, size, tile, workers)
+
+def _decode(image: Union[bytes, Image.Image, ImageHandle], mode: str, size: Tuple[int, int]) -> Image.Image:
+    """
+    Decoded ``image``; encoded JPEGs decode straight to ``mode`` and at the
+    smallest scale still covering ``size`` (``draft``).
+    """
+    handle = ImageHandle.wrap(image)
+    if handle.data is None:
+        return handle.image
+    img = Image.open(MemoryReader(handle.data))  # own header: draft() must not change the handle's raster
+    img.draft(mode, size)
+    img.load()
+    return img
+
+def _grey(image: Union[bytes, Image.Image, ImageHandle]) -> np.ndarray:
+    """Full-resolution luminance as a uint8 array: one byte per pixel is all the analysis keeps."""
+    handle = ImageHandle.wrap(image)
+    img = _decode(handle, "L", handle.size)
+    return np.asarray(img if img.mode == "L" else img.convert("L"))
+
+def _strip_grey(strip: Image.Image, source: Image.Image) -> np.ndarray:
+    if strip.mode == "P":
+        strip.putpalette(source.palette.palette, source.palette.mode)
+    return np.asarray(strip if strip.mode == "L" else strip.convert("L"))
+
+class _PngRows:
+    """
+    Grey rows of a non-interlaced 8-bit PNG, decoded a strip at a time.
+
+    The IDAT stream is inflated only as far as the rows asked for, and
+    Pillow's decoder unfilters each strip, primed with the last row of the
+    one before (PNG filters refer to the row above). Rows are read top to
+    bottom; a range may overlap the previous one.
+    """
+
+    def __init__(self, data: memoryview, img: Image.Image):
+        self.img = img
+        self._row_bytes = 1 + img.width * len(img.getbands())  # filter byte + samples
+        self._chunks = self._idat(data)
+        self._inflate = zlib.decompressobj()
+        self._tail = b""
+        self._prev: Optional[bytes] = None  # last decoded row, unfiltered
+        self._rows = np.empty((0, img.width), np.uint8)  # grey rows [start, end)
+        self._start = self._end = 0
+
+    @classmethod
+    def open(cls, data: memoryview, img: Image.Image) -> Optional["_PngRows"]:
+        # 16-bit and sub-byte samples have a raw mode unlike the image mode
+        if img.format != "PNG" or img.info.get("interlace") or len(img.tile) != 1 or img.tile[0][3] != img.mode:
+            return None
+        return cls(data, img)
+
+    @staticmethod
+    def _idat(data: memoryview):
+        pos = 8
+        while pos + 8 <= len(data):
+            length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+            if kind == b"IDAT":
+                yield data[pos + 8:pos + 8 + length]
+            elif kind == b"IEND":
+                return
+            pos += 12 + length
+
+    def _filtered(self, n: int) -> bytes:
+        out, have = [], 0
+        while have < n:
+            if not self._tail:
+                self._tail = next(self._chunks, b"")
+                if not self._tail:
+                    raise ValueError("Truncated PNG data")
+            piece = self._inflate.decompress(self._tail, n - have)
+            self._tail = self._inflate.unconsumed_tail
+            out.append(piece)
+            have += len(piece)
+        return b"".join(out)
+
+    def _decode(self, n: int) -> np.ndarray:
+        block = self._filtered(n * self._row_bytes)
+        primed = self._prev is not None
+        if primed:
+            block = b"\0" + self._prev + block
+        strip = Image.frombytes(self.img.mode, (self.img.width, n + primed), zlib.compress(block, 0), "zip",
+                                self.img.mode)
+        self._prev = np.asarray(strip)[-1].tobytes()
+        return _strip_grey(strip, self.img)[int(primed):]
+
+    def __call__(self, top: int, bottom: int) -> np.ndarray:
+        if top < self._start:
+            raise ValueError("PNG rows must be read top to bottom")
+        if top > self._end:
+            self._decode(top - self._end)
+            self._end = top
+        rows = self._rows[top - self._start:]
+        if bottom > self._end:
+            rows = np.concatenate([rows, self._decode(bottom - self._end)])
+            self._end = bottom
+        self._rows, self._start = rows, top
+        return rows[:bottom - top]
+
+def _raw_rows(data: memoryview, img: Image.Image) -> Optional[Callable[[int, int], np.ndarray]]:
+    """Grey rows of an image stored uncompressed top to bottom (e.g. TIFF), read straight from ``data``."""
+    if len(img.tile) != 1 or img.tile[0][0] != "raw" or img.tile[0][1] != (0, 0) + img.size:
+        return None
+    _, _, offset, args = img.tile[0]
+    rawmode, stride, orientation = args if isinstance(args, tuple) else (args, 0, 1)
+    if orientation != 1:
+        return None
+    stride = stride or len(Image.new(img.mode, (img.width, 1)).tobytes("raw", rawmode))
+
+    def read_rows(y0: int, y1: int) -> np.ndarray:
+        rows = data[offset + y0 * stride:offset + y1 * stride]
+        return _strip_grey(Image.frombytes(img.mode, (img.width, y1 - y0), rows, "raw", rawmode, stride), img)
+    return read_rows
+
+def _row_reader(image: Union[bytes, Image.Image, ImageHandle]) -> Tuple[Callable[[int, int], np.ndarray],
+                                                                        Tuple[int, int]]:
+    """``(read_rows, size)`` for ``_analyze``: strip by strip where the format allows, else from a full decode."""
+    handle = ImageHandle.wrap(image)
+    if handle.data is not None:
+        img = Image.open(MemoryReader(handle.data))
+        reader = _PngRows.open(handle.data, img) or _raw_rows(handle.data, img)
+        if reader is not None:
+            return reader, img.size
+    grey = _grey(handle)
+    return (lambda y0, y1: grey[y0:y1]), (grey.shape[1], grey.shape[0])
+
+class PlacedSharpness(NamedTuple):
+    """Sharpness of one image drawn on a PDF page."""
+    placement: Any  # utils.ppi.Placement
+    report: SharpnessReport
+
+    @property
+    def effective_ppi(self) -> float:
+        """Placement PPI divided by the image's detail scale."""
+        return self.report.effective_ppi(self.placement.min_ppi)
+
+def _pixmap_grey(fitz, doc, xref: int) -> np.ndarray:
+    pix = fitz.Pixmap(doc, xref)
+    if pix.n - pix.alpha != 1 or pix.alpha:
+        pix = fitz.Pixmap(fitz.csGRAY, pix) if pix.n - pix.alpha != 1 else fitz.Pixmap(pix, 0)
+    return np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+@instrument("sharpness.pdf_page")
+def analyze_pdf_page(pdf: Union[bytes, str], pno: int, tile: int = TILE,
+                     workers: Optional[int] = None) -> List[PlacedSharpness]:
+    """
+    Sharpness of every image placed on a PDF page, at its native pixels.
+
+    Rendering the page instead would measure the renderer: PyMuPDF enlarges
+    images without smoothing, and the resulting blocks read as detail. Each
+    image is decoded once however often it is drawn; its effective PPI is
+    the placement PPI over its detail scale.
+
+    Args:
+        pdf: PDF as bytes or a path
+        pno: Zero-based page number
+        tile: Tile edge in pixels
+        workers: Analysis threads
+
+    Returns:
+        One PlacedSharpness per draw whose image could be resolved
+    """
+    from utils.ppi import PdfImageIndex, _fitz, _open_pdf
+
+    fitz = _fitz()
+    doc = _open_pdf(pdf)
+    try:
+        reports: Dict[int, SharpnessReport] = {}
+        out = []
+        for placement in PdfImageIndex(doc).placements(doc[pno]):
+            if not placement.xref:
+                continue  # inline image: no xref to decode it from
+            if placement.xref not in reports:
+                grey = _pixmap_grey(fitz, doc, placement.xref)
+                reports[placement.xref] = _analyze(lambda y0, y1: grey[y0:y1], (grey.shape[1], grey.shape[0]),
+                                                   tile, workers)
+            out.append(PlacedSharpness(placement, reports[placement.xref]))
+        return out
+    finally:
+        doc.close()
+
+def _tile_colours(rel: np.ndarray) -> np.ndarray:
+    """RGB per tile for ``rel`` = effective / required resolution (1 or more is enough)."""
+    t = np.clip((rel - 0.5) / 0.5, 0.0, 1.0)[..., None]  # 0 at half the resolution, 1 at full
+    red, yellow, green = (np.array(c, dtype=np.float32) for c in (_RED, _YELLOW, _GREEN))
+    lower = red + (yellow - red) * np.minimum(t * 2, 1.0)
+    return np.where(t < 0.5, lower, yellow + (green - yellow) * (t * 2 - 1.0)).astype(np.uint8)
+
+def render_heatmap(report: SharpnessReport, background: Union[Image.Image, ImageHandle, bytes],
+                   ppi: Optional[float] = None, min_ppi: float = 300.0, width: int = 800,
+                   alpha: float = 0.45) -> Image.Image:
+    """
+    Tint a preview of the analysed image by how much detail each tile holds.
+
+    Green tiles hold enough detail, yellow about three quarters, red half or
+    less; flat tiles are left untinted. With ``ppi`` the scale is effective
+    PPI against ``min_ppi``, otherwise detail against a sharp original.
+
+    Args:
+        report: Result of ``analyze_image``
+        background: The analysed image or any smaller preview of it
+        ppi: Nominal print resolution of the analysed raster
+        min_ppi: Required print resolution
+        width: Preview width in pixels
+        alpha: Tint opacity
+
+    Returns:
+        RGB preview image
+    """
+    height = max(1, round(width * report.size[1] / report.size[0]))
+    preview = _preview(_decode(background, "RGB", (width, height)), (width, height)).convert("RGBA")
+    preview.alpha_composite(_overlay(report, ppi / min_ppi if ppi else 1.0, (width, height), alpha))
+    return preview.convert("RGB")
+
+def render_page_heatmap(placed: List[PlacedSharpness], background: Image.Image, page_size: Tuple[float, float],
+                        min_ppi: float = 300.0, width: int = 800, alpha: float = 0.45) -> Image.Image:
+    """
+    Tint each image drawn on a page preview by its effective PPI, tile by tile.
+
+    Args:
+        placed: Result of ``analyze_pdf_page``
+        background: Page render at any resolution
+        page_size: Page (width, height) in points, which the placement bboxes use
+        min_ppi: Required print resolution
+        width: Preview width in pixels
+        alpha: Tint opacity
+
+    Returns:
+        RGB preview image
+    """
+    zoom = width / page_size[0]
+    preview = _preview(background, (width, max(1, round(page_size[1] * zoom)))).convert("RGBA")
+    for p in placed:
+        x0, y0, x1, y1 = (round(v * zoom) for v in p.placement.bbox)
+        if x1 > x0 and y1 > y0:
+            # axis-aligned approximation: rotated or flipped draws are tinted over their bbox
+            overlay = _overlay(p.report, p.placement.min_ppi / min_ppi, (x1 - x0, y1 - y0), alpha)
+            # draws bleeding off the page are clipped to it
+            preview.alpha_composite(overlay, (max(0, x0), max(0, y0)), (max(0, -x0), max(0, -y0)))
+    return preview.convert("RGB")
+
+def _preview(bg: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    # reduce() first: resampling a huge raster straight to a thumbnail is slow
+    factor = max(1, min(bg.width // size[0], bg.height // size[1]))
+    return (bg.reduce(factor) if factor > 1 else bg).convert("RGB").resize(size, Image.BILINEAR)
+
+def _overlay(report: SharpnessReport, nominal: float, size: Tuple[int, int], alpha: float) -> Image.Image:
+    """RGBA tile tint at ``size``; ``nominal`` is the nominal / required resolution ratio."""
+    scale = report.detail_scale
+    rel = nominal / np.where(np.isfinite(scale), scale, 1.0)
+    rgba = np.dstack([_tile_colours(rel), np.where(np.isfinite(scale), round(255 * alpha), 0)]).astype(np.uint8)
+    # tile under each output pixel; edge tiles may be partial, and an image smaller than a tile is one tile
+    xs = np.minimum(np.arange(size[0]) * report.size[0] // (size[0] * report.tile), scale.shape[1] - 1)
+    ys = np.minimum(np.arange(size[1]) * report.size[1] // (size[1] * report.tile), scale.shape[0] - 1)
+    return Image.fromarray(np.ascontiguousarray(rgba[ys[:, None], xs]), "RGBA")